@@ -0,0 +1,69 @@
+'''Headless simulation core of the Evolution Simulator.
+
+The Streamlit pages only handle input and visualization, the models below can
+be imported and run without a Streamlit server, see ``python -m evosim --help``.
+
+The names below are imported from their submodule on first use, so importing
+a light submodule such as evosim.cache or evosim.app does not load the whole
+simulation core.
+'''
+
+import importlib
+
+_EXPORTS = {
+    "evosim.cache": [
+        "MAX_RANDOM_SEED", "TrajectoryCache", "new_random_seed", "trajectory_key",
+    ],
+    "evosim.frames": [
+        "MAX_FRAMES", "MAX_POINTS", "allele_colors", "decimate", "downsample", "frame_step",
+        "stratified_counts",
+    ],
+    "evosim.genetic_drift": [
+        "QUANTILES", "GeneticDriftEnsemble", "GeneticDriftEnsembleGeneration",
+        "GeneticDriftGeneration", "GeneticDriftSim", "drift_step", "parent_colors",
+    ],
+    "evosim.instrumentation": [
+        "PhaseTimer",
+    ],
+    "evosim.islands": [
+        "TOPOLOGIES", "IslandGeneration", "IslandNaturalSelectionSim", "migration_routes",
+    ],
+    "evosim.long_genome": [
+        "LongGenomeGeneration", "LongGenomeSim", "code_from_text", "pack_digits",
+        "random_code", "random_codes", "unpack_digits",
+    ],
+    "evosim.markov": [
+        "EXACT_MAX_DIGITS", "ExpectedGeneration", "ExpectedNaturalSelection",
+        "expected_time_to_target", "mutation_kernel",
+    ],
+    "evosim.natural_selection": [
+        "ClonalNaturalSelectionSim", "NaturalSelectionGeneration", "NaturalSelectionSim",
+        "calculate_score", "generate_offspring", "genomes_from_codes", "genomes_to_codes",
+        "mutate_genomes", "select_best", "select_best_counts", "unique_genomes",
+        "SELECTION_STRATEGIES", "elitism_selection", "fitness_proportional_selection",
+        "select_parents", "tournament_selection", "truncation_selection",
+    ],
+    "evosim.parallel": [
+        "ParallelNaturalSelectionSim",
+    ],
+    "evosim.recording": [
+        "RECORDING_LEVELS", "DiskRecorder", "RecentRecorder", "Recorder", "make_recorder",
+        "read_records",
+    ],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(name):
+    '''Importing an exported name from its submodule on first use.'''
+    if name not in _MODULES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(_MODULES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
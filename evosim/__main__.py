@@ -0,0 +1,3 @@
+from evosim.cli import main
+
+main()
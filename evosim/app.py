@@ -0,0 +1,93 @@
+'''Streamlit plumbing shared by the landing page and the simulation pages.
+
+Imports only Streamlit and the light parts of evosim, so every page starts
+without the plotting stack. The renderers, evosim.render (matplotlib) and
+evosim.charts (altair and pandas), are imported by the pages only where a
+simulation is drawn. ``python -m evosim.benchmark --startup-runs 3`` measures
+the import cost of every page.
+'''
+
+import streamlit as st
+
+from evosim.cache import TrajectoryCache, new_random_seed
+
+PAGE_ICON = ':earth_americas:'
+
+FOOTER = """
+<style>
+
+footer{
+    visibility:visible;
+}
+footer:after{
+    content: 'Efrat Herbst, Dr. Ofer Mokady and Prof. Zohar Yakhini';
+    display:block;
+    position:relative;
+    color:grey;
+    # padding:5px;
+    top:3px;
+}
+
+</style>
+"""
+
+RENDER_MODES = ["Streaming", "Animation player", "Vector player"]
+HELP_RENDER_MODE = "Streaming shows every generation as soon as it is computed. \
+    Animation player computes the whole simulation first and allows scrolling through the frames. \
+    Vector player does the same, but sends only the data of every frame and draws it in the browser, \
+    which is much lighter for long simulations."
+
+
+def page_setup(page_title):
+    '''Setting the page title and icon and adding the footer.
+
+    Args:
+        page_title: title of the browser tab.
+    '''
+    st.set_page_config(page_title=page_title, page_icon=PAGE_ICON)
+    st.markdown(FOOTER, unsafe_allow_html=True)
+
+
+@st.cache_resource
+def trajectory_cache():
+    '''Cache of computed trajectories, shared by all sessions and pages.'''
+    return TrajectoryCache()
+
+
+@st.cache_resource
+def checkpoint_cache():
+    '''Checkpoints of computed trajectories, shared by all sessions and pages.'''
+    return TrajectoryCache(max_bytes=64 * 2**20)
+
+
+def keep_checkpoints(key, previous, checkpoints):
+    '''Caching the checkpoints of a finished run.
+
+    Args:
+        key: trajectory key of the run.
+        previous: Checkpoints of the run it continues, None for a new run.
+        checkpoints: Checkpoints of the run.
+    '''
+    if previous is not None:
+        checkpoints = previous.merge(checkpoints)
+    checkpoint_cache().put(key, checkpoints, checkpoints.nbytes)
+
+
+def continue_run(base_key, key):
+    '''Continuing the shown run for "More generations", instead of the run of the parameters.'''
+    st.session_state.continued[base_key] = key + ("continue", st.session_state.more_generations)
+
+
+def draw_new_random_seed():
+    '''Drawing a new random seed, so Re-run generates a different simulation.'''
+    st.session_state.random_seed = new_random_seed()
+
+
+def keep_recorder(recorder):
+    '''Keeping the recorder of the last run of the session.
+
+    The temporary file of the "full" recording level is deleted with its
+    recorder, so it lives until the next run of the session or the end of
+    the session.
+    '''
+    st.session_state.recorder = recorder
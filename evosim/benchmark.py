@@ -0,0 +1,468 @@
+'''Benchmarks of the simulation core and of the frame rendering path.
+
+Every scenario runs with a fixed random seed and reports generations (or
+frames) per second, time per phase and peak traced memory as JSON. The
+startup benchmarks report the import time of every page of the app and which
+heavy modules it loads. The scaling benchmarks run a single population of a
+million parents on 1 to N worker processes, and the selection benchmarks
+run every selection strategy on a million offsprings. Runs can be compared with
+``--compare``:
+
+    python -m evosim.benchmark --output before.json
+    python -m evosim.benchmark --compare before.json
+'''
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from evosim.instrumentation import PhaseTimer
+from evosim.natural_selection import SELECTION_STRATEGIES, select_parents
+from evosim.parallel import CHUNKS, ParallelNaturalSelectionSim
+from evosim.sweep import SIMULATIONS
+
+SCENARIOS = {
+    "natural-selection": {
+        "small": {"seed": "555555", "target": "999999", "number_of_parents": 50},
+        "default": {"seed": "555555", "target": "999999", "number_of_parents": 200,
+                    "average_number_of_offsprings": 1.2},
+        "max": {"seed": "0" * 20, "target": "9" * 20, "number_of_parents": 1000,
+                "average_number_of_offsprings": 2.0, "mutation_rate_offspring": 1.0,
+                "mutation_rate_digit": 1.0},
+    },
+    "natural-selection-clones": {
+        "small": {"seed": "555555", "target": "999999", "number_of_parents": 50},
+        "default": {"seed": "555555", "target": "999999", "number_of_parents": 200,
+                    "average_number_of_offsprings": 1.2},
+        "max": {"seed": "0" * 20, "target": "9" * 20, "number_of_parents": 100000,
+                "average_number_of_offsprings": 2.0},
+    },
+    "genetic-drift": {
+        "small": {"number_of_parents": 10, "number_of_offsprings": 5},
+        "default": {"number_of_parents": 100, "number_of_offsprings": 5},
+        "max": {"number_of_parents": 1000, "number_of_offsprings": 1000},
+    },
+}
+
+SCALING_SCENARIO = {"seed": "0" * 20, "target": "9" * 20, "number_of_parents": 1000000,
+                    "average_number_of_offsprings": 2.0}
+
+# distances of 20 digit offsprings, about a third of the way to the target
+SELECTION_SCENARIO = {"digits": 20, "distance": 0.3, "parents_per_offspring": 0.5}
+
+PAGES = ["main.py", "pages/0_Natural_Selection.py", "pages/1_Genetic_Drift.py",
+         "pages/2_Parameter_Sweep.py"]
+HEAVY_MODULES = ["matplotlib", "pandas", "altair", "pyarrow"]
+
+# the Streamlit server has imported streamlit before any page runs
+STARTUP_SCRIPT = """
+import ast, json, sys, time
+import streamlit
+
+path, heavy = sys.argv[1], sys.argv[2:]
+with open(path) as file:
+    tree = ast.parse(file.read(), path)
+imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+start = time.perf_counter()
+exec(compile(ast.Module(imports, []), path, "exec"), {"__name__": "page"})
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": [name for name in heavy if name in sys.modules]}))
+"""
+
+
+def simulate(model, parameters, generations, random_seed, timer=None):
+    '''Running generations of a scenario, restarting the simulation when it ends.
+
+    Args:
+        model: one of SIMULATIONS.
+        parameters: keyword arguments of the simulation class.
+        generations: total amount of generations to run.
+        random_seed: seed of the first simulation, incremented on every restart.
+        timer: PhaseTimer shared by all the simulations.
+
+    Yields:
+        record: every generation record.
+    '''
+    remaining = generations
+    while remaining > 0:
+        sim = SIMULATIONS[model](random_seed=random_seed, timer=timer, **parameters)
+        for record in sim.run(remaining):
+            yield record
+        if sim.generation == 0:
+            return
+        remaining -= sim.generation
+        random_seed += 1
+
+
+def peak_memory(function):
+    '''Measuring the peak memory traced while calling a function.
+
+    Args:
+        function: callable without arguments.
+
+    Returns:
+        peak: peak traced memory in bytes.
+    '''
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_core(model, scenario, generations, random_seed=0):
+    '''Benchmarking the simulation core of a scenario, without rendering.
+
+    Args:
+        model: one of SCENARIOS.
+        scenario: scenario name, such as "default".
+        generations: amount of generations to run.
+        random_seed: fixed random seed of the scenario.
+
+    Returns:
+        result: dict with the throughput, phase timings and peak memory.
+    '''
+    parameters = SCENARIOS[model][scenario]
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    count = sum(1 for _ in simulate(model, parameters, generations, random_seed, timer))
+    seconds = time.perf_counter() - start
+    memory_generations = min(generations, 20)
+    peak = peak_memory(lambda: sum(1 for _ in simulate(
+        model, parameters, memory_generations, random_seed)))
+    return {
+        "name": "core/%s/%s" % (model, scenario),
+        "parameters": parameters,
+        "generations": count,
+        "seconds": seconds,
+        "generations_per_second": count / seconds if seconds else None,
+        "phases": timer.as_dict(),
+        "peak_memory_bytes": peak,
+    }
+
+
+def build_figure(model, parameters, first, random_seed):
+    '''Building the page figure of a scenario.
+
+    Args:
+        model: one of SCENARIOS.
+        parameters: scenario parameters.
+        first: first generation record of the scenario.
+        random_seed: seed of the layout random generator.
+
+    Returns:
+        fig: matplotlib figure.
+        update: callback drawing a generation record on fig.
+    '''
+    from evosim.render import genetic_drift_figure, natural_selection_figure
+    from evosim.natural_selection import calculate_score
+
+    layout_rng = np.random.default_rng(random_seed)
+    if model.startswith("natural-selection"):
+        initial_score = int(calculate_score([parameters["seed"]], parameters["target"])[0])
+        return natural_selection_figure(first, initial_score, parameters["target"], layout_rng)
+    red_parents = parameters.get("red_parents", parameters["number_of_parents"] // 2)
+    return genetic_drift_figure(
+        red_parents, parameters["number_of_parents"], parameters["number_of_offsprings"], layout_rng)
+
+
+def render_frames(model, parameters, records, random_seed, timer):
+    '''Drawing and rasterizing frames the way the streaming page mode does.
+
+    Args:
+        model: one of SCENARIOS.
+        parameters: scenario parameters.
+        records: list of generation records, the first one builds the figure.
+        random_seed: seed of the layout random generator.
+        timer: PhaseTimer measuring the "draw" and "rasterize" phases.
+    '''
+    import matplotlib.pyplot as plt
+
+    fig, update = build_figure(model, parameters, records[0], random_seed)
+    try:
+        for record in records[1:]:
+            with timer.phase("draw"):
+                update(record)
+            with timer.phase("rasterize"):
+                fig.savefig(io.BytesIO(), format="png")
+    finally:
+        plt.close(fig)
+
+
+def benchmark_render(model, scenario, frames, random_seed=0):
+    '''Benchmarking the frame rendering path of a scenario.
+
+    The generations are computed up front, so only rendering is timed: the
+    streaming mode (draw and rasterize every frame) and the animation player
+    (to_jshtml of all frames).
+
+    Args:
+        model: one of SCENARIOS.
+        scenario: scenario name, such as "default".
+        frames: amount of frames to render.
+        random_seed: fixed random seed of the scenario.
+
+    Returns:
+        result: dict with the throughput, phase timings and peak memory.
+    '''
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from evosim.render import animation_html
+
+    parameters = SCENARIOS[model][scenario]
+    records = list(simulate(model, parameters, frames + 1, random_seed))
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    render_frames(model, parameters, records, random_seed, timer)
+    seconds = time.perf_counter() - start
+
+    fig, update = build_figure(model, parameters, records[0], random_seed)
+    with timer.phase("animation_html"):
+        html = animation_html(fig, update, records[1:])
+    plt.close(fig)
+    peak = peak_memory(lambda: render_frames(model, parameters, records[:2], random_seed, PhaseTimer()))
+    return {
+        "name": "render/%s/%s" % (model, scenario),
+        "parameters": parameters,
+        "frames": len(records) - 1,
+        "seconds": seconds,
+        "frames_per_second": (len(records) - 1) / seconds if seconds else None,
+        "phases": timer.as_dict(),
+        "animation_html_bytes": len(html),
+        "peak_memory_bytes": peak,
+    }
+
+
+def benchmark_scaling(workers, generations, chunks=CHUNKS, random_seed=0):
+    '''Benchmarking a single large population on an amount of worker processes.
+
+    Args:
+        workers: amount of worker processes of ParallelNaturalSelectionSim.
+        generations: amount of generations to run.
+        chunks: amount of chunks, the same for every amount of workers so
+            the runs compute the same generations.
+        random_seed: fixed random seed of the scenario.
+
+    Returns:
+        result: dict with the throughput, phase timings and the last best
+            distance, equal for every amount of workers.
+    '''
+    timer = PhaseTimer()
+    sim = ParallelNaturalSelectionSim(
+        random_seed=random_seed, chunks=chunks, workers=workers, timer=timer, **SCALING_SCENARIO)
+    # the first generation starts the worker processes
+    run = sim.run(generations + 1)
+    next(run)
+    start = time.perf_counter()
+    count = sum(1 for _ in run)
+    seconds = time.perf_counter() - start
+    return {
+        "name": "scaling/natural-selection/workers=%d" % workers,
+        "parameters": dict(SCALING_SCENARIO, chunks=chunks),
+        "workers": workers,
+        "generations": count,
+        "seconds": seconds,
+        "generations_per_second": count / seconds if seconds else None,
+        "phases": timer.as_dict(),
+        "best_score": sim.best_score,
+    }
+
+
+def scaling_efficiency(results):
+    '''Adding the speedup and parallel efficiency to scaling benchmark results.
+
+    Both are relative to the result with the fewest workers: the efficiency
+    is the speedup divided by the factor of workers, 1 for perfect scaling.
+
+    Args:
+        results: results of benchmark_scaling().
+    '''
+    base = min(results, key=lambda result: result["workers"])
+    for result in results:
+        result["speedup"] = result["generations_per_second"] / base["generations_per_second"]
+        result["efficiency"] = result["speedup"] * base["workers"] / result["workers"]
+
+
+def benchmark_selection(selection, offsprings, runs, clones=False, random_seed=0):
+    '''Benchmarking a selection strategy on random distances.
+
+    Args:
+        selection: one of SELECTION_STRATEGIES.
+        offsprings: amount of offsprings to select from.
+        runs: amount of selections, the median time is reported.
+        clones: store the offsprings as genotypes with counts, ten
+            offsprings per genotype on average, like ClonalNaturalSelectionSim.
+        random_seed: fixed random seed of the scores and of the selections.
+
+    Returns:
+        result: dict with the median time and offsprings per second.
+    '''
+    rng = np.random.default_rng(random_seed)
+    genotypes = offsprings // 10 if clones else offsprings
+    scores = rng.binomial(9 * SELECTION_SCENARIO["digits"], SELECTION_SCENARIO["distance"], genotypes)
+    counts = rng.multinomial(offsprings, np.full(genotypes, 1 / genotypes)) if clones else None
+    number_of_parents = int(offsprings * SELECTION_SCENARIO["parents_per_offspring"])
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        select_parents(selection, scores, counts, number_of_parents, rng)
+        timings.append(time.perf_counter() - start)
+    seconds = statistics.median(timings)
+    return {
+        "name": "selection/%s%s" % (selection, "/clones" if clones else ""),
+        "parameters": dict(SELECTION_SCENARIO, offsprings=offsprings, genotypes=genotypes),
+        "runs": runs,
+        "seconds": seconds,
+        "offsprings_per_second": offsprings / seconds if seconds else None,
+    }
+
+
+def benchmark_startup(page, runs):
+    '''Benchmarking the import time of a page of the app.
+
+    Only the top level imports of the page are run, each time in a fresh
+    interpreter, as on the first visit of the page after a cold start.
+
+    Args:
+        page: path of the page script, relative to the repository root.
+        runs: amount of fresh interpreters, the median time is reported.
+
+    Returns:
+        result: dict with the import time and the heavy modules loaded.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    measurements = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, page] + HEAVY_MODULES,
+            cwd=root, capture_output=True, text=True, check=True)
+        measurements.append(json.loads(process.stdout.splitlines()[-1]))
+    return {
+        "name": "startup/%s" % os.path.basename(page),
+        "runs": runs,
+        "import_seconds": statistics.median(measurement["seconds"] for measurement in measurements),
+        "heavy_modules": measurements[-1]["modules"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    '''Comparing throughputs and import times with a previous benchmark run.
+
+    Args:
+        results: benchmark results of this run.
+        baseline: benchmark results of the previous run.
+        tolerance: allowed relative slowdown, such as 0.2 for 20%.
+
+    Returns:
+        regressions: names of the benchmarks slower than the tolerance allows.
+    '''
+    previous = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        key = "generations_per_second" if "generations_per_second" in result else "frames_per_second"
+        if "offsprings_per_second" in result:
+            key = "offsprings_per_second"
+        if "import_seconds" in result:
+            key = "import_seconds"
+        if old is None or not old.get(key) or not result.get(key):
+            continue
+        # the ratio is a speedup, import times are better when lower
+        ratio = old[key] / result[key] if key == "import_seconds" else result[key] / old[key]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+        print("%-40s %12.4g -> %12.4g %s  (x%.2f)%s" % (
+            result["name"], old[key], result[key], key, ratio, flag), file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    '''Running the benchmarks and writing the results as JSON.
+
+    Args:
+        argv: command line arguments, sys.argv by default.
+    '''
+    parser = argparse.ArgumentParser(
+        prog="python -m evosim.benchmark", description="Benchmark the evolution simulations.")
+    parser.add_argument("--models", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--scenarios", nargs="+", choices=["small", "default", "max"],
+                        default=["small", "default", "max"])
+    parser.add_argument("--generations", type=int, default=500,
+                        help="generations per core benchmark")
+    parser.add_argument("--frames", type=int, default=5,
+                        help="frames per rendering benchmark, 0 to skip rendering")
+    parser.add_argument("--startup-runs", type=int, default=3,
+                        help="fresh interpreters per page import benchmark, 0 to skip them")
+    parser.add_argument("--scaling-workers", nargs="*", type=int, default=[],
+                        help="amounts of worker processes of the scaling benchmark, such as 1 2 4 8")
+    parser.add_argument("--scaling-generations", type=int, default=10,
+                        help="generations per scaling benchmark")
+    parser.add_argument("--selection-offsprings", type=int, default=10 ** 6,
+                        help="offsprings per selection benchmark, 0 to skip them")
+    parser.add_argument("--selection-runs", type=int, default=5,
+                        help="selections per selection benchmark")
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the JSON results to this path")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown before --compare fails")
+    args = parser.parse_args(argv)
+
+    results = []
+    for model in args.models:
+        for scenario in args.scenarios:
+            results.append(benchmark_core(model, scenario, args.generations, args.random_seed))
+            if args.frames > 0:
+                results.append(benchmark_render(model, scenario, args.frames, args.random_seed))
+    if args.startup_runs > 0:
+        for page in PAGES:
+            results.append(benchmark_startup(page, args.startup_runs))
+    if args.scaling_workers:
+        scaling = [benchmark_scaling(workers, args.scaling_generations, random_seed=args.random_seed)
+                   for workers in args.scaling_workers]
+        scaling_efficiency(scaling)
+        results += scaling
+    if args.selection_offsprings > 0:
+        for clones in (False, True):
+            for selection in SELECTION_STRATEGIES:
+                results.append(benchmark_selection(
+                    selection, args.selection_offsprings, args.selection_runs, clones, args.random_seed))
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "benchmarks": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["benchmarks"]
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+'''Random seeds and a bounded cache of computed simulation trajectories.'''
+
+from collections import OrderedDict
+import secrets
+import threading
+
+MAX_RANDOM_SEED = 2**32 - 1
+
+
+def new_random_seed():
+    '''Drawing a fresh random seed for a new simulation.
+
+    Returns:
+        random_seed: int between 0 and MAX_RANDOM_SEED.
+    '''
+    return secrets.randbelow(MAX_RANDOM_SEED + 1)
+
+
+def trajectory_key(sim, *extra):
+    '''Building the cache key of a simulation run.
+
+    Args:
+        sim: NaturalSelectionSim or GeneticDriftSim, with an explicit random seed.
+        extra: any other values changing the run, such as the maximum generations.
+
+    Returns:
+        key: hashable tuple of the simulation type, parameters and extra values.
+    '''
+    return (type(sim).__name__, tuple(sorted(sim.parameters.items()))) + extra
+
+
+class TrajectoryCache:
+    '''Least recently used cache of generation records, bounded by memory.
+
+    Safe to share between Streamlit sessions, which run on separate threads.
+
+    Args:
+        max_bytes: approximate memory limit of all cached trajectories.
+        max_entries: maximal amount of cached trajectories.
+    '''
+
+    def __init__(self, max_bytes=256 * 2**20, max_entries=64):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        '''Getting a cached trajectory and marking it as recently used.
+
+        Args:
+            key: trajectory key, see trajectory_key().
+
+        Returns:
+            records: list of generation records, None if not cached.
+        '''
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, records, nbytes):
+        '''Caching a trajectory, evicting the least recently used ones if needed.
+
+        Args:
+            key: trajectory key, see trajectory_key().
+            records: list of generation records.
+            nbytes: approximate memory held by the records.
+        '''
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (records, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+    def trajectory(self, key, records, replay=True):
+        '''Replaying a cached trajectory, or recording a new one while it runs.
+
+        A new trajectory is only cached once it was fully consumed, and is
+        dropped as soon as it grows beyond max_bytes.
+
+        Args:
+            key: trajectory key, see trajectory_key().
+            records: lazy iterable computing the generation records.
+            replay: whether to replay a cached trajectory, False to compute it
+                again, such as when measuring the simulation.
+
+        Yields:
+            record: every generation record, in order.
+        '''
+        cached = self.get(key) if replay else None
+        if cached is not None:
+            yield from cached
+            return
+        recorded = []
+        nbytes = 0
+        for record in records:
+            if recorded is not None:
+                nbytes += record.nbytes
+                if nbytes > self.max_bytes:
+                    recorded = None
+                else:
+                    recorded.append(record)
+            yield record
+        if recorded is not None:
+            self.put(key, recorded, nbytes)
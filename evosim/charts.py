@@ -0,0 +1,101 @@
+'''Charts of simulation statistics for the Streamlit pages, drawn by the browser.
+
+Not imported by ``evosim`` itself, see evosim.render.
+'''
+
+from contextlib import nullcontext
+import time
+
+import altair as alt
+import pandas as pd
+
+CHART_INTERVAL = 0.25
+
+
+def genetic_drift_ensemble_charts(summaries, number_of_generations):
+    '''Charts of an ensemble of genetic drift populations.
+
+    Args:
+        summaries: summaries of the GeneticDriftEnsembleGeneration records
+            computed so far.
+        number_of_generations: maximal amount of generations, the width of
+            both charts.
+
+    Returns:
+        fan: altair chart of the quantiles of the red allele frequency.
+        histogram: altair chart of the amount of replicates fixed on every
+            allele over time.
+    '''
+    # dataframes are sent to the browser as Arrow, without validating every value
+    data = pd.DataFrame(summaries)
+    generation = alt.X("generation:Q", title="Generation", scale=alt.Scale(domain=[0, number_of_generations]))
+    frequency = alt.Scale(domain=[0, 1])
+    band = alt.Chart(data).mark_area(color="red")
+    fan = alt.layer(
+        band.encode(generation, alt.Y("q05:Q", title="Red frequency", scale=frequency), alt.Y2("q95:Q"),
+                    opacity=alt.value(0.2)),
+        band.encode(generation, alt.Y("q25:Q", scale=frequency), alt.Y2("q75:Q"), opacity=alt.value(0.4)),
+        alt.Chart(data).mark_line(color="red").encode(generation, alt.Y("q50:Q", scale=frequency)),
+    ).properties(title="Median, 25-75% and 5-95% of the replicates")
+    histogram = alt.Chart(data).transform_fold(
+        ["red_fixations", "blue_fixations"], as_=["allele", "replicates"]
+    ).mark_bar().encode(
+        alt.X("generation:Q", title="Fixation generation", bin=alt.Bin(maxbins=50, extent=[0, number_of_generations])),
+        alt.Y("sum(replicates):Q", title="Replicates", stack=True),
+        alt.Color("allele:N", title="Fixed on", scale=alt.Scale(
+            domain=["red_fixations", "blue_fixations"], range=["red", "blue"]),
+            legend=alt.Legend(labelExpr="split(datum.label, '_')[0]")),
+    ).properties(title="Fixation times")
+    return fan, histogram
+
+
+def island_charts(summaries, islands, number_of_generations):
+    '''Chart of the best distance of every island of an island model.
+
+    Args:
+        summaries: summaries of the IslandGeneration records computed so far.
+        islands: amount of islands.
+        number_of_generations: maximal amount of generations, the width of
+            the chart.
+
+    Returns:
+        charts: tuple of the altair chart.
+    '''
+    data = pd.DataFrame(summaries)
+    columns = ["best_score_%d" % island for island in range(islands)]
+    chart = alt.Chart(data).transform_fold(columns, as_=["island", "best_score"]).mark_line().encode(
+        alt.X("generation:Q", title="Generation", scale=alt.Scale(domain=[0, number_of_generations])),
+        alt.Y("best_score:Q", title="Best distance"),
+        alt.Color("island:N", title="Island", sort=columns,
+                  legend=alt.Legend(labelExpr="replace(datum.label, 'best_score_', '')")),
+    ).properties(title="Best distance on every island")
+    return (chart,)
+
+
+def stream_charts(records, summaries, charts, placeholders, interval=CHART_INTERVAL, timer=None):
+    '''Drawing charts of the summaries while the generations are computed.
+
+    The charts are drawn again at most every interval seconds, so the
+    simulation is not slowed down by the browser.
+
+    Args:
+        records: iterable of the generation records, consumed lazily.
+        summaries: list the summaries of the records are appended to while
+            records are consumed, such as Recorder.summaries.
+        charts: callable building the altair charts from a list of
+            summaries, such as genetic_drift_ensemble_charts.
+        placeholders: Streamlit placeholders (st.empty()), one per chart.
+        interval: minimal delay between two drawings in seconds.
+        timer: PhaseTimer measuring the "draw" phase, None to skip.
+    '''
+    def draw():
+        with timer.phase("draw", per_generation=False) if timer is not None else nullcontext():
+            for placeholder, chart in zip(placeholders, charts(list(summaries)), strict=True):
+                placeholder.altair_chart(chart)
+
+    drawn = time.perf_counter()
+    for _ in records:
+        if time.perf_counter() - drawn >= interval:
+            draw()
+            drawn = time.perf_counter()
+    draw()
@@ -0,0 +1,183 @@
+'''Checkpoints of simulation state, for seeking to any generation and resuming runs.
+
+A checkpoint holds what a simulation needs to go on after a generation: the
+population (parents, or allele counts for drift), the generation counters and
+the state of the random number generator, see the state() method of the
+simulations. Restoring a checkpoint and stepping forward computes exactly the
+generations of the original run, so seeking to a generation only computes the
+generations since the nearest checkpoint, and continuing a run which stopped
+only computes the new generations.
+'''
+
+import bisect
+
+import numpy as np
+
+MAX_CHECKPOINTS = 20
+MIN_CHECKPOINT_EVERY = 10
+
+
+def checkpoint_interval(max_generations, max_checkpoints=MAX_CHECKPOINTS,
+                        min_every=MIN_CHECKPOINT_EVERY):
+    '''Amount of generations between two checkpoints of a run.
+
+    Args:
+        max_generations: maximal amount of generations of the run.
+        max_checkpoints: maximal amount of checkpoints of a full run.
+        min_every: minimal amount of generations between two checkpoints.
+
+    Returns:
+        every: amount of generations between two checkpoints.
+    '''
+    return max(min_every, -(-max_generations // max_checkpoints))
+
+
+class Checkpoint:
+    '''Snapshot of a simulation after a generation.
+
+    Args:
+        generation: number of the last generation before the snapshot, None
+            for the initial state.
+        state: dict returned by the state() method of the simulation.
+    '''
+
+    def __init__(self, generation, state):
+        self.generation = generation
+        self.state = state
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the snapshot.'''
+        return 1024 + sum(value.nbytes for value in self.state.values() if isinstance(value, np.ndarray))
+
+    def restore(self, simulation, parameters, timer=None):
+        '''Building a simulation continuing from this snapshot.
+
+        Args:
+            simulation: simulation class of the snapshot.
+            parameters: keyword arguments of the simulation class, the same
+                as for the original run.
+            timer: PhaseTimer of the restored simulation.
+
+        Returns:
+            sim: the restored simulation.
+        '''
+        sim = simulation(timer=timer, **parameters)
+        sim.restore(self.state)
+        return sim
+
+    def seek(self, simulation, parameters, generation, timer=None):
+        '''Computing a generation which comes after this snapshot.
+
+        Args:
+            simulation: simulation class of the snapshot.
+            parameters: keyword arguments of the simulation class.
+            generation: number of the generation.
+            timer: PhaseTimer of the restored simulation.
+
+        Returns:
+            record: generation record, None if the run was done before it.
+        '''
+        sim = self.restore(simulation, parameters, timer)
+        while not sim.done:
+            record = sim.step()
+            if record.generation >= generation:
+                return record if record.generation == generation else None
+        return None
+
+
+class Checkpoints:
+    '''Checkpoints of a simulation run, ordered by generation.
+
+    Args:
+        every: amount of generations between two checkpoints, see
+            checkpoint_interval().
+    '''
+
+    def __init__(self, every):
+        self.every = every
+        self.checkpoints = []
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the checkpoints.'''
+        return sum(checkpoint.nbytes for checkpoint in self.checkpoints)
+
+    @property
+    def latest(self):
+        '''Checkpoint of the last generation, None if there are none.'''
+        return self.checkpoints[-1] if self.checkpoints else None
+
+    def _position(self, generation):
+        return -1 if generation is None else generation
+
+    def add(self, checkpoint):
+        '''Adding a checkpoint, replacing one of the same generation.
+
+        Args:
+            checkpoint: Checkpoint to add.
+        '''
+        positions = [self._position(known.generation) for known in self.checkpoints]
+        position = self._position(checkpoint.generation)
+        index = bisect.bisect_left(positions, position)
+        if index < len(positions) and positions[index] == position:
+            self.checkpoints[index] = checkpoint
+        else:
+            self.checkpoints.insert(index, checkpoint)
+
+    def record(self, sim, records, done=None):
+        '''Checkpointing a simulation while its generations are being consumed.
+
+        The state is kept before the first generation, every `every`
+        generations and after the last generation.
+
+        Args:
+            sim: the simulation computing the records.
+            records: iterable of generation records of sim, such as sim.run().
+            done: callback called with these checkpoints once all records
+                were consumed, None to skip.
+
+        Yields:
+            record: every generation record, unchanged.
+        '''
+        if sim.generation == 0:
+            self.add(Checkpoint(None, sim.state()))
+        record = None
+        for record in records:
+            if (record.generation + 1) % self.every == 0:
+                self.add(Checkpoint(record.generation, sim.state()))
+            yield record
+        if record is not None:
+            self.add(Checkpoint(record.generation, sim.state()))
+        if done is not None:
+            done(self)
+
+    def nearest(self, generation):
+        '''Latest checkpoint taken before a generation.
+
+        Args:
+            generation: number of the generation.
+
+        Returns:
+            checkpoint: Checkpoint to seek from, None if there is none.
+        '''
+        positions = [self._position(checkpoint.generation) for checkpoint in self.checkpoints]
+        index = bisect.bisect_left(positions, generation) - 1
+        return self.checkpoints[index] if index >= 0 else None
+
+    def merge(self, other):
+        '''Combining the checkpoints of a run and of its continuation.
+
+        Args:
+            other: Checkpoints of the continued run.
+
+        Returns:
+            checkpoints: new Checkpoints with the checkpoints of both.
+        '''
+        merged = Checkpoints(self.every)
+        for checkpoint in self.checkpoints + other.checkpoints:
+            merged.add(checkpoint)
+        return merged
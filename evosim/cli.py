@@ -0,0 +1,377 @@
+'''Command line entry point for running the simulations without Streamlit.
+
+Examples:
+    python -m evosim natural-selection --seed 555555 --target 999999
+    python -m evosim genetic-drift --parents 1000 --offsprings 1000 --generations 5000 --output drift.csv
+    python -m evosim natural-selection --clones --parents 10000 --export run.parquet --export-genomes
+    python -m evosim natural-selection --islands 8 --migration-interval 20 --topology "fully connected"
+    python -m evosim natural-selection --parents 1000000 --workers 8 --chunks 32
+    python -m evosim natural-selection --selection tournament --tournament-size 4
+    python -m evosim sweep genetic-drift --grid number_of_parents=10,100 --grid red_parents=1,5 --replicates 1000
+'''
+
+import argparse
+import csv
+import inspect
+import json
+import sys
+import time
+
+from evosim.cache import new_random_seed
+from evosim.genetic_drift import GeneticDriftSim
+from evosim.islands import TOPOLOGIES, IslandNaturalSelectionSim
+from evosim.long_genome import LongGenomeSim, random_codes
+from evosim.natural_selection import (
+    SELECTION_STRATEGIES,
+    ClonalNaturalSelectionSim,
+    NaturalSelectionSim,
+    genomes_to_codes,
+)
+from evosim.parallel import CHUNKS, ParallelNaturalSelectionSim
+from evosim.recording import DiskRecorder
+from evosim.sweep import SIMULATIONS, parameter_grid, summarize_sweep, sweep
+
+
+def build_parser():
+    '''Building the argument parser of the command line interface.
+
+    Returns:
+        parser: argparse.ArgumentParser with a sub-command per simulation.
+    '''
+    parser = argparse.ArgumentParser(
+        prog="evosim", description="Run the evolution simulations headless.")
+    subparsers = parser.add_subparsers(dest="simulation", required=True)
+
+    selection = subparsers.add_parser(
+        "natural-selection", help="Natural selection from a seed towards a target")
+    selection.add_argument("--seed", default="555555", help="'DNA' code of the original parent")
+    selection.add_argument("--target", default="999999", help="'DNA' code which best fits the environment")
+    selection.add_argument("--offsprings", type=float, default=1.2,
+                           help="number of offsprings on average per parent")
+    selection.add_argument("--parents", type=int, default=200,
+                           help="amount of parents selected for every generation")
+    selection.add_argument("--mutation-rate-offspring", type=float, default=0.05)
+    selection.add_argument("--mutation-rate-digit", type=float, default=0.1)
+    selection.add_argument("--mutation-rate-digit-up", type=float, default=0.5)
+    selection.add_argument("--mutation-rate-digit-up-plus", type=float, default=1.0)
+    selection.add_argument("--mutation-rate-digit-down-minus", type=float, default=1.0)
+    selection.add_argument("--selection", choices=list(SELECTION_STRATEGIES), default="truncation",
+                           help="how the next parents are chosen among the offsprings")
+    selection.add_argument("--tournament-size", type=int, default=2,
+                           help="offsprings competing in every tournament of --selection tournament")
+    selection.add_argument("--elite-fraction", type=float, default=0.1,
+                           help="share of the parents kept as the closest offsprings by --selection elitism")
+    selection.add_argument("--generations", type=int, default=10000,
+                           help="maximum generations, unless the target is reached")
+    selection.add_argument("--plateau", type=int, default=None,
+                           help="stop once the best distance did not improve for this amount of generations")
+    selection.add_argument("--max-seconds", type=float, default=None,
+                           help="stop once computing the generations took this many seconds")
+    selection.add_argument("--clones", action="store_true",
+                           help="store identical individuals once with a count, for large populations")
+    selection.add_argument("--length", type=int, default=None,
+                           help="use a random seed and target of this many digits instead of --seed and --target")
+    selection.add_argument("--seed-file", default=None,
+                           help="read the seed from a text file of digits, for long genomes")
+    selection.add_argument("--target-file", default=None,
+                           help="read the target from a text file of digits, for long genomes")
+    selection.add_argument("--islands", type=int, default=1,
+                           help="split the population into this many islands of --parents each")
+    selection.add_argument("--migration-interval", type=int, default=10,
+                           help="generations between two migrations between the islands")
+    selection.add_argument("--migrants", type=int, default=2,
+                           help="amount of best parents of every island which migrate")
+    selection.add_argument("--topology", choices=TOPOLOGIES, default="ring",
+                           help="where the migrants go: the next island or any other island")
+    selection.add_argument("--workers", type=int, default=None,
+                           help="worker processes advancing the islands, one per island up to all cores by "
+                                "default. Without --islands, generate the offsprings of the population on "
+                                "this many worker processes")
+    selection.add_argument("--chunks", type=int, default=CHUNKS,
+                           help="chunks of parents, each with its own random stream, generated by the "
+                                "--workers of a single population")
+
+    drift = subparsers.add_parser(
+        "genetic-drift", help="Genetic drift of a red and a blue population")
+    drift.add_argument("--parents", type=int, default=100,
+                       help="amount of parents selected randomly in every generation")
+    drift.add_argument("--offsprings", type=int, default=5,
+                       help="amount of offsprings per parent in each generation")
+    drift.add_argument("--red", type=int, default=None,
+                       help="initial amount of red parents, half of the parents by default")
+    drift.add_argument("--generations", type=int, default=500,
+                       help="maximum generations, unless there is a fixation")
+    selection.add_argument("--export-genomes", action="store_true",
+                           help="also export the genome matrix of every generation with --export")
+
+    for subparser in (selection, drift):
+        subparser.add_argument("--output", default=None,
+                               help="write a per generation CSV summary to this path")
+        subparser.add_argument("--record-path", default=None,
+                               help="write every full generation to this path, see evosim.read_records")
+        subparser.add_argument("--export", default=None, metavar="PATH",
+                               help="export every generation to an .arrow or .parquet file, "
+                                    "see evosim.columnar.read_trajectory")
+        subparser.add_argument("--random-seed", type=int, default=None,
+                               help="seed of the random number generator, a new one by default")
+
+    sweep = subparsers.add_parser(
+        "sweep", help="Many replicates of a grid of parameters, on worker processes")
+    sweep.add_argument("model", choices=list(SIMULATIONS), help="simulation to sweep")
+    sweep.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2,...",
+                       help="simulation parameter and the values to sweep, may be repeated")
+    sweep.add_argument("--fixed", action="append", default=[], metavar="NAME=VALUE",
+                       help="simulation parameter shared by all runs, may be repeated")
+    sweep.add_argument("--replicates", type=int, default=100,
+                       help="amount of runs per parameter combination")
+    sweep.add_argument("--generations", type=int, default=5000,
+                       help="maximum generations of every run")
+    sweep.add_argument("--workers", type=int, default=None,
+                       help="amount of worker processes, all cores by default")
+    sweep.add_argument("--output", default=None,
+                       help="write a CSV row per run to this path")
+    sweep.add_argument("--random-seed", type=int, default=None,
+                       help="root seed of all runs, a new one by default")
+    return parser
+
+
+def record_generations(args, records, metadata=None):
+    '''Spilling every full generation to disk when --record-path is given,
+    and exporting them when --export is given.
+
+    Args:
+        args: parsed command line arguments.
+        records: iterable of generation records.
+        metadata: dict stored with the exported generations.
+
+    Returns:
+        records: iterable of the same generation records.
+    '''
+    if args.record_path is not None:
+        records = DiskRecorder(args.record_path).record(records)
+    if args.export is not None:
+        # pyarrow is only imported once a run is exported
+        from evosim.columnar import ColumnarRecorder
+
+        exporter = ColumnarRecorder(
+            args.export, genomes=getattr(args, "export_genomes", False), metadata=metadata)
+        records = exporter.record(records)
+    return records
+
+
+def write_summaries(records, output):
+    '''Writing the summary of every generation as CSV rows.
+
+    Args:
+        records: iterable of generation records.
+        output: open text file, None to only consume the records.
+    '''
+    writer = None
+    for record in records:
+        if output is not None:
+            summary = record.summary()
+            if writer is None:
+                writer = csv.DictWriter(output, fieldnames=list(summary))
+                writer.writeheader()
+            writer.writerow(summary)
+
+
+def run_natural_selection(args, output=None):
+    '''Running a natural selection simulation from parsed arguments.
+
+    Args:
+        args: parsed command line arguments.
+        output: optional text file receiving a CSV row per generation.
+
+    Returns:
+        summary: dict describing the finished run.
+    '''
+    seed, target = args.seed, args.target
+    simulation = ClonalNaturalSelectionSim if args.clones else NaturalSelectionSim
+    options = {}
+    if args.islands > 1:
+        if args.clones or args.length is not None or args.seed_file or args.target_file:
+            raise ValueError("--islands does not support --clones or long genomes")
+        if args.export is not None:
+            raise ValueError("--islands runs cannot be exported, use --output or --record-path")
+        simulation = IslandNaturalSelectionSim
+        options = dict(
+            islands=args.islands,
+            migration_interval=args.migration_interval,
+            migrants=args.migrants,
+            topology=args.topology,
+            workers=args.workers)
+    elif args.workers is not None:
+        if args.clones or args.length is not None or args.seed_file or args.target_file:
+            raise ValueError("--workers does not support --clones or long genomes")
+        simulation = ParallelNaturalSelectionSim
+        options = dict(chunks=args.chunks, workers=args.workers)
+    if args.length is not None:
+        seed, target = random_codes(args.length, args.random_seed)
+        simulation = LongGenomeSim
+    elif args.seed_file or args.target_file:
+        if args.seed_file:
+            with open(args.seed_file, "rb") as file:
+                seed = file.read()
+        if args.target_file:
+            with open(args.target_file, "rb") as file:
+                target = file.read()
+        simulation = LongGenomeSim
+    sim = simulation(
+        seed,
+        target,
+        average_number_of_offsprings=args.offsprings,
+        number_of_parents=args.parents,
+        mutation_rate_offspring=args.mutation_rate_offspring,
+        mutation_rate_digit=args.mutation_rate_digit,
+        mutation_rate_digit_up=args.mutation_rate_digit_up,
+        mutation_rate_digit_up_plus=args.mutation_rate_digit_up_plus,
+        mutation_rate_digit_down_minus=args.mutation_rate_digit_down_minus,
+        random_seed=args.random_seed,
+        selection=args.selection,
+        tournament_size=args.tournament_size,
+        elite_fraction=args.elite_fraction,
+        **options)
+    metadata = {name: value for name, value in sim.parameters.items() if not hasattr(value, "shape")}
+    metadata.update(
+        simulation="natural-selection",
+        initial_score=sim.initial_score,
+        target=sim.target,
+        max_generations=args.generations)
+    run = sim.run(args.generations, args.max_seconds, args.plateau)
+    write_summaries(record_generations(args, run, metadata), output)
+    if isinstance(sim, IslandNaturalSelectionSim):
+        best_offspring = sim.best_offspring
+    elif not len(sim.parents):
+        best_offspring = None
+    elif isinstance(sim, LongGenomeSim):
+        best_offspring = sim.best_code()
+    else:
+        best_offspring = genomes_to_codes(sim.parents[:1])[0]
+    return {
+        "simulation": "natural-selection",
+        "generations": sim.generation,
+        "target_reached": sim.stop_reason == "target reached",
+        "stop_reason": sim.stop_reason,
+        "best_offspring": best_offspring,
+        "best_score": sim.best_score,
+        "random_seed": args.random_seed,
+    }
+
+
+def run_genetic_drift(args, output=None):
+    '''Running a genetic drift simulation from parsed arguments.
+
+    Args:
+        args: parsed command line arguments.
+        output: optional text file receiving a CSV row per generation.
+
+    Returns:
+        summary: dict describing the finished run.
+    '''
+    sim = GeneticDriftSim(args.parents, args.offsprings, args.red, args.random_seed)
+    metadata = dict(sim.parameters, simulation="genetic-drift", max_generations=args.generations)
+    write_summaries(record_generations(args, sim.run(args.generations), metadata), output)
+    fixation = None
+    if sim.done:
+        fixation = "red" if sim.red_parents else "blue"
+    return {
+        "simulation": "genetic-drift",
+        "generations": sim.generation,
+        "fixation": fixation,
+        "red_parents": sim.red_parents,
+        "blue_parents": sim.blue_parents,
+        "random_seed": args.random_seed,
+    }
+
+
+def parse_parameter(model, assignment):
+    '''Parsing a NAME=VALUE[,VALUE...] sweep argument.
+
+    Values are converted to the type of the parameter default of the
+    simulation class, parameters without a default are kept as strings.
+
+    Args:
+        model: one of SIMULATIONS.
+        assignment: the raw argument.
+
+    Returns:
+        name: simulation parameter name.
+        values: list of parsed values.
+    '''
+    name, _, raw_values = assignment.partition("=")
+    parameter = inspect.signature(SIMULATIONS[model]).parameters.get(name)
+    if parameter is None or name == "random_seed" or not raw_values:
+        raise ValueError("invalid %s parameter %r" % (model, assignment))
+    if parameter.default is inspect.Parameter.empty:
+        convert = str
+    elif parameter.default is None:
+        convert = int
+    else:
+        convert = type(parameter.default)
+    return name, [convert(value) for value in raw_values.split(",")]
+
+
+def run_sweep(args, output=None):
+    '''Running a parameter sweep from parsed arguments.
+
+    Args:
+        args: parsed command line arguments.
+        output: optional text file receiving a CSV row per run.
+
+    Returns:
+        summary: dict with the aggregated results of every parameter combination.
+    '''
+    grid = dict(parse_parameter(args.model, assignment) for assignment in args.grid)
+    fixed = {}
+    for assignment in args.fixed:
+        name, values = parse_parameter(args.model, assignment)
+        fixed[name] = values[0]
+    combinations = parameter_grid(grid, fixed)
+    rows = []
+    writer = None
+    for chunk in sweep(args.model, combinations, args.replicates, args.generations,
+                       args.random_seed, args.workers):
+        rows.extend(chunk)
+        if output is not None:
+            if writer is None:
+                writer = csv.DictWriter(output, fieldnames=list(chunk[0]))
+                writer.writeheader()
+            writer.writerows(chunk)
+    import pandas as pd
+
+    results = summarize_sweep(pd.DataFrame(rows), args.model)
+    return {
+        "simulation": "sweep",
+        "model": args.model,
+        "runs": len(rows),
+        "random_seed": args.random_seed,
+        "results": results.astype(object).where(results.notna(), None).to_dict("records"),
+    }
+
+
+def main(argv=None):
+    '''Running the requested simulation and printing a JSON summary.
+
+    Args:
+        argv: command line arguments, sys.argv by default.
+    '''
+    args = build_parser().parse_args(argv)
+    if args.random_seed is None:
+        args.random_seed = new_random_seed()
+    run = {
+        "natural-selection": run_natural_selection,
+        "genetic-drift": run_genetic_drift,
+        "sweep": run_sweep,
+    }[args.simulation]
+    start = time.perf_counter()
+    try:
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                summary = run(args, output)
+        else:
+            summary = run(args)
+    except ValueError as error:
+        sys.exit("evosim: error: %s" % error)
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    print(json.dumps(summary))
@@ -0,0 +1,270 @@
+'''Columnar export of simulation trajectories, and replaying them.
+
+Generations are written in batches while the simulation runs, so memory stays
+flat however long the run is. Arrow IPC files (.arrow) are replayed memory
+mapped, without copying the arrays of a generation. Parquet files (.parquet)
+are smaller and meant for offline analysis, e.g. with pandas or DuckDB.
+Both need pyarrow, which is installed with Streamlit.
+
+Every file holds the summary columns of its simulation, see the summary()
+method of the generation records, plus the scores and counts of every
+natural selection generation and optionally the genome matrix. The metadata
+given when exporting is stored with the schema, see read_metadata(). The
+files of the exported runs are managed by evosim.exports.
+'''
+
+import json
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from evosim.exports import export_format, forget_listing, new_export_path
+from evosim.genetic_drift import GeneticDriftGeneration
+from evosim.long_genome import LongGenomeGeneration
+from evosim.natural_selection import NaturalSelectionGeneration
+from evosim.recording import Recorder
+
+BATCH_GENERATIONS = 256
+BATCH_BYTES = 2**26
+METADATA_KEY = b"evosim"
+
+SUMMARY_TYPES = {
+    "red_frequency": pa.float64(),
+    "best_offspring": pa.string(),
+    "mean_score": pa.float64(),
+    "stop_reason": pa.string(),
+}
+
+
+def record_arrays(record, genomes=False):
+    '''Arrays of a generation record which are exported besides its summary.
+
+    Args:
+        record: generation record, see NaturalSelectionGeneration and
+            GeneticDriftGeneration.
+        genomes: whether to export the genome matrix of every generation.
+
+    Returns:
+        arrays: dict of column name and 1D numpy array, the genome matrix
+            is flattened.
+    '''
+    if isinstance(record, GeneticDriftGeneration):
+        return {}
+    arrays = {"scores": record.scores}
+    if record.counts is not None:
+        arrays["counts"] = record.counts
+    if genomes and record.offspring is not None:
+        arrays["offspring"] = np.ascontiguousarray(record.offspring).reshape(-1)
+    return arrays
+
+
+class ColumnarRecorder(Recorder):
+    '''Recording summaries in memory and every generation to a columnar file.
+
+    Generations are buffered and written as a record batch (a row group of
+    Parquet files) every batch_generations generations, or earlier once the
+    buffered arrays reach batch_bytes. Read them back with read_trajectory().
+
+    Args:
+        path: .arrow or .parquet file to write, a new temporary Arrow file
+            by default.
+        genomes: whether to export the genome matrix of every generation.
+        metadata: JSON serializable dict stored with the file, such as the
+            simulation parameters.
+        batch_generations: maximal amount of generations per batch.
+        batch_bytes: maximal size of the arrays buffered for a batch.
+    '''
+
+    level = "columnar"
+
+    def __init__(self, path=None, genomes=False, metadata=None,
+                 batch_generations=BATCH_GENERATIONS, batch_bytes=BATCH_BYTES):
+        super().__init__()
+        if path is None:
+            path = new_export_path("evosim-", tempfile.gettempdir())
+        self.path = path
+        self.format = export_format(path)
+        self.genomes = genomes
+        self.metadata = dict(metadata or {})
+        self.batch_generations = batch_generations
+        self.batch_bytes = batch_bytes
+        self.generations = 0
+        self._rows = []
+        self._arrays = []
+        self._buffered_bytes = 0
+        self._schema = None
+        self._sink = None
+        self._writer = None
+
+    def add(self, record):
+        super().add(record)
+        arrays = record_arrays(record, self.genomes)
+        if self._schema is None:
+            self._open(record, self.summaries[-1], arrays)
+        self._rows.append(self.summaries[-1])
+        self._arrays.append(arrays)
+        self._buffered_bytes += sum(array.nbytes for array in arrays.values())
+        self.generations += 1
+        if len(self._rows) >= self.batch_generations or self._buffered_bytes >= self.batch_bytes:
+            self.flush()
+
+    def _open(self, record, summary, arrays):
+        '''Creating the schema from the first generation and opening the file.'''
+        fields = [pa.field(name, SUMMARY_TYPES.get(name, pa.int64())) for name in summary]
+        fields += [pa.field(name, pa.large_list(pa.from_numpy_dtype(array.dtype)))
+                   for name, array in arrays.items()]
+        metadata = dict(self.metadata, record=type(record).__name__)
+        if "offspring" in arrays:
+            metadata["genome_digits"] = record.offspring.shape[1]
+        self._schema = pa.schema(fields, metadata={METADATA_KEY: json.dumps(metadata)})
+        if self.format == "parquet":
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        else:
+            self._sink = pa.OSFile(self.path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self._schema)
+
+    def flush(self):
+        '''Writing the buffered generations as one batch.'''
+        if not self._rows:
+            return
+        columns = []
+        for field in self._schema:
+            if pa.types.is_large_list(field.type):
+                parts = [arrays[field.name] for arrays in self._arrays]
+                offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+                np.cumsum([len(part) for part in parts], out=offsets[1:])
+                values = pa.array(np.concatenate(parts), type=field.type.value_type)
+                columns.append(pa.LargeListArray.from_arrays(pa.array(offsets), values))
+            else:
+                columns.append(pa.array([row[field.name] for row in self._rows], type=field.type))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self._schema))
+        self._rows = []
+        self._arrays = []
+        self._buffered_bytes = 0
+
+    def close(self):
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._writer = self._sink = None
+        # the run can be listed now that its file is complete
+        forget_listing(os.path.dirname(self.path))
+
+
+class ExportedGeneration(LongGenomeGeneration):
+    '''Natural selection generation read back without its genome matrix.
+
+    Args:
+        summary: exported summary of the generation.
+        scores: distance of every offspring genotype from the target.
+        counts: amount of offsprings with every genotype.
+    '''
+
+    def __init__(self, summary, scores, counts):
+        super().__init__(summary["generation"], scores, counts, summary["best_offspring"],
+                         summary["best_score"], summary["stop_reason"])
+        self._summary = summary
+
+    def summary(self):
+        '''Exported summary statistics of the generation.'''
+        return dict(self._summary)
+
+
+def open_batches(path):
+    '''Opening the record batches of an exported trajectory.
+
+    Arrow files are memory mapped, Parquet files are decoded one row group
+    at a time.
+
+    Args:
+        path: file written by ColumnarRecorder.
+
+    Returns:
+        schema: pyarrow schema of the file.
+        batches: iterable of pyarrow record batches.
+    '''
+    if export_format(path) == "parquet":
+        parquet = pq.ParquetFile(path, memory_map=True)
+        return parquet.schema_arrow, parquet.iter_batches(batch_size=BATCH_GENERATIONS)
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    return reader.schema, (reader.get_batch(index) for index in range(reader.num_record_batches))
+
+
+def read_metadata(path):
+    '''Reading the metadata stored with an exported trajectory.
+
+    Args:
+        path: file written by ColumnarRecorder.
+
+    Returns:
+        metadata: dict given to ColumnarRecorder, plus the name of the record
+            class and the amount of genome digits if genomes were exported.
+    '''
+    if export_format(path) == "parquet":
+        schema = pq.read_schema(path)
+    else:
+        with pa.memory_map(path, "r") as source:
+            schema = pa.ipc.open_file(source).schema
+    return json.loads(schema.metadata[METADATA_KEY])
+
+
+def list_values(column):
+    '''Splitting a list column into numpy views, without copying its values.
+
+    Args:
+        column: pyarrow (large) list array without nulls.
+
+    Returns:
+        values: list of 1D numpy arrays, one per row.
+    '''
+    offsets = column.offsets.to_numpy()
+    values = column.values.to_numpy(zero_copy_only=True)
+    return [values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:], strict=True)]
+
+
+def read_trajectory(path):
+    '''Replaying the generations of an exported trajectory.
+
+    The arrays of the records are read-only views of the memory mapped file
+    for Arrow files.
+
+    Args:
+        path: file written by ColumnarRecorder.
+
+    Yields:
+        record: every exported generation, a GeneticDriftGeneration,
+            a NaturalSelectionGeneration if the genomes were exported and
+            an ExportedGeneration otherwise.
+    '''
+    metadata = read_metadata(path)
+    schema, batches = open_batches(path)
+    summary_names = [field.name for field in schema if not pa.types.is_large_list(field.type)]
+    for batch in batches:
+        summaries = batch.select(summary_names).to_pylist()
+        if metadata["record"] == GeneticDriftGeneration.__name__:
+            for summary in summaries:
+                yield GeneticDriftGeneration(summary["generation"], summary["red_offspring"],
+                                             summary["blue_offspring"], summary["red_parents"])
+            continue
+        scores = list_values(batch.column("scores"))
+        counts = [None] * len(summaries)
+        if "counts" in schema.names:
+            counts = list_values(batch.column("counts"))
+        if "offspring" not in schema.names:
+            for summary, row_scores, row_counts in zip(summaries, scores, counts, strict=True):
+                if row_counts is None:
+                    row_counts = np.ones(len(row_scores), dtype=np.int64)
+                yield ExportedGeneration(summary, row_scores, row_counts)
+            continue
+        digits = metadata["genome_digits"]
+        offspring = list_values(batch.column("offspring"))
+        for summary, row_offspring, row_scores, row_counts in zip(summaries, offspring, scores, counts, strict=True):
+            yield NaturalSelectionGeneration(
+                summary["generation"], row_offspring.reshape(-1, digits), row_scores,
+                summary["best_offspring"], summary["best_score"], summary["stop_reason"], row_counts)
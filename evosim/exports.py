@@ -0,0 +1,164 @@
+'''Files of the runs exported by the columnar recording level.
+
+Creating, pruning and listing the files does not import pyarrow until a
+directory holds exported runs to list, so the pages start without it.
+Writing and replaying the runs is done by evosim.columnar.
+'''
+
+import os
+import shutil
+import tempfile
+import time
+
+EXPORT_FORMATS = {".arrow": "arrow", ".parquet": "parquet"}
+MAX_EXPORTS = 20
+MAX_EXPORT_SECONDS = 24 * 3600
+
+# exported runs of every directory, see exported_runs()
+_listings = {}
+
+
+def export_directory(session=None):
+    '''Directory of the runs exported by the Streamlit pages.
+
+    Every session exports to its own subdirectory. Creating the directory of
+    a new session deletes the directories of the sessions which exported
+    nothing for MAX_EXPORT_SECONDS, see prune_exports().
+
+    Args:
+        session: id of the session, None for the directory of all sessions.
+
+    Returns:
+        directory: $EVOSIM_EXPORT_DIR, evosim-exports in the temporary
+            directory by default, or the subdirectory of the session.
+            Created if missing.
+    '''
+    directory = os.environ.get("EVOSIM_EXPORT_DIR") or os.path.join(
+        tempfile.gettempdir(), "evosim-exports")
+    os.makedirs(directory, exist_ok=True)
+    if session is None:
+        return directory
+    session_directory = os.path.join(directory, session)
+    if not os.path.isdir(session_directory):
+        prune_exports(directory)
+        os.makedirs(session_directory, exist_ok=True)
+    return session_directory
+
+
+def new_export_path(prefix, directory=None, suffix=".arrow"):
+    '''Creating a new empty file for an exported run.
+
+    Only the MAX_EXPORTS - 1 newest runs of the directory are kept, see
+    prune_exports().
+
+    Args:
+        prefix: start of the file name, such as the simulation name.
+        directory: directory of the file, export_directory() by default.
+        suffix: one of EXPORT_FORMATS.
+
+    Returns:
+        path: path of the new file.
+    '''
+    directory = export_directory() if directory is None else directory
+    prune_exports(directory, MAX_EXPORTS - 1)
+    handle, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=directory)
+    os.close(handle)
+    return path
+
+
+def prune_exports(directory, keep=MAX_EXPORTS, max_seconds=MAX_EXPORT_SECONDS):
+    '''Deleting the old exported runs of a directory.
+
+    Runs being replayed stay readable until they are closed, their files are
+    memory mapped.
+
+    Args:
+        directory: directory of the exported runs.
+        keep: amount of newest runs to keep.
+        max_seconds: runs and session subdirectories which were not written
+            to for this long are deleted.
+    '''
+    now = time.time()
+    exports = []
+    for entry in os.scandir(directory):
+        try:
+            modified = entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            # the directory of a session which ended
+            if now - modified > max_seconds:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif os.path.splitext(entry.name)[1].lower() in EXPORT_FORMATS:
+            exports.append((modified, entry.path))
+    exports.sort(reverse=True)
+    for position, (modified, path) in enumerate(exports):
+        if position >= keep or now - modified > max_seconds:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    forget_listing(directory)
+
+
+def export_format(path):
+    '''Format of an export file, from its suffix.
+
+    Args:
+        path: file path ending with one of EXPORT_FORMATS.
+
+    Returns:
+        format: "arrow" or "parquet".
+    '''
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in EXPORT_FORMATS:
+        raise ValueError("unknown export format %r, expected one of %s"
+                         % (suffix, ", ".join(EXPORT_FORMATS)))
+    return EXPORT_FORMATS[suffix]
+
+
+def forget_listing(directory):
+    '''Listing the exported runs of a directory again on the next exported_runs().
+
+    Args:
+        directory: directory of the exported runs.
+    '''
+    _listings.pop(os.path.abspath(directory), None)
+
+
+def exported_runs(simulation=None, directory=None):
+    '''Listing the exported trajectories of a directory, newest first.
+
+    The listing is cached until the directory changes or a ColumnarRecorder
+    finishes a file in it, so pages can list the runs on every rerun.
+
+    Args:
+        simulation: only list runs whose metadata has this "simulation",
+            all runs by default.
+        directory: directory to list, export_directory() by default.
+
+    Returns:
+        paths: list of file paths.
+    '''
+    directory = os.path.abspath(export_directory() if directory is None else directory)
+    modified = os.stat(directory).st_mtime_ns
+    listing = _listings.get(directory)
+    if listing is None or listing[0] != modified:
+        runs = []
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                 if os.path.splitext(name)[1].lower() in EXPORT_FORMATS]
+        if paths:
+            # pyarrow is only imported once the directory holds exported runs
+            import pyarrow as pa
+
+            from evosim.columnar import read_metadata
+        for path in paths:
+            try:
+                metadata = read_metadata(path)
+                runs.append((os.path.getmtime(path), path, metadata.get("simulation")))
+            except (OSError, KeyError, TypeError, ValueError, pa.ArrowException):
+                # still being written, or not an export of this package
+                continue
+        runs.sort(reverse=True)
+        listing = _listings[directory] = (modified, runs)
+    return [path for _, path, kind in listing[1] if simulation is None or kind == simulation]
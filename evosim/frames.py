@@ -0,0 +1,159 @@
+'''Rendering policy: which generations become frames and which points are drawn.
+
+The simulations always run at full resolution, and every generation is
+recorded. Only the drawing is bounded: at most MAX_FRAMES regular frames per
+animation (plus key events such as a new best distance or fixation), and at
+most MAX_POINTS points per frame, sampled so that the proportions of every
+score or allele are kept.
+'''
+
+import math
+
+import numpy as np
+
+MAX_FRAMES = 1000
+MAX_POINTS = 5000
+
+
+def frame_step(max_generations, max_frames=MAX_FRAMES):
+    '''Drawing every k-th generation, so a full run fits in max_frames frames.
+
+    Args:
+        max_generations: maximal amount of generations of the run.
+        max_frames: maximal amount of regular frames.
+
+    Returns:
+        every: draw every this many generations, at least 1.
+    '''
+    return max(1, math.ceil(max_generations / max_frames))
+
+
+def new_best():
+    '''Key frame test of natural selection: the best distance improved.
+
+    Returns:
+        is_key: callable taking a NaturalSelectionGeneration, True when its
+            best distance is lower than that of all previous generations.
+    '''
+    best = [None]
+
+    def is_key(record):
+        if record.best_score is None or (best[0] is not None and record.best_score >= best[0]):
+            return False
+        best[0] = record.best_score
+        return True
+
+    return is_key
+
+
+def fixation(number_of_parents):
+    '''Key frame test of genetic drift: one of the colors was lost from the parents.
+
+    Args:
+        number_of_parents: amount of parents in every generation.
+
+    Returns:
+        is_key: callable taking a GeneticDriftGeneration.
+    '''
+    def is_key(record):
+        return record.red_parents in (0, number_of_parents)
+
+    return is_key
+
+
+def decimate(records, every, is_key=None, max_key_frames=MAX_FRAMES):
+    '''Selecting the generations to draw, lazily.
+
+    Yields the first generation, every k-th one after it, key generations and
+    the last one, so the final state is always shown.
+
+    Args:
+        records: iterable of generation records, consumed fully.
+        every: draw every this many generations.
+        is_key: callable telling if a record must be drawn, None for no key frames.
+        max_key_frames: maximal amount of key frames on top of the regular ones.
+
+    Yields:
+        record: the records to draw, in order.
+    '''
+    pending = None
+    key_frames = 0
+    for index, record in enumerate(records):
+        key = is_key is not None and is_key(record) and key_frames < max_key_frames
+        if index % every == 0:
+            pending = None
+            yield record
+        elif key:
+            key_frames += 1
+            pending = None
+            yield record
+        else:
+            pending = record
+    if pending is not None:
+        yield pending
+
+
+def stratified_counts(counts, max_points=MAX_POINTS):
+    '''Splitting max_points between categories in proportion to their counts.
+
+    Uses largest remainders, and keeps at least one point of the first
+    present category (the best distance, or red), so it does not disappear.
+
+    Args:
+        counts: array of the amount of items in every category.
+        max_points: maximal amount of points.
+
+    Returns:
+        sampled: array of the amount of points of every category, summing to
+            min(counts.sum(), max_points).
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    total = counts.sum()
+    if total <= max_points:
+        return counts
+    quota = counts * (max_points / total)
+    sampled = np.floor(quota).astype(np.int64)
+    remaining = max_points - sampled.sum()
+    sampled[np.argsort(sampled - quota, kind="stable")[:remaining]] += 1
+    first = np.flatnonzero(counts)[0]
+    if sampled[first] == 0:
+        sampled[first] = 1
+        sampled[np.argmax(sampled)] -= 1
+    return sampled
+
+
+def downsample(values, rng, counts=None, max_points=MAX_POINTS):
+    '''Stratified subsample of the drawn values, in random order.
+
+    Args:
+        values: array of values (distances or colors), one per item, or per
+            genotype if counts are given.
+        rng: numpy random Generator shuffling the points.
+        counts: amount of items with every value, one item each by default.
+        max_points: maximal amount of points.
+
+    Returns:
+        sampled: array of at most max_points values, with the proportions of
+            values.
+    '''
+    values = np.asarray(values)
+    if counts is None and len(values) <= max_points:
+        return values
+    categories, inverse = np.unique(values, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=len(categories)).astype(np.int64)
+    return rng.permutation(np.repeat(categories, stratified_counts(totals, max_points)))
+
+
+def allele_colors(red, blue, rng, max_points=MAX_POINTS):
+    '''Stratified subsample of red and blue items, in random order.
+
+    Args:
+        red: amount of red items.
+        blue: amount of blue items.
+        rng: numpy random Generator shuffling the points.
+        max_points: maximal amount of points.
+
+    Returns:
+        colors: array of at most max_points 'r' and 'b' items.
+    '''
+    return rng.permutation(np.repeat(["r", "b"], stratified_counts([red, blue], max_points)))
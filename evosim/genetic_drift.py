@@ -0,0 +1,358 @@
+'''Genetic drift model: two alleles (red and blue) without selection or mutation.'''
+
+import numpy as np
+
+from evosim.instrumentation import PhaseTimer
+
+
+def drift_step(red_parents, blue_parents, number_of_offsprings, number_of_parents, rng=None):
+    '''Advancing one generation using allele counts only.
+
+    Every parent has the same amount of offsprings and the next parents are 
+    drawn without replacement from all offsprings, so the amount of red 
+    parents follows a hypergeometric distribution.
+
+    Args:
+        red_parents: amount of red parents.
+        blue_parents: amount of blue parents.
+        number_of_offsprings: amount of offsprings per parent.
+        number_of_parents: amount of parents selected for the next generation.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        red_offspring: amount of red offsprings.
+        blue_offspring: amount of blue offsprings.
+        red_parents: amount of red parents selected for the next generation.
+    '''
+    rng = np.random.default_rng(rng)
+    red_offspring = red_parents * number_of_offsprings
+    blue_offspring = blue_parents * number_of_offsprings
+    red_parents = int(rng.hypergeometric(red_offspring, blue_offspring, number_of_parents))
+    return red_offspring, blue_offspring, red_parents
+
+
+def parent_colors(red_parents, number_of_parents):
+    '''Building the list of parent colors from the amount of red parents.
+
+    Args:
+        red_parents: amount of red parents.
+        number_of_parents: total amount of parents.
+
+    Returns:
+        colors: list of 'r' and 'b' items, one per parent.
+    '''
+    return ['r'] * red_parents + ['b'] * (number_of_parents - red_parents)
+
+
+
+class GeneticDriftGeneration:
+    '''Snapshot of a single genetic drift generation.
+
+    Args:
+        generation: generation number, the initial parents are generation 0.
+        red_offspring: amount of red offsprings.
+        blue_offspring: amount of blue offsprings.
+        red_parents: amount of red parents selected for the next generation.
+    '''
+
+    def __init__(self, generation, red_offspring, blue_offspring, red_parents):
+        self.generation = generation
+        self.red_offspring = red_offspring
+        self.blue_offspring = blue_offspring
+        self.red_parents = red_parents
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the record.'''
+        return 4 * 8
+
+    def summary(self):
+        '''Summary statistics of the generation.
+
+        Returns:
+            summary: dict of the generation number, allele counts and the 
+                red allele frequency among the offsprings.
+        '''
+        return {
+            "generation": self.generation,
+            "red_offspring": self.red_offspring,
+            "blue_offspring": self.blue_offspring,
+            "red_frequency": self.red_offspring / (self.red_offspring + self.blue_offspring),
+            "red_parents": self.red_parents,
+        }
+
+
+class GeneticDriftSim:
+    '''Genetic drift simulation of a red and a blue population.
+
+    Every generation each parent has the same amount of offsprings, and the 
+    parents of the next generation are selected randomly out of all offsprings. 
+    The simulation is done once one of the populations is extinct (fixation).
+
+    Args:
+        number_of_parents: amount of parents selected randomly in every generation.
+        number_of_offsprings: amount of offsprings per parent in each generation.
+        red_parents: initial amount of red parents, half of the parents by default.
+        random_seed: seed of the random number generator, None for a random run.
+        timer: PhaseTimer measuring the "sample" phase and counting "offsprings".
+    '''
+
+    state_attributes = ("red_parents", "generation", "done")
+
+    def __init__(self, number_of_parents=100, number_of_offsprings=5, red_parents=None, 
+                 random_seed=None, timer=None):
+        if red_parents is None:
+            red_parents = int(number_of_parents/2)
+        if not 0 <= red_parents <= number_of_parents:
+            raise ValueError("red_parents must be between 0 and number_of_parents")
+        self.number_of_parents = number_of_parents
+        self.number_of_offsprings = number_of_offsprings
+        self.initial_red_parents = red_parents
+        self.red_parents = red_parents
+        self.random_seed = random_seed
+        self.rng = np.random.default_rng(random_seed)
+        self.timer = timer if timer is not None else PhaseTimer()
+        self.generation = 0
+        self.done = False
+
+    @property
+    def parameters(self):
+        '''Parameters which fully determine the simulation, including the random seed.'''
+        return {
+            "number_of_parents": self.number_of_parents,
+            "number_of_offsprings": self.number_of_offsprings,
+            "red_parents": self.initial_red_parents,
+            "random_seed": self.random_seed,
+        }
+
+    def state(self):
+        '''Snapshot of everything which changes from one generation to the next.
+
+        Returns:
+            state: dict of the allele counts, the generation counter and the
+                state of the random number generator, see restore().
+        '''
+        state = {name: getattr(self, name) for name in self.state_attributes}
+        state["rng"] = self.rng.bit_generator.state
+        return state
+
+    def restore(self, state):
+        '''Continuing from a snapshot taken with state(), by a simulation
+        with the same parameters.
+
+        Args:
+            state: dict returned by state().
+        '''
+        for name in self.state_attributes:
+            setattr(self, name, state[name])
+        self.rng.bit_generator.state = state["rng"]
+
+    @property
+    def blue_parents(self):
+        '''Amount of blue parents in the current generation.'''
+        return self.number_of_parents - self.red_parents
+
+    def step(self):
+        '''Generating offsprings and randomly selecting the next parents.
+
+        Returns:
+            record: GeneticDriftGeneration of the generated offsprings.
+        '''
+        self.generation += 1
+        self.timer.generation = self.generation
+        with self.timer.phase("sample"):
+            red_offspring, blue_offspring, self.red_parents = drift_step(
+                self.red_parents, self.blue_parents, 
+                self.number_of_offsprings, self.number_of_parents, self.rng)
+        self.timer.count("offsprings", red_offspring + blue_offspring)
+        if red_offspring == 0 or blue_offspring == 0:
+            self.done = True
+        return GeneticDriftGeneration(
+            self.generation, red_offspring, blue_offspring, self.red_parents)
+
+    def run(self, max_generations):
+        '''Running generations until fixation.
+
+        Args:
+            max_generations: stop after this total amount of generations.
+
+        Yields:
+            record: GeneticDriftGeneration of every generation.
+        '''
+        while not self.done and self.generation < max_generations:
+            yield self.step()
+
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class GeneticDriftEnsembleGeneration:
+    '''Snapshot of a single generation of an ensemble of genetic drift populations.
+
+    Args:
+        generation: generation number, the initial parents are generation 0.
+        quantiles: red allele frequency of the parents selected in this
+            generation at every one of QUANTILES, over all replicates.
+        mean_frequency: mean red allele frequency over all replicates.
+        active: amount of replicates without fixation yet.
+        red_fixations: amount of replicates fixed on red in this generation.
+        blue_fixations: amount of replicates fixed on blue in this generation.
+    '''
+
+    def __init__(self, generation, quantiles, mean_frequency, active, red_fixations, blue_fixations):
+        self.generation = generation
+        self.quantiles = quantiles
+        self.mean_frequency = mean_frequency
+        self.active = active
+        self.red_fixations = red_fixations
+        self.blue_fixations = blue_fixations
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the record.'''
+        return self.quantiles.nbytes + 5 * 8
+
+    def summary(self):
+        '''Summary statistics of the generation.
+
+        Returns:
+            summary: dict of the generation number, the red frequency
+                quantiles (q05 to q95) and mean, the amount of active
+                replicates and the fixations of this generation.
+        '''
+        summary = {"generation": self.generation}
+        for quantile, value in zip(QUANTILES, self.quantiles, strict=True):
+            summary["q%02d" % round(100 * quantile)] = float(value)
+        summary.update(
+            mean_frequency=self.mean_frequency,
+            active=self.active,
+            red_fixations=self.red_fixations,
+            blue_fixations=self.blue_fixations)
+        return summary
+
+
+class GeneticDriftEnsemble:
+    '''Many independent genetic drift populations, advanced together.
+
+    Follows the same model as GeneticDriftSim. The amount of red parents of
+    all replicates is one array, and every generation draws the next parents
+    of all active replicates in a single vectorized hypergeometric draw.
+    Replicates leave the active set once they are fixed, so the cost of a
+    generation follows the amount of replicates still drifting.
+
+    Args:
+        number_of_parents: amount of parents selected randomly in every generation.
+        number_of_offsprings: amount of offsprings per parent in each generation.
+        red_parents: initial amount of red parents of every replicate, half
+            of the parents by default.
+        replicates: amount of independent populations.
+        random_seed: seed of the random number generator, None for a random run.
+        timer: PhaseTimer measuring the "sample" and "summarize" phases and
+            counting the "replicates" still drifting.
+    '''
+
+    state_attributes = ("red_parents", "active", "fixation_generations", "generation", "done")
+
+    def __init__(self, number_of_parents=100, number_of_offsprings=5, red_parents=None,
+                 replicates=10000, random_seed=None, timer=None):
+        if red_parents is None:
+            red_parents = int(number_of_parents/2)
+        if not 0 <= red_parents <= number_of_parents:
+            raise ValueError("red_parents must be between 0 and number_of_parents")
+        if replicates < 1:
+            raise ValueError("replicates must be at least 1")
+        self.number_of_parents = number_of_parents
+        self.number_of_offsprings = number_of_offsprings
+        self.initial_red_parents = red_parents
+        self.replicates = replicates
+        self.random_seed = random_seed
+        self.rng = np.random.default_rng(random_seed)
+        self.timer = timer if timer is not None else PhaseTimer()
+        self.red_parents = np.full(replicates, red_parents, dtype=np.int64)
+        self.active = np.arange(replicates)
+        self.fixation_generations = np.full(replicates, -1, dtype=np.int64)
+        self.generation = 0
+        self.done = False
+
+    @property
+    def parameters(self):
+        '''Parameters which fully determine the simulation, including the random seed.'''
+        return {
+            "number_of_parents": self.number_of_parents,
+            "number_of_offsprings": self.number_of_offsprings,
+            "red_parents": self.initial_red_parents,
+            "replicates": self.replicates,
+            "random_seed": self.random_seed,
+        }
+
+    def state(self):
+        '''Snapshot of everything which changes from one generation to the next.
+
+        Returns:
+            state: dict of the allele counts, active replicates, fixation
+                times, generation counter and the state of the random number
+                generator, see restore().
+        '''
+        state = {}
+        for name in self.state_attributes:
+            value = getattr(self, name)
+            state[name] = value.copy() if isinstance(value, np.ndarray) else value
+        state["rng"] = self.rng.bit_generator.state
+        return state
+
+    def restore(self, state):
+        '''Continuing from a snapshot taken with state(), by an ensemble
+        with the same parameters.
+
+        Args:
+            state: dict returned by state().
+        '''
+        for name in self.state_attributes:
+            value = state[name]
+            setattr(self, name, value.copy() if isinstance(value, np.ndarray) else value)
+        self.rng.bit_generator.state = state["rng"]
+
+    def step(self):
+        '''Generating offsprings and randomly selecting the next parents of
+        every active replicate.
+
+        A replicate is fixed in the generation whose offsprings all have the
+        same color, as in GeneticDriftSim.
+
+        Returns:
+            record: GeneticDriftEnsembleGeneration of the generation.
+        '''
+        self.generation += 1
+        self.timer.generation = self.generation
+        self.timer.count("replicates", self.active.size)
+        with self.timer.phase("sample"):
+            red_parents = self.red_parents[self.active]
+            red_offspring = red_parents * self.number_of_offsprings
+            blue_offspring = (self.number_of_parents - red_parents) * self.number_of_offsprings
+            fixed = (red_offspring == 0) | (blue_offspring == 0)
+            red_fixations = int(np.count_nonzero(fixed & (red_offspring > 0)))
+            self.fixation_generations[self.active[fixed]] = self.generation
+            drifting = ~fixed
+            self.active = self.active[drifting]
+            self.red_parents[self.active] = self.rng.hypergeometric(
+                red_offspring[drifting], blue_offspring[drifting], self.number_of_parents)
+        with self.timer.phase("summarize"):
+            frequencies = self.red_parents / self.number_of_parents
+            quantiles = np.quantile(frequencies, QUANTILES)
+            mean_frequency = float(frequencies.mean())
+        self.done = self.active.size == 0
+        return GeneticDriftEnsembleGeneration(
+            self.generation, quantiles, mean_frequency, int(self.active.size),
+            red_fixations, int(np.count_nonzero(fixed)) - red_fixations)
+
+    def run(self, max_generations):
+        '''Running generations until all replicates are fixed.
+
+        Args:
+            max_generations: stop after this total amount of generations.
+
+        Yields:
+            record: GeneticDriftEnsembleGeneration of every generation.
+        '''
+        while not self.done and self.generation < max_generations:
+            yield self.step()
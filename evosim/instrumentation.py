@@ -0,0 +1,258 @@
+'''Timing the phases of a simulation step, and of drawing its frames.'''
+
+from contextlib import contextmanager
+import cProfile
+import csv
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# tracemalloc traces the whole process, shared by the measurements of all threads
+_tracing_lock = threading.Lock()
+_tracing_timers = set()
+_started_tracing = False
+
+
+def _start_tracing(timer):
+    '''Starting tracemalloc for a measurement, unless it already traces.'''
+    global _started_tracing
+    with _tracing_lock:
+        if not _tracing_timers and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_timers.add(timer)
+        if len(_tracing_timers) > 1:
+            # the peaks are reset and folded by every measurement
+            for other in _tracing_timers:
+                other.memory_overlapped = True
+
+
+def _stop_tracing(timer):
+    '''Stopping tracemalloc once the last measurement which needs it ended.'''
+    global _started_tracing
+    with _tracing_lock:
+        _tracing_timers.discard(timer)
+        if not _tracing_timers and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class PhaseTimer:
+    '''Accumulated wall clock time and amount of calls of every phase.
+
+    Every simulation owns one, see the ``timer`` attribute of the sim classes.
+    Phases may be nested, the time of a phase excludes the phases inside it,
+    so the phase times add up to the measured total. Times and counters are
+    also kept per generation, labeled by the ``generation`` attribute, which
+    the simulations set at the start of every step.
+
+    Memory is traced with tracemalloc, which is shared by the whole process.
+    It keeps tracing until the last measurement of any thread ended, and
+    memory_overlapped tells whether another measurement ran at the same
+    time, which makes the peaks approximate.
+    '''
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.peak_bytes = {}
+        self.generation = None
+        self.generations = {}
+        self.run_peak_bytes = None
+        self.allocated_blocks = None
+        self.memory_overlapped = False
+        self.profile = None
+        self._nested = []
+        self._tracing = False
+
+    def _row(self):
+        return self.generations.setdefault(self.generation, {})
+
+    @contextmanager
+    def phase(self, name, per_generation=True):
+        '''Timing a block of code as part of the given phase.
+
+        Args:
+            name: phase name, such as "mutate", "score" or "select".
+            per_generation: whether to add the time to the current generation,
+                False for phases spanning a whole run.
+        '''
+        tracing = self._tracing
+        if tracing:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            seconds = elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if per_generation and self.generation is not None:
+                row = self._row()
+                row[name + "_seconds"] = row.get(name + "_seconds", 0.0) + seconds
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak - before, 0)
+                self._fold_peak()
+
+    def count(self, name, amount=1):
+        '''Adding to a counter, in total and for the current generation.
+
+        Args:
+            name: counter name, such as "offsprings".
+            amount: amount to add.
+        '''
+        self.counters[name] = self.counters.get(name, 0) + amount
+        if self.generation is not None:
+            row = self._row()
+            row[name] = row.get(name, 0) + amount
+
+    def _fold_peak(self):
+        # reset_peak forgets the peak of the run, keep it before every reset
+        if self._tracing:
+            self.run_peak_bytes = max(self.run_peak_bytes, tracemalloc.get_traced_memory()[1])
+
+    @contextmanager
+    def measure(self, memory=False, profile=False):
+        '''Measuring a whole run, on top of the phase times.
+
+        Memory tracing and profiling slow the run down, so both are opt-in.
+
+        Args:
+            memory: trace allocations, for the peak memory of the run and of
+                every phase, and the amount of memory blocks still held after it.
+            profile: capture a cProfile of the run, kept as text in profile.
+        '''
+        if memory:
+            _start_tracing(self)
+            tracemalloc.reset_peak()
+            self.run_peak_bytes = 0
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            start_blocks = sys.getallocatedblocks()
+            self._tracing = True
+        profiler = cProfile.Profile() if profile else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(30)
+                self.profile = text.getvalue()
+            if memory:
+                self._fold_peak()
+                self._tracing = False
+                # memory freed by other measurements may fall below the start
+                self.run_peak_bytes = max(0, self.run_peak_bytes - start_bytes)
+                self.allocated_blocks = sys.getallocatedblocks() - start_blocks
+                _stop_tracing(self)
+
+    def merge(self, other):
+        '''Adding the timings of another PhaseTimer, such as one measured in a worker process.
+
+        Times, calls and counters add up, peaks keep the largest one, as the
+        other timer measured another process.
+
+        Args:
+            other: PhaseTimer, after its measure() block ended.
+        '''
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + other.calls[name]
+        for name, amount in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for name, peak in other.peak_bytes.items():
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+        for generation, other_row in other.generations.items():
+            row = self.generations.setdefault(generation, {})
+            for column, value in other_row.items():
+                row[column] = row.get(column, 0) + value
+        if other.run_peak_bytes is not None:
+            self.run_peak_bytes = max(self.run_peak_bytes or 0, other.run_peak_bytes)
+        if other.allocated_blocks is not None:
+            self.allocated_blocks = (self.allocated_blocks or 0) + other.allocated_blocks
+        self.memory_overlapped = self.memory_overlapped or other.memory_overlapped
+        if other.profile is not None:
+            self.profile = other.profile if self.profile is None else other.profile + "\n" + self.profile
+
+    def reset(self):
+        '''Forgetting all the timings measured so far.'''
+        self.seconds.clear()
+        self.calls.clear()
+        self.counters.clear()
+        self.peak_bytes.clear()
+        self.generations.clear()
+        self.generation = None
+        self.run_peak_bytes = None
+        self.allocated_blocks = None
+        self.memory_overlapped = False
+        self.profile = None
+
+    def as_dict(self):
+        '''Timings per phase.
+
+        Returns:
+            phases: dict of phase name to a dict with "seconds" and "calls",
+                and "peak_bytes" if memory was traced.
+        '''
+        phases = {name: {"seconds": self.seconds[name], "calls": self.calls[name]}
+                  for name in self.seconds}
+        for name, peak in self.peak_bytes.items():
+            phases[name]["peak_bytes"] = peak
+        return phases
+
+    def generation_rows(self):
+        '''Times and counters of every generation.
+
+        Returns:
+            rows: list of dicts with the generation number, "<phase>_seconds"
+                of every phase and every counter, ordered by generation.
+        '''
+        return [dict(generation=generation, **self.generations[generation])
+                for generation in sorted(self.generations)]
+
+    def report(self):
+        '''Everything measured, JSON serializable.
+
+        Returns:
+            report: dict of the phases, counters, run memory, whether other
+                measurements overlapped it, per generation rows and profile text.
+        '''
+        return {
+            "phases": self.as_dict(),
+            "counters": dict(self.counters),
+            "peak_bytes": self.run_peak_bytes,
+            "allocated_blocks": self.allocated_blocks,
+            "memory_overlapped": self.memory_overlapped,
+            "generations": self.generation_rows(),
+            "profile": self.profile,
+        }
+
+    def to_json(self):
+        '''The report as JSON text.'''
+        return json.dumps(self.report(), indent=2)
+
+    def to_csv(self):
+        '''The per generation rows as CSV text, one column per phase and counter.'''
+        rows = self.generation_rows()
+        columns = ["generation"]
+        for row in rows:
+            columns += [column for column in row if column not in columns]
+        text = io.StringIO()
+        writer = csv.DictWriter(text, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+        return text.getvalue()
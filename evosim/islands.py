@@ -0,0 +1,483 @@
+'''Island model of natural selection: subpopulations connected by migration.
+
+Every island is a NaturalSelectionSim of its own, with the same mutation and
+truncation selection and an independent random number generator. Every
+migration_interval generations the best parents of every island migrate and
+replace the worst parents of other islands, along a ring or to any other
+island at random.
+
+The islands stay in worker processes between migrations, each worker
+advancing its islands on its own core. Only the summary of every generation
+and the migrants are sent between processes, so the throughput grows with the
+amount of cores, up to the amount of islands. The results do not depend on the
+amount of workers.
+'''
+
+import os
+import time
+
+import numpy as np
+
+from evosim.instrumentation import PhaseTimer
+from evosim.natural_selection import SELECTION_STRATEGIES, NaturalSelectionSim, calculate_score
+from evosim.spawn import WorkerContext
+
+TOPOLOGIES = ["ring", "fully connected"]
+
+
+def island_random_seeds(random_seed, islands):
+    '''Independent random seeds of the islands, derived from the seed of the run.
+
+    Args:
+        random_seed: seed of the run, None for a random run.
+        islands: amount of islands.
+
+    Returns:
+        seeds: list of islands + 1 ints, the last one seeds the migrations.
+    '''
+    children = np.random.SeedSequence(random_seed).spawn(islands + 1)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def migration_routes(topology, islands, migrants, rng):
+    '''Destination island of every migrant.
+
+    Args:
+        topology: "ring" sends the migrants of every island to the next
+            island, "fully connected" sends every migrant to any other
+            island at random.
+        islands: amount of islands.
+        migrants: amount of migrants of every island.
+        rng: numpy random Generator, used by the fully connected topology.
+
+    Returns:
+        routes: int array of shape (islands, migrants), the destination
+            island of every migrant.
+    '''
+    sources = np.arange(islands)[:, None]
+    if topology == "ring":
+        return np.repeat((sources + 1) % islands, migrants, axis=1)
+    if topology == "fully connected":
+        return (sources + rng.integers(1, islands, (islands, migrants))) % islands
+    raise ValueError("unknown topology %r, expected one of %s" % (topology, ", ".join(TOPOLOGIES)))
+
+
+def migrate(emigrants, routes):
+    '''Sending the migrants of every island to their destination.
+
+    Args:
+        emigrants: genome matrix of the migrants of every island, fewer rows
+            for islands with fewer parents.
+        routes: destinations returned by migration_routes().
+
+    Returns:
+        immigrants: genome matrix of the migrants arriving on every island.
+    '''
+    arriving = [[] for _ in emigrants]
+    for source, genomes in enumerate(emigrants):
+        for genome, destination in zip(genomes, routes[source][:len(genomes)], strict=True):
+            arriving[destination].append(genome)
+    digits = emigrants[0].shape[1]
+    return [np.array(genomes, dtype=np.int8).reshape(-1, digits) for genomes in arriving]
+
+
+def receive(sim, immigrants):
+    '''Replacing the worst parents of an island by immigrants.
+
+    An extinct island is colonized again by its immigrants.
+
+    Args:
+        sim: NaturalSelectionSim of the island, its parents ordered from the
+            closest to the target.
+        immigrants: genome matrix of the arriving migrants.
+    '''
+    if not len(immigrants):
+        return
+    if sim.stop_reason == "extinct":
+        sim.done = False
+        sim.stop_reason = None
+    kept = max(0, min(len(sim.parents), sim.number_of_parents - len(immigrants)))
+    sim.parents = np.concatenate([sim.parents[:kept], immigrants])[:sim.number_of_parents]
+
+
+def advance(sims, generations, immigrants, migrants):
+    '''Advancing islands from one migration to the next.
+
+    Args:
+        sims: NaturalSelectionSim of every island.
+        generations: amount of generations to compute.
+        immigrants: genome matrix of the migrants arriving on every island
+            before the first generation, None for none.
+        migrants: amount of best parents of every island to send after the
+            last generation.
+
+    Returns:
+        outcomes: for every island, a list with a (best distance, mean
+            distance, amount of offsprings, best offspring code) tuple per
+            generation, None for generations without offsprings.
+        emigrants: genome matrix of the best parents of every island.
+    '''
+    outcomes = []
+    for sim, arriving in zip(sims, immigrants, strict=True):
+        if arriving is not None:
+            receive(sim, arriving)
+        island = []
+        for _ in range(generations):
+            record = None if sim.done else sim.step()
+            if record is None or record.best_score is None:
+                island.append(None)
+            else:
+                island.append((record.best_score, float(record.scores.mean()),
+                               len(record.scores), record.best_offspring))
+        outcomes.append(island)
+    return outcomes, [sim.parents[:migrants].copy() for sim in sims]
+
+
+def _island_worker(connection, island_parameters):
+    '''Worker process loop, keeping its islands between the requests.'''
+    sims = [NaturalSelectionSim(**parameters) for parameters in island_parameters]
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        connection.send(advance(sims, *request))
+    connection.close()
+
+
+class IslandWorkers:
+    '''Worker processes advancing islands in parallel.
+
+    Args:
+        island_parameters: keyword arguments of the NaturalSelectionSim of
+            every island.
+        workers: amount of worker processes, 1 advances the islands in this
+            process.
+    '''
+
+    def __init__(self, island_parameters, workers):
+        self.groups = np.array_split(np.arange(len(island_parameters)), workers)
+        self.sims = None
+        self.connections = []
+        self.processes = []
+        if workers == 1:
+            self.sims = [NaturalSelectionSim(**parameters) for parameters in island_parameters]
+            return
+        context = WorkerContext()
+        for group in self.groups:
+            connection, child = context.Pipe()
+            process = context.Process(
+               target=_island_worker, args=(child, [island_parameters[i] for i in group]), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def advance(self, generations, immigrants, migrants):
+        '''Advancing all islands, see advance().'''
+        if self.sims is not None:
+            return advance(self.sims, generations, immigrants, migrants)
+        for connection, group in zip(self.connections, self.groups, strict=True):
+            connection.send((generations, [immigrants[i] for i in group], migrants))
+        outcomes, emigrants = [], []
+        for connection in self.connections:
+            group_outcomes, group_emigrants = connection.recv()
+            outcomes += group_outcomes
+            emigrants += group_emigrants
+        return outcomes, emigrants
+
+    def close(self):
+        '''Stopping the worker processes.'''
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+
+
+class IslandGeneration:
+    '''Snapshot of a single generation of all islands.
+
+    Args:
+        generation: generation number, starting from 0.
+        best_scores: distance of the best offspring of every island, None
+            for islands without offsprings.
+        mean_scores: mean distance of the offsprings of every island, None
+            for islands without offsprings.
+        offsprings: amount of offsprings of every island.
+        best_offspring: code of the offspring closest to the target on any
+            island, None if there are no offsprings.
+        best_score: distance of the best offspring from the target, None if
+            there are no offsprings.
+        stop_reason: why the run stopped after this generation, None if it
+            continues. See NaturalSelectionSim.run.
+        migrants: amount of parents which migrated after this generation.
+    '''
+
+    def __init__(self, generation, best_scores, mean_scores, offsprings, best_offspring,
+                 best_score, stop_reason=None, migrants=0):
+        self.generation = generation
+        self.best_scores = best_scores
+        self.mean_scores = mean_scores
+        self.offsprings = offsprings
+        self.best_offspring = best_offspring
+        self.best_score = best_score
+        self.stop_reason = stop_reason
+        self.migrants = migrants
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the record.'''
+        return 3 * 8 * len(self.best_scores)
+
+    def summary(self):
+        '''Summary statistics of the generation.
+
+        Returns:
+            summary: dict of the generation number, amount of offsprings,
+                best offspring, best and mean distance over all islands,
+                amount of migrants, stop reason and the best distance of
+                every island (best_score_0, best_score_1, ...).
+        '''
+        offsprings = sum(self.offsprings)
+        mean_score = None
+        if offsprings:
+            pairs = zip(self.mean_scores, self.offsprings, strict=True)
+            mean_score = sum(mean * count for mean, count in pairs if mean is not None) / offsprings
+        summary = {
+            "generation": self.generation,
+            "offsprings": offsprings,
+            "best_offspring": self.best_offspring,
+            "best_score": self.best_score,
+            "mean_score": mean_score,
+            "migrants": self.migrants,
+            "stop_reason": self.stop_reason,
+        }
+        for island, best_score in enumerate(self.best_scores):
+            summary["best_score_%d" % island] = best_score
+        return summary
+
+
+class IslandNaturalSelectionSim:
+    '''Natural selection on islands connected by migration.
+
+    The run stops once any island reaches the target, or once all islands
+    are extinct. An extinct island is colonized again by the next migrants.
+    The islands live in the worker processes for a single run, so a stopped
+    run cannot be continued.
+
+    Args:
+        seed: 'DNA' code of the original parent of every island.
+        target: 'DNA' code which best fits the environment.
+        average_number_of_offsprings: Poisson rate of offsprings per parent.
+        number_of_parents: amount of parents selected on every island for
+            every generation.
+        mutation_rate_offspring: the chance for an offspring to go through mutation.
+        mutation_rate_digit: for an offspring who is going under mutation,
+            this is the chance for every digit to go under mutation.
+        mutation_rate_digit_up: for a digit which is going under mutation,
+            this is the chance for it to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits.
+        islands: amount of islands.
+        migration_interval: amount of generations between two migrations.
+        migrants: amount of best parents of every island which migrate.
+        topology: one of TOPOLOGIES, see migration_routes().
+        random_seed: seed of the random number generator, None for a random run.
+        workers: amount of worker processes, one per island up to the amount
+            of cores by default. Does not change the results.
+        timer: PhaseTimer measuring the "advance" phase of the islands and the
+            "migrate" phase, and counting "offsprings".
+        selection: how every island chooses its next parents, one of
+            SELECTION_STRATEGIES.
+        tournament_size: amount of offsprings of every tournament, for
+            tournament selection.
+        elite_fraction: share of the parents kept by truncation selection,
+            for elitism selection.
+    '''
+
+    def __init__(self, seed, target, average_number_of_offsprings=1.2,
+                 number_of_parents=200, mutation_rate_offspring=0.05,
+                 mutation_rate_digit=0.1, mutation_rate_digit_up=0.5,
+                 mutation_rate_digit_up_plus=1.0, mutation_rate_digit_down_minus=1.0,
+                 islands=4, migration_interval=10, migrants=2, topology="ring",
+                 random_seed=None, workers=None, timer=None, selection="truncation",
+                 tournament_size=2, elite_fraction=0.1):
+        if not seed.isdigit() or not target.isdigit() or len(seed) != len(target):
+            raise ValueError("seed and target must be digit strings of the same length")
+        if islands < 1 or migration_interval < 1 or migrants < 0:
+            raise ValueError("islands and migration_interval must be positive, migrants not negative")
+        if topology not in TOPOLOGIES:
+            raise ValueError("unknown topology %r, expected one of %s" % (topology, ", ".join(TOPOLOGIES)))
+        if selection not in SELECTION_STRATEGIES:
+            raise ValueError("unknown selection %r, expected one of %s"
+                             % (selection, ", ".join(SELECTION_STRATEGIES)))
+        self.seed = seed
+        self.target = target
+        self.average_number_of_offsprings = average_number_of_offsprings
+        self.number_of_parents = number_of_parents
+        self.mutation_rate_offspring = mutation_rate_offspring
+        self.mutation_rate_digit = mutation_rate_digit
+        self.mutation_rate_digit_up = mutation_rate_digit_up
+        self.mutation_rate_digit_up_plus = mutation_rate_digit_up_plus
+        self.mutation_rate_digit_down_minus = mutation_rate_digit_down_minus
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.topology = topology
+        self.selection = selection
+        self.tournament_size = tournament_size
+        self.elite_fraction = elite_fraction
+        self.random_seed = random_seed
+        self.workers = workers or min(islands, os.cpu_count() or 1)
+        self.timer = timer if timer is not None else PhaseTimer()
+        *self.island_seeds, migration_seed = island_random_seeds(random_seed, islands)
+        self.rng = np.random.default_rng(migration_seed)
+
+        self.initial_score = int(calculate_score([seed], target)[0])
+        self.generation = 0
+        self.best_offspring = seed
+        self.best_score = self.initial_score
+        self.best_score_ever = self.initial_score
+        self.generations_without_improvement = 0
+        self.done = False
+        self.stop_reason = None
+
+    @property
+    def parameters(self):
+        '''Parameters which fully determine the simulation, including the random seed.'''
+        return {
+            "seed": self.seed,
+            "target": self.target,
+            "average_number_of_offsprings": self.average_number_of_offsprings,
+            "number_of_parents": self.number_of_parents,
+            "mutation_rate_offspring": self.mutation_rate_offspring,
+            "mutation_rate_digit": self.mutation_rate_digit,
+            "mutation_rate_digit_up": self.mutation_rate_digit_up,
+            "mutation_rate_digit_up_plus": self.mutation_rate_digit_up_plus,
+            "mutation_rate_digit_down_minus": self.mutation_rate_digit_down_minus,
+            "islands": self.islands,
+            "migration_interval": self.migration_interval,
+            "migrants": self.migrants,
+            "topology": self.topology,
+            "selection": self.selection,
+            "tournament_size": self.tournament_size,
+            "elite_fraction": self.elite_fraction,
+            "random_seed": self.random_seed,
+        }
+
+    def island_parameters(self):
+        '''Keyword arguments of the NaturalSelectionSim of every island.'''
+        parameters = {name: value for name, value in self.parameters.items()
+                      if name not in ("islands", "migration_interval", "migrants", "topology")}
+        return [dict(parameters, random_seed=seed) for seed in self.island_seeds]
+
+    def collect(self, outcomes):
+        '''Combining the outcomes of all islands in one generation.
+
+        Args:
+            outcomes: outcome of every island in this generation, see advance().
+
+        Returns:
+            record: IslandGeneration of the generation.
+        '''
+        self.timer.generation = self.generation
+        offsprings = [0 if outcome is None else outcome[2] for outcome in outcomes]
+        self.timer.count("offsprings", sum(offsprings))
+        present = [outcome for outcome in outcomes if outcome is not None]
+        if not present:
+            self.done = True
+            self.stop_reason = "extinct"
+            self.best_offspring = None
+        else:
+            self.best_score, _, _, self.best_offspring = min(present, key=lambda outcome: outcome[0])
+            if self.best_score < self.best_score_ever:
+                self.best_score_ever = self.best_score
+                self.generations_without_improvement = 0
+            else:
+                self.generations_without_improvement += 1
+            if self.best_score == 0:
+                self.done = True
+                self.stop_reason = "target reached"
+        record = IslandGeneration(
+           self.generation,
+           [None if outcome is None else outcome[0] for outcome in outcomes],
+           [None if outcome is None else outcome[1] for outcome in outcomes],
+           offsprings,
+           self.best_offspring,
+           self.best_score if present else None,
+           self.stop_reason)
+        self.generation += 1
+        return record
+
+    def run(self, max_generations=None, max_seconds=None, plateau_generations=None):
+        '''Running generations until the target is reached or a limit is hit.
+
+        Stops for the same reasons as NaturalSelectionSim.run, the time
+        limit is checked at every migration.
+
+        Args:
+            max_generations: stop after this total amount of generations,
+                None for no limit.
+            max_seconds: stop once the generations took this long to
+                compute, None for no limit.
+            plateau_generations: stop once the best distance over all
+                islands did not improve for this amount of generations,
+                None for no limit.
+
+        Yields:
+            record: IslandGeneration of every generation.
+        '''
+        if self.done:
+            return
+        if self.generation:
+            raise RuntimeError("the islands are not kept after a run, start a new simulation")
+        if max_generations is not None and max_generations <= 0:
+            self.stop_reason = "max generations"
+            return
+        workers = IslandWorkers(self.island_parameters(), self.workers)
+        immigrants = [None] * self.islands
+        elapsed = 0.0
+        try:
+            while self.stop_reason is None:
+                generations = self.migration_interval - self.generation % self.migration_interval
+                if max_generations is not None:
+                    generations = min(generations, max_generations - self.generation)
+                start = time.perf_counter()
+                with self.timer.phase("advance", per_generation=False):
+                    outcomes, emigrants = workers.advance(generations, immigrants, self.migrants)
+                elapsed += time.perf_counter() - start
+                immigrants = [None] * self.islands
+                migrants = 0
+                migration = (self.generation + generations) % self.migration_interval == 0
+                if migration and self.islands > 1 and self.migrants:
+                    with self.timer.phase("migrate", per_generation=False):
+                        routes = migration_routes(self.topology, self.islands, self.migrants, self.rng)
+                        immigrants = migrate(emigrants, routes)
+                    migrants = sum(len(genomes) for genomes in emigrants)
+                for index in range(generations):
+                    record = self.collect([island[index] for island in outcomes])
+                    last = index == generations - 1
+                    if last:
+                        record.migrants = migrants
+                    if not self.done:
+                        if max_generations is not None and self.generation >= max_generations:
+                            self.stop_reason = "max generations"
+                        elif plateau_generations and self.generations_without_improvement >= plateau_generations:
+                            self.stop_reason = "plateau"
+                        elif last and max_seconds is not None and elapsed >= max_seconds:
+                            self.stop_reason = "time limit"
+                        record.stop_reason = self.stop_reason
+                    yield record
+                    if self.stop_reason is not None:
+                        break
+        finally:
+            workers.close()
@@ -0,0 +1,549 @@
+'''Load test of the Streamlit pages under concurrent sessions.
+
+Starts the app with ``streamlit run`` on a free local port (or uses a running
+server with ``--url``), and opens many browser-like sessions on the
+Natural Selection and Genetic Drift pages. Every session speaks the websocket
+protocol of the Streamlit frontend: it sets the sidebar widgets of its
+scenario by label, from the defaults up to slider-max worst cases, and waits
+for the page script to finish. Sessions get distinct random seeds, so they do
+not hit each other's cached trajectories.
+
+The report gives the p50/p95/p99 time-to-render of every page and scenario,
+the sessions the shared service turned away as busy, the failures
+(exceptions, errors, timeouts and lost connections), the CPU time
+and peak resident memory of the server and its worker processes, as JSON.
+``--max-p95`` and ``--max-failure-rate`` make it a regression gate:
+
+    python -m evosim.loadtest --sessions 40 --concurrency 8 --output load.json
+    python -m evosim.loadtest --scenarios default max --max-p95 120 --max-failure-rate 0
+'''
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.Slider_pb2 import Slider
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+# url path of every page, as listed by the app
+PAGES = {
+    "natural-selection": "Natural_Selection",
+    "genetic-drift": "Genetic_Drift",
+}
+
+# sidebar values of every scenario, by widget label
+SCENARIOS = {
+    "natural-selection": {
+        "default": {},
+        "animation": {"Rendering": "Animation player"},
+        "islands": {"Islands": 8},
+        "max": {
+            "Number of digits": 20,
+            "Number of offsprings on average": 2.0,
+            "Number of parents": 10000,
+            "Maximum generations": 5000,
+            "Stop without improvement after (generations)": 1000,
+            "Time limit (seconds)": 300,
+            "Rendering": "Animation player",
+        },
+    },
+    "genetic-drift": {
+        "default": {},
+        "animation": {"Rendering": "Animation player"},
+        "ensemble": {"Replicates": 10000},
+        "max": {
+            "Amount of parents": 1000,
+            "Offsprings per parent": 1000,
+            "Maximum generations": 5000,
+            "Rendering": "Animation player",
+        },
+    },
+}
+
+# elements which show the results of a run
+OUTPUT_ELEMENTS = {"imgs", "html", "vega_lite_chart", "iframe"}
+STARTUP_SECONDS = 60.0
+SAMPLE_SECONDS = 0.5
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def free_port():
+    '''A local TCP port nobody listens on.'''
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_server(port=None, startup_seconds=STARTUP_SECONDS):
+    '''Running the app with ``streamlit run`` for the duration of the block.
+
+    Args:
+        port: local port of the server, a free one by default.
+        startup_seconds: how long to wait for the server to answer.
+
+    Yields:
+        server: (url, pid) of the running server.
+    '''
+    port = port or free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "main.py",
+         "--server.headless", "true",
+         "--server.port", str(port),
+         "--server.enableXsrfProtection", "false",
+         "--browser.gatherUsageStats", "false"],
+        cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = "http://127.0.0.1:%d" % port
+    try:
+        deadline = time.perf_counter() + startup_seconds
+        while True:
+            try:
+                with urllib.request.urlopen(url + "/_stcore/health", timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError as error:
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("the Streamlit server did not start on %s" % url) from error
+                time.sleep(0.2)
+        yield url, process.pid
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class ProcessTreeMonitor:
+    '''Sampling the CPU time and resident memory of a process and its descendants.
+
+    Reads /proc, so it only measures on Linux; elsewhere the measures are None.
+    Processes which end between two samples lose their last interval.
+
+    Args:
+        pid: root process, such as the Streamlit server.
+        interval: seconds between two samples.
+    '''
+
+    def __init__(self, pid, interval=SAMPLE_SECONDS):
+        self.pid = pid
+        self.interval = interval
+        self.available = os.path.isdir("/proc/%d" % pid)
+        self.first = {}
+        self.initial = set()
+        self.last = {}
+        self.peak_rss = 0
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+
+    def tree(self):
+        '''Reading the processes of the tree.
+
+        Returns:
+            processes: dict of (cpu seconds, resident bytes) by pid.
+        '''
+        parents, stats = {}, {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open("/proc/%s/stat" % name) as file:
+                    # the command name may hold spaces, the fields follow its closing parenthesis
+                    fields = file.read().rsplit(")", 1)[1].split()
+                with open("/proc/%s/statm" % name) as file:
+                    resident = int(file.read().split()[1]) * PAGE_SIZE
+            except (OSError, IndexError, ValueError):
+                continue
+            pid = int(name)
+            parents[pid] = int(fields[1])
+            ticks = int(fields[11]) + int(fields[12])
+            stats[pid] = (ticks / os.sysconf("SC_CLK_TCK"), resident)
+        members = {self.pid}
+        grown = True
+        while grown:
+            children = {pid for pid, parent in parents.items() if parent in members} - members
+            members |= children
+            grown = bool(children)
+        return {pid: stats[pid] for pid in members if pid in stats}
+
+    def sample(self):
+        '''Taking a single sample of the tree.'''
+        processes = self.tree()
+        for pid, (cpu, _) in processes.items():
+            self.first.setdefault(pid, cpu)
+            self.last[pid] = cpu
+        self.peak_rss = max(self.peak_rss, sum(resident for _, resident in processes.values()))
+        self.samples += 1
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        '''Sampling in a background thread until stop().'''
+        self.started = time.perf_counter()
+        if self.available:
+            self.sample()
+            self.initial = set(self.first)
+            self._thread.start()
+
+    def stop(self):
+        '''Stopping the samples.
+
+        Returns:
+            result: dict of the CPU seconds used since start(), the average
+                CPU use in percent of one core, and the peak resident memory
+                of the whole tree in bytes.
+        '''
+        seconds = time.perf_counter() - self.started
+        if not self.available:
+            return {"cpu_seconds": None, "cpu_percent": None, "peak_rss_bytes": None}
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        # processes started after start() count from zero
+        cpu = sum(self.last[pid] - (self.first[pid] if pid in self.initial else 0) for pid in self.last)
+        return {
+            "cpu_seconds": cpu,
+            "cpu_percent": 100 * cpu / seconds if seconds else None,
+            "peak_rss_bytes": self.peak_rss,
+            "samples": self.samples,
+        }
+
+
+def widget_state(kind, element, value):
+    '''The value of a widget as the frontend sends it.
+
+    Args:
+        kind: element type, such as "slider".
+        element: widget proto of the element.
+        value: value to set, as passed to the widget by a user.
+
+    Returns:
+        state: WidgetState proto.
+    '''
+    state = WidgetState(id=element.id)
+    if kind == "slider" and element.type == Slider.SELECT_SLIDER:
+        state.string_array_value.data.append(str(value))
+    elif kind == "slider":
+        state.double_array_value.data.append(float(value))
+    elif kind in ("selectbox", "radio", "text_input"):
+        state.string_value = str(value)
+    elif kind == "number_input":
+        state.double_value = float(value)
+    elif kind == "checkbox":
+        state.bool_value = bool(value)
+    else:
+        raise ValueError("cannot set a %s widget" % kind)
+    return state
+
+
+def run_session(url, page, values, timeout):
+    '''Opening a page, setting its widgets and waiting until it is rendered.
+
+    Widgets which only appear once others are set (such as "Tournament size")
+    are set by further reruns: every widget of values is sent as soon as it
+    shows up, which interrupts the run like a user moving a slider. The
+    time-to-render is measured from the last rerun to the end of the script.
+
+    Args:
+        url: base url of the server.
+        page: url path of the page, one of PAGES.
+        values: dict of widget values by label.
+        timeout: seconds to wait for any message before failing.
+
+    Returns:
+        result: dict of the time-to-render, the time to the first result
+            shown, the busy message if the service turned the run away, and
+            the failure, None if it succeeded.
+    '''
+    pending = dict(values)
+    states = {}
+    result = {"seconds": None, "first_output_seconds": None, "reruns": 0, "rejected": None, "failure": None}
+
+    def rerun(websocket):
+        message = BackMsg()
+        message.rerun_script.page_name = page
+        message.rerun_script.widget_states.widgets.extend(states.values())
+        websocket.send(message.SerializeToString())
+        result["reruns"] += 1
+        result["rejected"] = None
+        result["first_output_seconds"] = None
+        return time.perf_counter()
+
+    try:
+        with connect(url.replace("http", "ws", 1) + "/_stcore/stream", max_size=None,
+                     open_timeout=timeout) as websocket:
+            start = rerun(websocket)
+            while True:
+                message = ForwardMsg()
+                message.ParseFromString(websocket.recv(timeout))
+                kind = message.WhichOneof("type")
+                if kind == "page_not_found":
+                    result["failure"] = "page %s not found" % page
+                    return result
+                if kind == "script_finished":
+                    status = message.script_finished
+                    if status == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                        continue
+                    if status != ForwardMsg.FINISHED_SUCCESSFULLY:
+                        result["failure"] = "script finished with %s" % ForwardMsg.ScriptFinishedStatus.Name(status)
+                    elif pending:
+                        result["failure"] = "widgets not found: %s" % ", ".join(pending)
+                    elif result["rejected"] is None:
+                        result["seconds"] = time.perf_counter() - start
+                    return result
+                if kind != "delta" or message.delta.WhichOneof("type") != "new_element":
+                    continue
+                element = message.delta.new_element
+                kind = element.WhichOneof("type")
+                widget = getattr(element, kind)
+                if kind == "exception":
+                    result["failure"] = "%s: %s" % (widget.type, widget.message)
+                    return result
+                if kind == "alert" and widget.format == Alert.ERROR:
+                    result["failure"] = widget.body
+                    return result
+                if kind == "alert" and widget.format == Alert.WARNING:
+                    # the pages only warn when the service is busy
+                    result["rejected"] = widget.body
+                if kind in OUTPUT_ELEMENTS and not pending and result["first_output_seconds"] is None:
+                    result["first_output_seconds"] = time.perf_counter() - start
+                label = getattr(widget, "label", None)
+                if label in pending:
+                    states[widget.id] = widget_state(kind, widget, pending.pop(label))
+                    start = rerun(websocket)
+    except TimeoutError:
+        result["failure"] = "no message for %g seconds" % timeout
+    except OSError as error:
+        result["failure"] = "connection failed: %s" % error
+    except Exception as error:
+        # closed connections and protocol errors of websockets
+        result["failure"] = "%s: %s" % (type(error).__name__, error)
+    return result
+
+
+def session_plan(pages, scenarios, sessions, random_seed):
+    '''The page, scenario and widget values of every session.
+
+    Sessions go round-robin over the scenarios of every page, and each one
+    gets its own random seed.
+
+    Args:
+        pages: page names, keys of PAGES.
+        scenarios: scenario names, the ones a page lacks are skipped.
+        sessions: amount of sessions.
+        random_seed: random seed of the first session.
+
+    Returns:
+        plan: list of (page, scenario, values) tuples.
+    '''
+    mix = [(page, scenario) for page in pages for scenario in scenarios if scenario in SCENARIOS[page]]
+    if not mix:
+        raise ValueError("none of the scenarios %s exists for the pages %s" % (scenarios, pages))
+    plan = []
+    for index in range(sessions):
+        page, scenario = mix[index % len(mix)]
+        values = dict(SCENARIOS[page][scenario], **{"Random seed": random_seed + index})
+        plan.append((page, scenario, values))
+    return plan
+
+
+def percentiles(seconds):
+    '''p50, p95 and p99 of a list of times, None for an empty list.'''
+    if not seconds:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def summarize(sessions):
+    '''Time-to-render percentiles and failures of a group of sessions.
+
+    Args:
+        sessions: session results of run_session(), with their page and scenario.
+
+    Returns:
+        summary: dict of the amount of sessions, failures and rejected
+            sessions, the percentiles and the maximum of the time-to-render
+            of the rendered ones.
+    '''
+    seconds = [session["seconds"] for session in sessions if session["seconds"] is not None]
+    first = [session["first_output_seconds"] for session in sessions
+             if session["first_output_seconds"] is not None]
+    failures = sum(session["failure"] is not None for session in sessions)
+    rejected = sum(session["rejected"] is not None for session in sessions)
+    return dict(
+        sessions=len(sessions),
+        failures=failures,
+        rejected=rejected,
+        # a session turned away did not get its page either
+        failure_rate=(failures + rejected) / len(sessions) if sessions else 0.0,
+        max=max(seconds) if seconds else None,
+        first_output_p50=percentiles(first)["p50"],
+        **percentiles(seconds))
+
+
+def load_test(url, plan, concurrency, timeout, pid=None):
+    '''Running the sessions of a plan, concurrency of them at a time.
+
+    Args:
+        url: base url of the server.
+        plan: sessions returned by session_plan().
+        concurrency: amount of sessions open at the same time.
+        timeout: seconds a session waits for any message before failing.
+        pid: process of the server whose CPU and memory are measured, None
+            to skip them.
+
+    Returns:
+        report: dict of the "server" measures, the "groups" summary of every
+            page and scenario with the "all" summary, and every "session".
+    '''
+    monitor = ProcessTreeMonitor(pid) if pid is not None else None
+    if monitor is not None:
+        monitor.start()
+    start = time.perf_counter()
+
+    def session(task):
+        page, scenario, values = task
+        result = run_session(url, PAGES[page], values, timeout)
+        return dict(result, page=page, scenario=scenario, random_seed=values["Random seed"])
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        sessions = list(executor.map(session, plan))
+    seconds = time.perf_counter() - start
+    server = monitor.stop() if monitor is not None else {}
+    groups = {}
+    for result in sessions:
+        groups.setdefault("%s/%s" % (result["page"], result["scenario"]), []).append(result)
+    summaries = [dict(name=name, **summarize(group)) for name, group in groups.items()]
+    summaries.append(dict(name="all", **summarize(sessions)))
+    return {
+        "server": dict(server, seconds=seconds, sessions_per_minute=60 * len(sessions) / seconds),
+        "groups": summaries,
+        "sessions": sessions,
+    }
+
+
+def print_report(report, file=sys.stderr):
+    '''Printing the summaries of a load test as a table.'''
+    def number(value, unit=""):
+        return "-" if value is None else "%.2f%s" % (value, unit)
+
+    print("%-32s %8s %8s %8s %8s %8s %8s %8s" % (
+        "page/scenario", "sessions", "failures", "rejected", "p50", "p95", "p99", "max"), file=file)
+    for group in report["groups"]:
+        print("%-32s %8d %8d %8d %8s %8s %8s %8s" % (
+            group["name"], group["sessions"], group["failures"], group["rejected"], number(group["p50"], "s"),
+            number(group["p95"], "s"), number(group["p99"], "s"), number(group["max"], "s")), file=file)
+    server = report["server"]
+    if server.get("cpu_seconds") is not None:
+        print("server: %.1f CPU seconds (%.0f%% of a core), peak RSS %.0f MB, %.1f sessions per minute" % (
+            server["cpu_seconds"], server["cpu_percent"], server["peak_rss_bytes"] / 2 ** 20,
+            server["sessions_per_minute"]), file=file)
+    for result in report["sessions"]:
+        if result["failure"] is not None:
+            print("failed %s/%s (random seed %d): %s" % (
+                result["page"], result["scenario"], result["random_seed"], result["failure"]), file=file)
+
+
+def gate(report, max_p95=None, max_failure_rate=None):
+    '''Checking a load test against the limits of a deploy.
+
+    Args:
+        report: report returned by load_test().
+        max_p95: largest allowed p95 time-to-render of any group in seconds,
+            None for no limit.
+        max_failure_rate: largest allowed share of failed or rejected
+            sessions of any group, None for no limit.
+
+    Returns:
+        violations: descriptions of the exceeded limits.
+    '''
+    violations = []
+    for group in report["groups"]:
+        if max_p95 is not None and group["p95"] is not None and group["p95"] > max_p95:
+            violations.append("%s: p95 %.2fs > %.2fs" % (group["name"], group["p95"], max_p95))
+        if max_failure_rate is not None and group["failure_rate"] > max_failure_rate:
+            violations.append("%s: failure rate %.2f > %.2f" % (
+                group["name"], group["failure_rate"], max_failure_rate))
+    return violations
+
+
+def main(argv=None):
+    '''Running the load test and writing the report as JSON.
+
+    Args:
+        argv: command line arguments, sys.argv by default.
+    '''
+    parser = argparse.ArgumentParser(
+        prog="python -m evosim.loadtest", description="Load test the Streamlit pages.")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument("--scenarios", nargs="+",
+                        choices=sorted({name for scenarios in SCENARIOS.values() for name in scenarios}),
+                        default=["default", "animation", "islands", "ensemble", "max"],
+                        help="widget values of the sessions, the ones a page lacks are skipped")
+    parser.add_argument("--sessions", type=int, default=20, help="total amount of sessions")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions open at the same time")
+    parser.add_argument("--timeout", type=float, default=600.0,
+                        help="seconds a session waits for any message before it fails")
+    parser.add_argument("--url", default=None,
+                        help="load test a running server instead of starting one, such as http://localhost:8501")
+    parser.add_argument("--server-pid", type=int, default=None,
+                        help="process of the --url server, to measure its CPU and memory")
+    parser.add_argument("--random-seed", type=int, default=0, help="random seed of the first session")
+    parser.add_argument("--output", default=None, help="write the JSON report to this path")
+    parser.add_argument("--max-p95", type=float, default=None,
+                        help="fail when the p95 time-to-render of a page and scenario exceeds this many seconds")
+    parser.add_argument("--max-failure-rate", type=float, default=None,
+                        help="fail when the share of failed or rejected sessions of a page and scenario "
+                             "exceeds this")
+    args = parser.parse_args(argv)
+
+    plan = session_plan(args.pages, args.scenarios, args.sessions, args.random_seed)
+    if args.url is not None:
+        report = load_test(args.url, plan, args.concurrency, args.timeout, args.server_pid)
+    else:
+        with local_server() as (url, pid):
+            report = load_test(url, plan, args.concurrency, args.timeout, pid)
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    report["settings"] = {name: value for name, value in vars(args).items() if name != "output"}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    print_report(report)
+    violations = gate(report, args.max_p95, args.max_failure_rate)
+    for violation in violations:
+        print("REGRESSION %s" % violation, file=sys.stderr)
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
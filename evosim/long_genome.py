@@ -0,0 +1,390 @@
+'''Natural selection of long genomes, from thousands to millions of digits.
+
+Genomes are packed two digits per byte, only the mutated loci of every
+offspring are drawn and touched, and the distance from the target is updated
+from the changed loci instead of being recomputed over the whole genome.
+'''
+
+import hashlib
+
+import numpy as np
+
+from evosim.natural_selection import (
+    NaturalSelectionGeneration,
+    NaturalSelectionSim,
+    mutate_digits,
+)
+
+MAX_SAMPLE_CELLS = 2**22
+DENSE_MUTATION_RATE = 0.4
+MAX_MUTATED_LOCI = 2**23
+
+
+def code_from_text(text):
+    '''Reading a 'DNA' code of any length, ignoring white space.
+
+    Args:
+        text: str or bytes of digits, such as the content of an uploaded file.
+
+    Returns:
+        digits: uint8 array of the digits.
+    '''
+    if isinstance(text, str):
+        text = text.encode("ascii", errors="replace")
+    raw = np.frombuffer(bytes(text), dtype=np.uint8)
+    raw = raw[~np.isin(raw, np.frombuffer(b" \t\r\n", dtype=np.uint8))]
+    digits = raw - ord('0')
+    if digits.size == 0 or digits.max() > 9:
+        raise ValueError("a 'DNA' code must only contain the digits 0-9")
+    return digits
+
+
+def random_code(length, rng=None):
+    '''Generating a random 'DNA' code.
+
+    Args:
+        length: amount of digits.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        digits: uint8 array of uniformly random digits.
+    '''
+    rng = np.random.default_rng(rng)
+    return rng.integers(0, 10, length, dtype=np.uint8)
+
+
+def random_codes(length, random_seed):
+    '''Generating a random seed and target code, reproducible from a random seed.
+
+    Args:
+        length: amount of digits of every code.
+        random_seed: seed of the random number generator.
+
+    Returns:
+        seed: uint8 array of the seed digits.
+        target: uint8 array of the target digits.
+    '''
+    rng = np.random.default_rng([random_seed, length])
+    return random_code(length, rng), random_code(length, rng)
+
+
+def code_digest(digits):
+    '''Short identifier of a long 'DNA' code, used instead of the code itself.
+
+    Args:
+        digits: uint8 array of the digits.
+
+    Returns:
+        digest: string with the length and a hash of the digits.
+    '''
+    return "%s digits, sha1 %s" % (len(digits), hashlib.sha1(digits.tobytes()).hexdigest()[:16])
+
+
+def pack_digits(digits):
+    '''Packing digits two per byte, the even loci in the low half of every byte.
+
+    Args:
+        digits: uint8 array of shape (..., loci).
+
+    Returns:
+        packed: uint8 array of shape (..., ceil(loci / 2)).
+    '''
+    digits = np.asarray(digits, dtype=np.uint8)
+    if digits.shape[-1] % 2:
+        padding = np.zeros(digits.shape[:-1] + (1,), dtype=np.uint8)
+        digits = np.concatenate([digits, padding], axis=-1)
+    return digits[..., 0::2] | (digits[..., 1::2] << 4)
+
+
+def unpack_digits(packed, length):
+    '''Unpacking digits packed by pack_digits.
+
+    Args:
+        packed: uint8 array of shape (..., ceil(length / 2)).
+        length: amount of loci.
+
+    Returns:
+        digits: uint8 array of shape (..., length).
+    '''
+    digits = np.empty(packed.shape[:-1] + (2 * packed.shape[-1],), dtype=np.uint8)
+    digits[..., 0::2] = packed & 15
+    digits[..., 1::2] = packed >> 4
+    return digits[..., :length]
+
+
+def packed_digits(packed, rows, loci):
+    '''Reading single digits out of packed genomes.
+
+    Args:
+        packed: uint8 array of packed genomes, one per row.
+        rows: row of every digit to read.
+        loci: locus of every digit to read.
+
+    Returns:
+        digits: uint8 array of the digits.
+    '''
+    return (packed[rows, loci >> 1] >> ((loci & 1) << 2).astype(np.uint8)) & 15
+
+
+def write_packed_digits(packed, rows, loci, digits):
+    '''Writing single digits into packed genomes, in place.
+
+    Args:
+        packed: uint8 array of packed genomes, one per row.
+        rows: row of every digit to write.
+        loci: locus of every digit to write, unique per row.
+        digits: the new digits.
+    '''
+    # the two halves of a byte are written in separate passes
+    for half in (0, 1):
+        mask = (loci & 1) == half
+        columns = loci[mask] >> 1
+        shift = np.uint8(4 * half)
+        keep = np.uint8(0xF0 if half == 0 else 0x0F)
+        packed[rows[mask], columns] = (
+           (packed[rows[mask], columns] & keep) | (digits[mask].astype(np.uint8) << shift))
+
+
+def sample_loci(number_of_offsprings, length, mutation_rate_digit, rng, max_cells=MAX_SAMPLE_CELLS):
+    '''Drawing the mutated loci of every mutated offspring.
+
+    Every locus mutates with the same chance, so the gaps between mutated 
+    loci are geometric: drawing the gaps touches only the mutated loci, and 
+    the amount of loci per offspring is binomial. From DENSE_MUTATION_RATE 
+    on, drawing a chance for every locus is faster. The offsprings are drawn 
+    a chunk of rows at a time, so the draws hold about max_cells values.
+
+    Args:
+        number_of_offsprings: amount of offsprings going under mutation.
+        length: amount of loci in a genome.
+        mutation_rate_digit: the chance for every locus to go under mutation.
+        rng: numpy random Generator.
+        max_cells: amount of random values drawn at once.
+
+    Returns:
+        owners: offspring of every mutated locus, in increasing order.
+        loci: the mutated loci, increasing within every offspring.
+    '''
+    if number_of_offsprings == 0 or mutation_rate_digit <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    dense = mutation_rate_digit >= DENSE_MUTATION_RATE
+    expected = length * mutation_rate_digit
+    draws = int(expected + 6 * np.sqrt(expected) + 10)
+    rows = max(1, max_cells // (length if dense else draws))
+    owners, loci = [], []
+    for start in range(0, number_of_offsprings, rows):
+        count = min(rows, number_of_offsprings - start)
+        if dense:
+            chunk_owners, chunk_loci = np.nonzero(rng.random((count, length)) < mutation_rate_digit)
+        else:
+            chunk_owners, chunk_loci = sparse_loci(count, length, mutation_rate_digit, draws, rng)
+        owners.append(chunk_owners + start)
+        loci.append(chunk_loci)
+    return np.concatenate(owners), np.concatenate(loci)
+
+
+def sparse_loci(number_of_offsprings, length, mutation_rate_digit, draws, rng):
+    '''Drawing the mutated loci of offsprings from geometric gaps, see sample_loci.'''
+    loci = np.cumsum(rng.geometric(mutation_rate_digit, (number_of_offsprings, draws)), axis=1) - 1
+    # rarely the gaps of an offspring do not reach the end of the genome
+    short = np.flatnonzero(loci[:, -1] < length)
+    while short.size:
+        more = loci[short, -1:] + np.cumsum(rng.geometric(mutation_rate_digit, (short.size, draws)), axis=1)
+        loci = np.concatenate([loci, np.full((number_of_offsprings, draws), length)], axis=1)
+        loci[short, -draws:] = more
+        short = short[loci[short, -1] < length]
+    owners, columns = np.nonzero(loci < length)
+    return owners, loci[owners, columns]
+
+
+def max_mutation_rate_digit(number_of_offsprings, mutation_rate_offspring, length,
+                            max_loci=MAX_MUTATED_LOCI):
+    '''Highest chance of mutation per locus keeping the mutated loci of a generation bounded.
+
+    Args:
+        number_of_offsprings: expected amount of offsprings of a generation.
+        mutation_rate_offspring: the chance for an offspring to go through mutation.
+        length: amount of loci in a genome.
+        max_loci: maximal expected amount of mutated loci of a generation.
+
+    Returns:
+        rate: highest mutation_rate_digit, at most 1.
+    '''
+    mutated = number_of_offsprings * mutation_rate_offspring * length
+    return 1.0 if mutated <= max_loci else max_loci / mutated
+
+
+class LongGenomeGeneration(NaturalSelectionGeneration):
+    '''Snapshot of a long genome generation, without the offspring genomes.
+
+    Args:
+        generation: generation number, starting from 0.
+        scores: distance of every offspring genotype from the target.
+        counts: amount of offsprings with every genotype.
+        best_offspring: first digits of the best offspring, None if there
+            are no offsprings.
+        best_score: distance of the best offspring from the target, None
+            if there are no offsprings.
+        stop_reason: why the run stopped after this generation, None if it
+            continues.
+    '''
+
+    def __init__(self, generation, scores, counts, best_offspring, best_score, stop_reason=None):
+        super().__init__(generation, None, scores, best_offspring, best_score, stop_reason, counts)
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the record arrays.'''
+        return self.scores.nbytes + self.counts.nbytes
+
+    def summary(self):
+        '''Summary statistics of the generation.
+
+        Returns:
+            summary: dict of the generation number, amount of offsprings,
+                best (minimal), mean and maximal distance, amount of
+                offspring genotypes and the stop reason.
+        '''
+        number_of_offsprings = int(self.counts.sum())
+        return {
+            "generation": self.generation,
+            "offsprings": number_of_offsprings,
+            "best_offspring": self.best_offspring,
+            "best_score": self.best_score,
+            "mean_score": float(np.average(self.scores, weights=self.counts)) if number_of_offsprings else None,
+            "max_score": int(self.scores.max()) if number_of_offsprings else None,
+            "unique_genotypes": len(self.scores),
+            "stop_reason": self.stop_reason,
+        }
+
+
+class LongGenomeSim(NaturalSelectionSim):
+    '''Natural selection simulation of long genomes.
+
+    Follows the same model as NaturalSelectionSim. Parents are stored as
+    unique packed genotypes with counts, as in ClonalNaturalSelectionSim.
+    Only the mutated loci of every mutated offspring are drawn, read and 
+    written, and the distance of every offspring
+    is its parent's distance plus the change at those loci. Mutated offsprings
+    are treated as distinct genotypes, even in the rare case that two of them
+    end up identical.
+
+    Args:
+        seed: 'DNA' code of the original parent, a digit string or an array
+            of digits.
+        target: 'DNA' code which best fits the environment, of the same length.
+        Other arguments are the same as for NaturalSelectionSim.
+    '''
+
+    preview_digits = 20
+    state_attributes = NaturalSelectionSim.state_attributes + ("parent_counts", "parent_scores")
+
+    def __init__(self, seed, target, average_number_of_offsprings=1.2,
+                 number_of_parents=200, mutation_rate_offspring=0.05,
+                 mutation_rate_digit=0.1, mutation_rate_digit_up=0.5,
+                 mutation_rate_digit_up_plus=1.0, mutation_rate_digit_down_minus=1.0,
+                 random_seed=None, timer=None, selection="truncation", tournament_size=2,
+                 elite_fraction=0.1):
+        seed = code_from_text(seed) if isinstance(seed, (str, bytes)) else np.asarray(seed, dtype=np.uint8)
+        target = code_from_text(target) if isinstance(target, (str, bytes)) else np.asarray(target, dtype=np.uint8)
+        if len(seed) != len(target):
+            raise ValueError("seed and target must have the same length")
+        self.seed_digits = seed
+        self.target_digits = target
+        self.length = len(seed)
+        # seed and target are replaced by their digests below
+        super().__init__(
+           "0", "0", average_number_of_offsprings, number_of_parents,
+           mutation_rate_offspring, mutation_rate_digit, mutation_rate_digit_up,
+           mutation_rate_digit_up_plus, mutation_rate_digit_down_minus, random_seed, timer,
+           selection, tournament_size, elite_fraction)
+        self.seed = code_digest(seed)
+        self.target = code_digest(target)
+        self.initial_score = int(np.abs(seed.astype(np.int16) - target).sum())
+        self.best_score = self.best_score_ever = self.initial_score
+        self.parent_scores = np.array([self.initial_score], dtype=np.int64)
+
+    def initial_parents(self):
+        '''Building the parents of the first generation, a single packed genotype.'''
+        self.parent_counts = np.array([self.number_of_parents], dtype=np.int64)
+        return pack_digits(self.seed_digits[None, :])
+
+    def best_code(self):
+        '''First digits of the best parent, as a short string.'''
+        digits = unpack_digits(self.parents[0, :self.preview_digits // 2], self.preview_digits)
+        code = (digits[:self.length] + ord('0')).tobytes().decode("ascii")
+        return code + "..." if self.length > self.preview_digits else code
+
+    def step(self):
+        '''Generating, scoring and selecting a single generation.
+
+        Returns:
+            record: LongGenomeGeneration of the generated offsprings.
+        '''
+        self.timer.generation = self.generation
+        with self.timer.phase("mutate"):
+            number_of_offsprings = self.rng.poisson(
+               self.average_number_of_offsprings * self.parent_counts)
+            number_of_mutants = self.rng.binomial(number_of_offsprings, self.mutation_rate_offspring)
+            mutant_parents = np.repeat(np.arange(len(self.parents)), number_of_mutants)
+            owners, loci = sample_loci(
+               mutant_parents.size, self.length, self.mutation_rate_digit, self.rng)
+            # mutants without mutated loci are copies of their parent
+            changed = np.unique(owners)
+            copies = number_of_offsprings - np.bincount(
+               mutant_parents[changed], minlength=len(self.parents))
+            mutant_parents = mutant_parents[changed]
+            owners = np.searchsorted(changed, owners)
+            old_digits = packed_digits(self.parents, mutant_parents[owners], loci)
+            new_digits = mutate_digits(
+               old_digits,
+               self.mutation_rate_digit_up,
+               self.mutation_rate_digit_up_plus,
+               self.mutation_rate_digit_down_minus,
+               self.rng)
+        with self.timer.phase("score"):
+            target = self.target_digits[loci].astype(np.int16)
+            change = (np.abs(new_digits.astype(np.int16) - target)
+                      - np.abs(old_digits.astype(np.int16) - target))
+            mutant_scores = self.parent_scores[mutant_parents] + np.bincount(
+               owners, weights=change, minlength=mutant_parents.size).astype(np.int64)
+            copied = np.flatnonzero(copies > 0)
+            scores = np.concatenate([self.parent_scores[copied], mutant_scores])
+            counts = np.concatenate([copies[copied], np.ones(mutant_parents.size, dtype=np.int64)])
+        self.timer.count("offsprings", int(counts.sum()))
+        self.timer.count("genotypes", len(counts))
+        self.timer.count("mutated_loci", len(loci))
+        if counts.sum() == 0:
+            self.parents = self.parents[:0]
+            self.done = True
+            self.stop_reason = "extinct"
+            record = LongGenomeGeneration(
+               self.generation, scores, counts, None, None, self.stop_reason)
+            self.generation += 1
+            return record
+        with self.timer.phase("select"):
+            selected, self.parent_counts = self.select_parents(scores, counts)
+            sources = np.concatenate([copied, mutant_parents])[selected]
+            parents = self.parents[sources]
+            # write the mutated loci of the selected mutants into their copies
+            row_of_mutant = np.full(mutant_parents.size, -1)
+            selected_mutants = selected[selected >= copied.size] - copied.size
+            row_of_mutant[selected_mutants] = np.flatnonzero(selected >= copied.size)
+            written = row_of_mutant[owners] >= 0
+            write_packed_digits(
+               parents, row_of_mutant[owners][written], loci[written], new_digits[written])
+            self.parents = parents
+            self.parent_scores = scores[selected]
+            self.best_score = int(self.parent_scores[0])
+        if self.best_score < self.best_score_ever:
+            self.best_score_ever = self.best_score
+            self.generations_without_improvement = 0
+        else:
+            self.generations_without_improvement += 1
+        if self.best_score == 0:
+            self.done = True
+            self.stop_reason = "target reached"
+        record = LongGenomeGeneration(
+           self.generation, scores, counts, self.best_code(), self.best_score, self.stop_reason)
+        self.generation += 1
+        return record
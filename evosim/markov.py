@@ -0,0 +1,353 @@
+'''Deterministic (infinite population) approximation of the natural selection model.
+
+The mutation rules of mutate_genomes define a fixed 10x10 Markov kernel per
+digit. Instead of sampling offsprings, the distribution of the parents is
+propagated through that kernel, and truncation selection keeps the closest
+fraction of the offspring distance distribution. The result is the expected
+trajectory of an infinite population, computed without any random numbers.
+'''
+
+import numpy as np
+
+from evosim.natural_selection import genomes_from_codes
+
+EXACT_MAX_DIGITS = 5
+APPROXIMATE_MAX_DIGITS = 50
+PREVIEW_MAX_GENERATIONS = 500
+STATIONARY_CHANGE = 1e-12
+MAX_PERIOD = 2
+
+
+def mutation_kernel(mutation_rate_digit, mutation_rate_digit_up,
+                    mutation_rate_digit_up_plus, mutation_rate_digit_down_minus):
+    '''Building the transition matrix of a digit in an offspring going through mutation.
+
+    Follows the rules of mutate_genomes: '9' always mutates to '8', '0' always
+    mutates to '1', and jumps past '9' or '0' stop at the edge.
+
+    Args:
+        mutation_rate_digit: the chance for every digit to go under mutation.
+        mutation_rate_digit_up: for a digit which is going under mutation,
+            this is the chance for it to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits.
+
+    Returns:
+        kernel: 10x10 array, kernel[a, b] is the chance of digit a to become b.
+    '''
+    mutation = np.zeros((10, 10))
+    mutation[0, 1] = 1.0
+    mutation[9, 8] = 1.0
+    for digit in range(1, 9):
+        up = mutation_rate_digit_up
+        down = 1 - mutation_rate_digit_up
+        mutation[digit, min(digit + 1, 9)] += up * mutation_rate_digit_up_plus
+        mutation[digit, min(digit + 2, 9)] += up * (1 - mutation_rate_digit_up_plus)
+        mutation[digit, max(digit - 1, 0)] += down * mutation_rate_digit_down_minus
+        mutation[digit, max(digit - 2, 0)] += down * (1 - mutation_rate_digit_down_minus)
+    return (1 - mutation_rate_digit) * np.eye(10) + mutation_rate_digit * mutation
+
+
+def truncation_weights(distances, kept):
+    '''Fraction of the offsprings at every distance kept by truncation selection.
+
+    Args:
+        distances: distribution of the offspring distances from the target.
+        kept: fraction of the offsprings selected, the closest first.
+
+    Returns:
+        weights: kept fraction at every distance, partial at the threshold.
+    '''
+    below = np.concatenate([[0.0], np.cumsum(distances)[:-1]])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.clip((kept - below) / distances, 0, 1)
+    weights[distances == 0] = 0
+    return weights
+
+
+def total_distance(locus_distances, size):
+    '''Distribution of the sum of independent per-locus distances.
+
+    Args:
+        locus_distances: array of shape (loci, 10), the distance distribution
+            of every locus.
+        size: length of the resulting distributions, at least 9*loci+1.
+
+    Returns:
+        total: distribution of the total distance, of length size.
+        others: array of shape (loci, size), the distribution of the total
+            distance of all loci except each one.
+    '''
+    spectra = np.fft.rfft(locus_distances, size, axis=1)
+    ones = np.ones((1, spectra.shape[1]), dtype=spectra.dtype)
+    before = np.cumprod(np.vstack([ones, spectra[:-1]]), axis=0)
+    after = np.cumprod(np.vstack([ones, spectra[:0:-1]]), axis=0)[::-1]
+    total = np.fft.irfft(before[-1] * spectra[-1], size)
+    others = np.fft.irfft(before * after, size, axis=1)
+    return np.clip(total, 0, None), np.clip(others, 0, None)
+
+
+class ExpectedGeneration:
+    '''Expected statistics of a single natural selection generation.
+
+    Args:
+        generation: generation number, starting from 0.
+        distances: distribution of the offspring distances from the target.
+        number_of_offsprings: expected amount of offsprings.
+        target_probability: chance that the target was reached by this generation.
+    '''
+
+    def __init__(self, generation, distances, number_of_offsprings, target_probability):
+        self.generation = generation
+        self.distances = distances
+        self.number_of_offsprings = number_of_offsprings
+        self.target_probability = target_probability
+
+    @property
+    def mean_score(self):
+        '''Expected mean distance of the offsprings.'''
+        return float(np.arange(len(self.distances)) @ self.distances)
+
+    @property
+    def best_score(self):
+        '''Expected distance of the best out of number_of_offsprings independent offsprings.'''
+        above = np.clip(1 - np.cumsum(self.distances), 0, 1)
+        return float((above ** self.number_of_offsprings).sum())
+
+    def summary(self):
+        '''Summary statistics of the generation, named as NaturalSelectionGeneration.summary.
+
+        Returns:
+            summary: dict of the generation number, expected best and mean
+                distance and the chance that the target was reached.
+        '''
+        return {
+            "generation": self.generation,
+            "best_score": self.best_score,
+            "mean_score": self.mean_score,
+            "target_probability": self.target_probability,
+        }
+
+
+class ExpectedNaturalSelection:
+    '''Infinite population model of NaturalSelectionSim.
+
+    Every generation the parent distribution goes through the mutation 
+    kernel, mixing offsprings with and without mutation, and truncation 
+    selection keeps the 1/average_number_of_offsprings closest fraction of 
+    the offsprings, splitting ties proportionally.
+
+    The exact model keeps the chance of every possible code, 10**digits 
+    values, and applies the kernel to one digit axis at a time. Longer codes 
+    keep the digit distribution of every locus only, assuming loci are 
+    independent. That approximation recombines improvements found in 
+    different offsprings, so it reaches the target faster than the asexual 
+    model and should only be used for previews. Its cost grows with the
+    square of the amount of digits, previews stop at APPROXIMATE_MAX_DIGITS.
+
+    The finite population only enters through the amount of offsprings per 
+    generation, used for the expected best distance and the chance to reach 
+    the target. A finite population is slower than the infinite one, which 
+    contains every improvement from the first generation.
+
+    Once the distance distribution is within STATIONARY_CHANGE of the one 
+    of one or MAX_PERIOD generations before, mutation and selection are 
+    balanced: the next generations repeat the same distances, a mutation of 
+    every digit alternates between odd and even distances, and the run 
+    stops if the target cannot be reached within max_generations at that rate.
+
+    Args:
+        seed: 'DNA' code of the original parent.
+        target: 'DNA' code which best fits the environment.
+        average_number_of_offsprings: Poisson rate of offsprings per parent.
+        number_of_parents: amount of parents selected for every generation.
+        mutation_rate_offspring: the chance for an offspring to go through mutation.
+        mutation_rate_digit: for an offspring who is going under mutation,
+            this is the chance for every digit to go under mutation.
+        mutation_rate_digit_up: for a digit which is going under mutation,
+            this is the chance for it to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits.
+        exact: whether to keep the chance of every code, by default for codes 
+            of up to EXACT_MAX_DIGITS digits.
+    '''
+
+    def __init__(self, seed, target, average_number_of_offsprings=1.2,
+                 number_of_parents=200, mutation_rate_offspring=0.05,
+                 mutation_rate_digit=0.1, mutation_rate_digit_up=0.5,
+                 mutation_rate_digit_up_plus=1.0, mutation_rate_digit_down_minus=1.0, 
+                 exact=None):
+        if not seed.isdigit() or not target.isdigit() or len(seed) != len(target):
+            raise ValueError("seed and target must be digit strings of the same length")
+        self.seed = seed
+        self.target = target
+        self.average_number_of_offsprings = average_number_of_offsprings
+        self.number_of_parents = number_of_parents
+        self.mutation_rate_offspring = mutation_rate_offspring
+        self.kernel = mutation_kernel(
+           mutation_rate_digit, mutation_rate_digit_up,
+           mutation_rate_digit_up_plus, mutation_rate_digit_down_minus)
+        self.exact = len(seed) <= EXACT_MAX_DIGITS if exact is None else exact
+
+        number_of_digits = len(seed)
+        self.size = 9 * number_of_digits + 1
+        digits = np.arange(10)
+        target_digits = genomes_from_codes([target])[0]
+        self.locus_distance = np.abs(digits - target_digits[:, None])
+        if self.exact:
+            # distance of every code, codes are indexed by their digits in base 10
+            distance = np.zeros((10,) * number_of_digits, dtype=np.int64)
+            for locus in range(number_of_digits):
+                shape = [1] * number_of_digits
+                shape[locus] = 10
+                distance = distance + self.locus_distance[locus].reshape(shape)
+            self.distance = distance.reshape(-1)
+            self.parents = np.zeros(10 ** number_of_digits)
+            self.parents[int(seed)] = 1.0
+        else:
+            # distance_of[locus, digit, d] is 1 if the digit is d away from the target
+            self.distance_of = (self.locus_distance[:, :, None] == digits).astype(float)
+            self.parents = np.eye(10)[genomes_from_codes([seed])[0]]
+        self.generation = 0
+        self.not_reached = 1.0
+        self.history = []
+        self.cycle = None
+
+    @property
+    def number_of_offsprings(self):
+        '''Expected amount of offsprings in every generation.'''
+        return self.average_number_of_offsprings * self.number_of_parents
+
+    @property
+    def kept(self):
+        '''Fraction of the offsprings selected as parents.'''
+        return min(1.0, 1 / self.average_number_of_offsprings)
+
+    @property
+    def stationary(self):
+        '''Whether the next generations repeat the distances of the last ones.'''
+        return self.cycle is not None
+
+    def step_exact(self):
+        '''Mutating and selecting the chance of every code.
+
+        Returns:
+            distances: distribution of the offspring distances from the target.
+        '''
+        mutated = self.parents.reshape((10,) * len(self.seed))
+        for _ in range(len(self.seed)):
+            # contracts the first axis and appends the mutated one as the last
+            mutated = np.tensordot(mutated, self.kernel, axes=([0], [0]))
+        rate = self.mutation_rate_offspring
+        offspring = (1 - rate) * self.parents + rate * mutated.reshape(-1)
+        distances = np.bincount(self.distance, weights=offspring, minlength=self.size)
+        parents = offspring * truncation_weights(distances, self.kept)[self.distance]
+        self.parents = parents / parents.sum()
+        return distances
+
+    def step_independent(self):
+        '''Mutating and selecting the digit distribution of every locus.
+
+        Returns:
+            distances: distribution of the offspring distances from the target.
+        '''
+        rate = self.mutation_rate_offspring
+        mutated = self.parents @ self.kernel
+        unchanged_total, unchanged_others = total_distance(
+           np.einsum("lv,lvd->ld", self.parents, self.distance_of), self.size)
+        mutated_total, mutated_others = total_distance(
+           np.einsum("lv,lvd->ld", mutated, self.distance_of), self.size)
+        distances = (1 - rate) * unchanged_total + rate * mutated_total
+        distances /= distances.sum()
+
+        weight = truncation_weights(distances, self.kept)
+        # shifted[k, e] = weight[k + e], the kept fraction at distance k + e
+        padded = np.concatenate([weight, np.zeros(10)])
+        shifted = padded[np.arange(self.size)[:, None] + np.arange(10)]
+        loci = np.arange(len(self.parents))[:, None]
+        unchanged_kept = (unchanged_others @ shifted)[loci, self.locus_distance]
+        mutated_kept = (mutated_others @ shifted)[loci, self.locus_distance]
+        parents = (1 - rate) * self.parents * unchanged_kept + rate * mutated * mutated_kept
+        self.parents = parents / parents.sum(axis=1, keepdims=True)
+        return distances
+
+    def step(self):
+        '''Mutating and selecting a single generation.
+
+        Returns:
+            record: ExpectedGeneration of the offsprings.
+        '''
+        if self.stationary:
+            distances = self.cycle.pop(0)
+            self.cycle.append(distances)
+        else:
+            distances = self.step_exact() if self.exact else self.step_independent()
+            for period in range(1, len(self.history) + 1):
+                if np.abs(distances - self.history[-period]).max() < STATIONARY_CHANGE:
+                    # the distances of the next generations, in order
+                    self.cycle = self.history[len(self.history) - period + 1:] + [distances]
+                    break
+            self.history = (self.history + [distances])[-MAX_PERIOD:]
+        self.not_reached *= (1 - distances[0]) ** self.number_of_offsprings
+        record = ExpectedGeneration(
+           self.generation, distances, self.number_of_offsprings, 1 - self.not_reached)
+        self.generation += 1
+        return record
+
+    def reachable(self, max_generations, tolerance=1e-3):
+        '''Whether the target may be reached within max_generations at the current rate.
+
+        Args:
+            max_generations: total amount of generations.
+            tolerance: highest chance that the target was not reached.
+
+        Returns:
+            reachable: whether the chance that the target was not reached by
+                max_generations falls below tolerance, repeating the last distances.
+        '''
+        if not self.stationary:
+            return True
+        rate = np.prod([(1 - distances[0]) ** self.number_of_offsprings for distances in self.cycle])
+        cycles = (max_generations - self.generation) / len(self.cycle)
+        return self.not_reached * rate ** cycles < tolerance
+
+    def run(self, max_generations, tolerance=1e-3):
+        '''Running generations until the target is almost surely reached.
+
+        Args:
+            max_generations: stop after this total amount of generations.
+            tolerance: stop once the chance that the target was not reached
+                is below this value.
+
+        Yields:
+            record: ExpectedGeneration of every generation, until the
+                distances are stationary and the target cannot be reached.
+        '''
+        if self.number_of_parents == 0:
+            return
+        while self.generation < max_generations and self.not_reached >= tolerance:
+            yield self.step()
+            if self.stationary and not self.reachable(max_generations, tolerance):
+                return
+
+
+def expected_time_to_target(records, tolerance=1e-2):
+    '''Expected generations until the target is reached, from the chance per generation.
+
+    Args:
+        records: list of ExpectedGeneration, from the first generation.
+        tolerance: highest chance that the target was not reached by the
+            last record, above it the expectation is unknown.
+
+    Returns:
+        generations: expected amount of generations, None if the target may
+            not be reached within the records.
+    '''
+    if not records or records[-1].target_probability < 1 - tolerance:
+        return None
+    reached = np.array([record.target_probability for record in records])
+    return float(1 + (1 - reached).sum())
@@ -0,0 +1,850 @@
+'''Natural selection model: mutation, scoring and selection of 'DNA' codes.'''
+
+import time
+
+import numpy as np
+
+from evosim.instrumentation import PhaseTimer
+
+
+def genomes_from_codes(codes):
+    '''Converting 'DNA' code strings into a genome matrix.
+
+    Args:
+        codes: list of equal length digit strings.
+
+    Returns:
+        genomes: int8 array of shape (len(codes), number of digits).
+    '''
+    codes = list(codes)
+    if not codes:
+        return np.zeros((0, 0), dtype=np.int8)
+    raw = np.frombuffer("".join(codes).encode("ascii"), dtype=np.uint8)
+    return (raw - ord('0')).astype(np.int8).reshape(len(codes), -1)
+
+
+def genomes_to_codes(genomes):
+    '''Converting a genome matrix back into 'DNA' code strings.
+
+    Args:
+        genomes: int8 array of shape (offsprings, digits).
+
+    Returns:
+        codes: list of digit strings, one per row.
+    '''
+    genomes = np.asarray(genomes, dtype=np.uint8)
+    if genomes.size == 0:
+        return [''] * len(genomes)
+    raw = (genomes + ord('0')).tobytes().decode("ascii")
+    width = genomes.shape[1]
+    return [raw[i:i + width] for i in range(0, len(raw), width)]
+
+
+def mutate_genomes(genomes, mutation_rate_offspring, 
+                   mutation_rate_digit, mutation_rate_digit_up, 
+                   mutation_rate_digit_up_plus, 
+                   mutation_rate_digit_down_minus, rng=None):
+    '''Applying random mutations to a whole generation at once.
+
+    Follows the same per-offspring, per-digit, up/down and +-1/+-2 rules as 
+    the original digit by digit loop: '9' always mutates to '8', '0' always 
+    mutates to '1', '8' can only go up by one and '1' can only go down by one.
+
+    Args:
+        genomes: int8 array of shape (offsprings, digits), copies of the parents.
+        mutation_rate_offspring: the chance for an offspring to go through mutation.
+        mutation_rate_digit: for an offspring who is going under mutation, 
+            this is the chance for every digit to go under mutation.
+        mutation_rate_digit_up: for a digit which is going under mutation,
+            this is the chance for it to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits. 
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        mutated: new int8 genome matrix of the same shape.
+    '''
+    rng = np.random.default_rng(rng)
+    mutated = np.array(genomes, dtype=np.int8, copy=True)
+    if mutated.size == 0:
+        return mutated
+    number_of_offsprings, number_of_digits = mutated.shape
+    mutant_rows = np.flatnonzero(
+       rng.random(number_of_offsprings) < mutation_rate_offspring)
+    if mutant_rows.size == 0:
+        return mutated
+    digit_mask = rng.random((mutant_rows.size, number_of_digits)) < mutation_rate_digit
+    rows, cols = np.nonzero(digit_mask)
+    rows = mutant_rows[rows]
+    if rows.size == 0:
+        return mutated
+
+    mutated[rows, cols] = mutate_digits(
+       mutated[rows, cols], 
+       mutation_rate_digit_up, 
+       mutation_rate_digit_up_plus, 
+       mutation_rate_digit_down_minus, 
+       rng)
+    return mutated
+
+
+def mutate_digits(digits, mutation_rate_digit_up, mutation_rate_digit_up_plus, 
+                  mutation_rate_digit_down_minus, rng=None):
+    '''Mutating digits which were chosen for mutation.
+
+    '9' always mutates to '8', '0' always mutates to '1', '8' can only go up 
+    by one and '1' can only go down by one.
+
+    Args:
+        digits: integer array of the digits going under mutation.
+        mutation_rate_digit_up: the chance for every digit to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits. 
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        mutated: array of the new digits, of the same shape and type.
+    '''
+    rng = np.random.default_rng(rng)
+    up = rng.random(digits.size) < mutation_rate_digit_up
+    jump_up = np.where(rng.random(digits.size) < mutation_rate_digit_up_plus, 1, 2)
+    jump_down = np.where(rng.random(digits.size) < mutation_rate_digit_down_minus, 1, 2)
+    new_digits = np.clip(digits + np.where(up, jump_up, -jump_down), 0, 9).astype(digits.dtype)
+    new_digits[digits == 9] = 8
+    new_digits[digits == 0] = 1
+    return new_digits
+
+
+def generate_offspring(seed, mutation_rate_offspring, 
+                       mutation_rate_digit, mutation_rate_digit_up, 
+                       mutation_rate_digit_up_plus, 
+                       mutation_rate_digit_down_minus, number_of_offsprings, rng=None):
+    '''Generating offsprings per parent with random mutations.
+
+    Args:
+        seed: parent 'DNA' code, either a digit string or a genome matrix 
+            with one row per parent.
+        mutation_rate_offspring: the chance for an offspring to go through mutation.
+        mutation_rate_digit: for an offspring who is going under mutation, 
+            this is the chance for every digit to go under mutation.
+        mutation_rate_digit_up: for a digit which is going under mutation,
+            this is the chance for it to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits. 
+        number_of_offsprings: amount of offsprings to generate for this parent,
+            or an array with the amount for every row of a genome matrix.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        offspring: the list of offsprings codes for a string seed, otherwise 
+            the int8 genome matrix of all offsprings.
+    '''
+    as_codes = isinstance(seed, str)
+    parents = genomes_from_codes([seed]) if as_codes else np.asarray(seed, dtype=np.int8)
+    parents = np.repeat(parents, number_of_offsprings, axis=0)
+    offspring = mutate_genomes(
+       parents, 
+       mutation_rate_offspring, 
+       mutation_rate_digit, 
+       mutation_rate_digit_up, 
+       mutation_rate_digit_up_plus, 
+       mutation_rate_digit_down_minus, 
+       rng)
+    if as_codes:
+        return genomes_to_codes(offspring)
+    return offspring
+
+def calculate_score(offspring, target):
+    '''Computing the distance from each of the offsprings to the target seed.
+
+    Args:
+        offspring: genome matrix, or list of offsprings codes.
+        target: target sequence.
+
+    Returns:
+        scores: int array of distances.
+    '''
+    if not isinstance(offspring, np.ndarray):
+        offspring = genomes_from_codes(offspring)
+    target = genomes_from_codes([target])[0]
+    if offspring.size == 0:
+        return np.zeros(len(offspring), dtype=np.int64)
+    return np.abs(offspring.astype(np.int16) - target).sum(axis=1, dtype=np.int64)
+
+
+def select_best(scores, number_of_parents, rng=None):
+    '''Selecting the offsprings closest to the target as the next parents.
+
+    Uses a partial selection instead of a full sort, and breaks ties between 
+    equal distances at random so that equally fit offsprings get an equal 
+    chance to survive.
+
+    Args:
+        scores: array of distances per offspring.
+        number_of_parents: amount of parents to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        selected: indices of the kept offsprings, ordered from the closest.
+    '''
+    rng = np.random.default_rng(rng)
+    scores = np.asarray(scores)
+    order = rng.permutation(len(scores))
+    shuffled = scores[order]
+    if number_of_parents < len(scores):
+        kept = np.argpartition(shuffled, number_of_parents)[:number_of_parents]
+    else:
+        kept = np.arange(len(scores))
+    kept = kept[np.argsort(shuffled[kept], kind="stable")]
+    return order[kept]
+
+
+def unique_genomes(genomes, counts):
+    '''Merging identical rows of a genome matrix and adding up their counts.
+
+    Args:
+        genomes: int8 array of shape (rows, digits).
+        counts: amount of individuals with every row.
+
+    Returns:
+        genomes: int8 array of the unique rows.
+        counts: amount of individuals with every unique row.
+    '''
+    genomes = np.ascontiguousarray(genomes, dtype=np.int8)
+    if len(genomes) == 0:
+        return genomes, np.zeros(0, dtype=np.int64)
+    rows = genomes.view(np.dtype((np.void, genomes.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    return genomes[first], np.bincount(inverse.ravel(), weights=counts).astype(np.int64)
+
+
+def select_best_counts(scores, counts, number_of_parents, rng=None):
+    '''Selecting the closest individuals of a population stored as unique genotypes.
+
+    Gives the same result as select_best on the expanded population: all 
+    individuals closer than the threshold distance are kept, and the 
+    remaining places are drawn at random among the individuals at the 
+    threshold distance.
+
+    Args:
+        scores: array of distances per unique genotype.
+        counts: amount of individuals with every genotype.
+        number_of_parents: amount of individuals to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    rng = np.random.default_rng(rng)
+    scores = np.asarray(scores)
+    counts = np.asarray(counts, dtype=np.int64)
+    order = rng.permutation(len(scores))
+    order = order[np.argsort(scores[order], kind="stable")]
+    kept = counts.copy()
+    if counts.sum() > number_of_parents:
+        cumulative = np.cumsum(counts[order])
+        threshold = scores[order[np.searchsorted(cumulative, number_of_parents)]]
+        kept[scores > threshold] = 0
+        ties = np.flatnonzero(scores == threshold)
+        remaining = number_of_parents - counts[scores < threshold].sum()
+        kept[ties] = rng.multivariate_hypergeometric(counts[ties], remaining)
+    selected = order[kept[order] > 0]
+    return selected, kept[selected]
+
+
+def ordered_selection(scores, kept):
+    '''Listing the selected genotypes from the closest.
+
+    Args:
+        scores: array of distances per genotype.
+        kept: amount of kept individuals of every genotype.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    selected = np.flatnonzero(kept)
+    selected = selected[np.argsort(scores[selected], kind="stable")]
+    return selected, kept[selected]
+
+
+def truncation_selection(scores, counts, number_of_parents, rng=None):
+    '''Keeping the individuals closest to the target, see select_best.
+
+    Args:
+        scores: array of distances per genotype.
+        counts: amount of individuals with every genotype, None if every 
+            genotype is a single individual.
+        number_of_parents: amount of individuals to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    if counts is None:
+        selected = select_best(scores, number_of_parents, rng)
+        return selected, np.ones(len(selected), dtype=np.int64)
+    return select_best_counts(scores, counts, number_of_parents, rng)
+
+
+def tournament_selection(scores, counts, number_of_parents, rng=None, tournament_size=2):
+    '''Keeping the closest of tournament_size individuals drawn at random, 
+    once for every parent.
+
+    Individuals may win several tournaments, so they may be kept several 
+    times. Takes O(n + k log k) for n genotypes and k parents.
+
+    Args:
+        scores: array of distances per genotype.
+        counts: amount of individuals with every genotype, None if every 
+            genotype is a single individual.
+        number_of_parents: amount of individuals to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+        tournament_size: amount of individuals of every tournament, 1 draws 
+            the parents at random.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    rng = np.random.default_rng(rng)
+    scores = np.asarray(scores)
+    total = len(scores) if counts is None else int(np.sum(counts))
+    number_of_parents = min(number_of_parents, total)
+    contestants = rng.integers(0, total, (number_of_parents, tournament_size))
+    if counts is not None:
+        # the individuals of a genotype are consecutive
+        contestants = np.searchsorted(np.cumsum(counts), contestants, side="right")
+    winners = contestants[np.arange(number_of_parents), np.argmin(scores[contestants], axis=1)]
+    return ordered_selection(scores, np.bincount(winners, minlength=len(scores)))
+
+
+def fitness_proportional_selection(scores, counts, number_of_parents, rng=None):
+    '''Drawing parents with a chance proportional to their fitness.
+
+    The fitness of an individual is how much closer to the target it is 
+    than the farthest offspring, plus one. The parents are drawn by 
+    stochastic universal sampling: number_of_parents equally spaced 
+    pointers, with a single random offset, over the cumulative fitness. 
+    Takes O(n + k log k) for n genotypes and k parents.
+
+    Args:
+        scores: array of distances per genotype.
+        counts: amount of individuals with every genotype, None if every 
+            genotype is a single individual.
+        number_of_parents: amount of individuals to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    rng = np.random.default_rng(rng)
+    scores = np.asarray(scores)
+    total = len(scores) if counts is None else int(np.sum(counts))
+    number_of_parents = min(number_of_parents, total)
+    fitness = (scores.max() - scores + 1).astype(np.float64)
+    if counts is not None:
+        fitness *= counts
+    cumulative = np.cumsum(fitness)
+    spacing = cumulative[-1] / number_of_parents
+    # amount of pointers below the cumulative fitness of every genotype
+    pointers = np.ceil((cumulative - rng.random() * spacing) / spacing)
+    pointers = np.clip(pointers, 0, number_of_parents).astype(np.int64)
+    return ordered_selection(scores, np.diff(pointers, prepend=0))
+
+
+def elitism_selection(scores, counts, number_of_parents, rng=None, elite_fraction=0.1):
+    '''Keeping a share of the individuals closest to the target, and 
+    individuals drawn at random among the others.
+
+    Takes O(n + k log k) for n individuals and k parents, populations stored 
+    as genotypes with counts sort their genotypes.
+
+    Args:
+        scores: array of distances per genotype.
+        counts: amount of individuals with every genotype, None if every 
+            genotype is a single individual.
+        number_of_parents: amount of individuals to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+        elite_fraction: share of the parents kept by truncation selection.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    rng = np.random.default_rng(rng)
+    scores = np.asarray(scores)
+    total = len(scores) if counts is None else int(np.sum(counts))
+    number_of_parents = min(number_of_parents, total)
+    elite = int(round(elite_fraction * number_of_parents))
+    selected, elite_kept = truncation_selection(scores, counts, elite, rng)
+    if counts is None:
+        others = np.ones(len(scores), dtype=bool)
+        others[selected] = False
+        drawn = rng.choice(np.flatnonzero(others), number_of_parents - elite, replace=False)
+        kept = np.bincount(drawn, minlength=len(scores))
+    else:
+        others = np.array(counts, dtype=np.int64)
+        others[selected] -= elite_kept
+        kept = rng.multivariate_hypergeometric(others, number_of_parents - elite)
+    kept[selected] += elite_kept
+    return ordered_selection(scores, kept)
+
+
+SELECTION_STRATEGIES = {
+    "truncation": truncation_selection,
+    "tournament": tournament_selection,
+    "fitness proportional": fitness_proportional_selection,
+    "elitism": elitism_selection,
+}
+
+
+def select_parents(selection, scores, counts, number_of_parents, rng=None, 
+                   tournament_size=2, elite_fraction=0.1):
+    '''Selecting the next parents with one of SELECTION_STRATEGIES.
+
+    Args:
+        selection: name of the strategy, one of SELECTION_STRATEGIES.
+        scores: array of distances per genotype.
+        counts: amount of individuals with every genotype, None if every 
+            genotype is a single individual.
+        number_of_parents: amount of individuals to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+        tournament_size: amount of individuals of every tournament, for 
+            tournament selection.
+        elite_fraction: share of the parents kept by truncation selection, 
+            for elitism selection.
+
+    Returns:
+        selected: indices of the genotypes with kept individuals, ordered 
+            from the closest.
+        kept: amount of kept individuals of every selected genotype.
+    '''
+    if selection == "tournament":
+        return tournament_selection(scores, counts, number_of_parents, rng, tournament_size)
+    if selection == "elitism":
+        return elitism_selection(scores, counts, number_of_parents, rng, elite_fraction)
+    if selection not in SELECTION_STRATEGIES:
+        raise ValueError("unknown selection %r, expected one of %s" 
+                         % (selection, ", ".join(SELECTION_STRATEGIES)))
+    return SELECTION_STRATEGIES[selection](scores, counts, number_of_parents, rng)
+
+
+class NaturalSelectionGeneration:
+    '''Snapshot of a single natural selection generation.
+
+    Args:
+        generation: generation number, starting from 0.
+        offspring: genome matrix of all offsprings in this generation.
+        scores: distance of every offspring from the target.
+        best_offspring: code of the offspring closest to the target, None 
+            if there are no offsprings.
+        best_score: distance of the best offspring from the target, None 
+            if there are no offsprings.
+        stop_reason: why the run stopped after this generation, None if it 
+            continues. See NaturalSelectionSim.run.
+        counts: amount of offsprings with every row of offspring, None if 
+            every row is a single offspring.
+    '''
+
+    def __init__(self, generation, offspring, scores, best_offspring, best_score, 
+                 stop_reason=None, counts=None):
+        self.generation = generation
+        self.offspring = offspring
+        self.scores = scores
+        self.best_offspring = best_offspring
+        self.best_score = best_score
+        self.stop_reason = stop_reason
+        self.counts = counts
+
+    @property
+    def nbytes(self):
+        '''Approximate memory held by the record arrays.'''
+        counts_nbytes = 0 if self.counts is None else self.counts.nbytes
+        return self.offspring.nbytes + self.scores.nbytes + counts_nbytes
+
+    @property
+    def offspring_scores(self):
+        '''Distance of every single offspring, repeating the scores by their counts.'''
+        if self.counts is None:
+            return self.scores
+        return np.repeat(self.scores, self.counts)
+
+    def summary(self):
+        '''Summary statistics of the generation.
+
+        Returns:
+            summary: dict of the generation number, amount of offsprings, 
+                best (minimal), mean and maximal distance, amount of 
+                unique genotypes and the stop reason.
+        '''
+        if self.counts is None:
+            number_of_offsprings = len(self.offspring)
+        else:
+            number_of_offsprings = int(self.counts.sum())
+        if number_of_offsprings and self.counts is not None:
+            unique_genotypes = len(self.offspring)
+            mean_score = float(np.average(self.scores, weights=self.counts))
+            max_score = int(self.scores.max())
+        elif number_of_offsprings:
+            rows = np.ascontiguousarray(self.offspring).view(
+               np.dtype((np.void, self.offspring.shape[1])))
+            unique_genotypes = len(np.unique(rows))
+            mean_score = float(self.scores.mean())
+            max_score = int(self.scores.max())
+        else:
+            unique_genotypes = 0
+            mean_score = max_score = None
+        return {
+            "generation": self.generation,
+            "offsprings": number_of_offsprings,
+            "best_offspring": self.best_offspring,
+            "best_score": self.best_score,
+            "mean_score": mean_score,
+            "max_score": max_score,
+            "unique_genotypes": unique_genotypes,
+            "stop_reason": self.stop_reason,
+        }
+
+
+class NaturalSelectionSim:
+    '''Natural selection simulation, from a seed 'DNA' code towards a target.
+
+    Every generation each parent has a Poisson distributed amount of mutated 
+    offsprings, and the offsprings closest to the target become the parents 
+    of the next generation. The simulation is done once the target is reached, 
+    or once no offsprings are born (extinction).
+
+    Args:
+        seed: 'DNA' code of the original parent.
+        target: 'DNA' code which best fits the environment.
+        average_number_of_offsprings: Poisson rate of offsprings per parent.
+        number_of_parents: amount of parents selected for every generation.
+        mutation_rate_offspring: the chance for an offspring to go through mutation.
+        mutation_rate_digit: for an offspring who is going under mutation, 
+            this is the chance for every digit to go under mutation.
+        mutation_rate_digit_up: for a digit which is going under mutation,
+            this is the chance for it to go up over down.
+        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
+            this is the chance to go up in +1 over +2 digits.
+        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
+            this is the chance to go down in -1 over -2 digits. 
+        random_seed: seed of the random number generator, None for a random run.
+        timer: PhaseTimer measuring the "mutate", "score" and "select" phases,
+            and counting "offsprings" (and "genotypes" when stored with counts).
+        selection: how the next parents are chosen among the offsprings, 
+            one of SELECTION_STRATEGIES.
+        tournament_size: amount of offsprings of every tournament, for 
+            tournament selection.
+        elite_fraction: share of the parents kept by truncation selection, 
+            for elitism selection.
+    '''
+
+    state_attributes = ("parents", "generation", "best_score", "best_score_ever", 
+                        "generations_without_improvement", "done", "stop_reason")
+
+    def __init__(self, seed, target, average_number_of_offsprings=1.2, 
+                 number_of_parents=200, mutation_rate_offspring=0.05, 
+                 mutation_rate_digit=0.1, mutation_rate_digit_up=0.5, 
+                 mutation_rate_digit_up_plus=1.0, mutation_rate_digit_down_minus=1.0, 
+                 random_seed=None, timer=None, selection="truncation", tournament_size=2, 
+                 elite_fraction=0.1):
+        if not seed.isdigit() or not target.isdigit() or len(seed) != len(target):
+            raise ValueError("seed and target must be digit strings of the same length")
+        if selection not in SELECTION_STRATEGIES:
+            raise ValueError("unknown selection %r, expected one of %s" 
+                             % (selection, ", ".join(SELECTION_STRATEGIES)))
+        self.seed = seed
+        self.target = target
+        self.average_number_of_offsprings = average_number_of_offsprings
+        self.number_of_parents = number_of_parents
+        self.mutation_rate_offspring = mutation_rate_offspring
+        self.mutation_rate_digit = mutation_rate_digit
+        self.mutation_rate_digit_up = mutation_rate_digit_up
+        self.mutation_rate_digit_up_plus = mutation_rate_digit_up_plus
+        self.mutation_rate_digit_down_minus = mutation_rate_digit_down_minus
+        self.selection = selection
+        self.tournament_size = tournament_size
+        self.elite_fraction = elite_fraction
+        self.random_seed = random_seed
+        self.rng = np.random.default_rng(random_seed)
+        self.timer = timer if timer is not None else PhaseTimer()
+
+        self.initial_score = int(calculate_score([seed], target)[0])
+        self.parents = self.initial_parents()
+        self.generation = 0
+        self.best_score = self.initial_score
+        self.best_score_ever = self.initial_score
+        self.generations_without_improvement = 0
+        self.done = False
+        self.stop_reason = None
+
+    @property
+    def parameters(self):
+        '''Parameters which fully determine the simulation, including the random seed.'''
+        return {
+            "seed": self.seed,
+            "target": self.target,
+            "average_number_of_offsprings": self.average_number_of_offsprings,
+            "number_of_parents": self.number_of_parents,
+            "mutation_rate_offspring": self.mutation_rate_offspring,
+            "mutation_rate_digit": self.mutation_rate_digit,
+            "mutation_rate_digit_up": self.mutation_rate_digit_up,
+            "mutation_rate_digit_up_plus": self.mutation_rate_digit_up_plus,
+            "mutation_rate_digit_down_minus": self.mutation_rate_digit_down_minus,
+            "selection": self.selection,
+            "tournament_size": self.tournament_size,
+            "elite_fraction": self.elite_fraction,
+            "random_seed": self.random_seed,
+        }
+
+    def select_parents(self, scores, counts):
+        '''Selecting the next parents with the selection strategy of the simulation.
+
+        Args:
+            scores: distance of every genotype from the target.
+            counts: amount of offsprings with every genotype, None if every 
+                genotype is a single offspring.
+
+        Returns:
+            selected: indices of the genotypes with kept individuals, ordered 
+                from the closest.
+            kept: amount of kept individuals of every selected genotype.
+        '''
+        return select_parents(
+           self.selection, scores, counts, self.number_of_parents, self.rng, 
+           self.tournament_size, self.elite_fraction)
+
+    def state(self):
+        '''Snapshot of everything which changes from one generation to the next.
+
+        Returns:
+            state: dict of the population, the generation counters and the
+                state of the random number generator, see restore().
+        '''
+        state = {}
+        for name in self.state_attributes:
+            value = getattr(self, name)
+            state[name] = value.copy() if isinstance(value, np.ndarray) else value
+        state["rng"] = self.rng.bit_generator.state
+        return state
+
+    def restore(self, state):
+        '''Continuing from a snapshot taken with state(), by a simulation
+        with the same parameters.
+
+        Args:
+            state: dict returned by state().
+        '''
+        for name in self.state_attributes:
+            setattr(self, name, state[name])
+        self.rng.bit_generator.state = state["rng"]
+
+    def initial_parents(self):
+        '''Building the parents of the first generation, copies of the seed.'''
+        return genomes_from_codes([self.seed] * self.number_of_parents)
+
+    def breed(self):
+        '''Generating the mutated offsprings of the current parents.
+
+        Returns:
+            offspring: genome matrix of the offsprings.
+            counts: None, every row is a single offspring.
+        '''
+        number_of_offsprings = self.rng.poisson(
+           self.average_number_of_offsprings, len(self.parents))
+        offspring = generate_offspring(
+           self.parents, 
+           self.mutation_rate_offspring, 
+           self.mutation_rate_digit, 
+           self.mutation_rate_digit_up, 
+           self.mutation_rate_digit_up_plus, 
+           self.mutation_rate_digit_down_minus, 
+           number_of_offsprings, 
+           self.rng)
+        return offspring, None
+
+    def score(self, offspring):
+        '''Computing the distance of the offsprings from the target.
+
+        Args:
+            offspring: genome matrix returned by breed.
+
+        Returns:
+            scores: distance of every row of offspring from the target.
+        '''
+        return calculate_score(offspring, self.target)
+
+    def select(self, offspring, scores, counts):
+        '''Selecting the next parents among the offsprings, see select_parents.
+
+        Args:
+            offspring: genome matrix returned by breed.
+            scores: distance of every row of offspring from the target.
+            counts: counts returned by breed.
+
+        Returns:
+            best_score: distance of the best selected offspring.
+        '''
+        selected, kept = self.select_parents(scores, counts)
+        # parents drawn several times are repeated
+        self.parents = np.repeat(offspring[selected], kept, axis=0)
+        return int(scores[selected[0]])
+
+    def step(self):
+        '''Generating, scoring and selecting a single generation.
+
+        Returns:
+            record: NaturalSelectionGeneration of the generated offsprings.
+        '''
+        self.timer.generation = self.generation
+        with self.timer.phase("mutate"):
+            offspring, counts = self.breed()
+        if counts is None:
+            self.timer.count("offsprings", len(offspring))
+        else:
+            self.timer.count("offsprings", int(counts.sum()))
+            self.timer.count("genotypes", len(offspring))
+        if len(offspring) == 0:
+            self.parents = offspring
+            self.done = True
+            self.stop_reason = "extinct"
+            record = NaturalSelectionGeneration(
+               self.generation, offspring, np.zeros(0, dtype=int), None, None, 
+               self.stop_reason, counts)
+            self.generation += 1
+            return record
+        with self.timer.phase("score"):
+            scores = self.score(offspring)
+        with self.timer.phase("select"):
+            self.best_score = self.select(offspring, scores, counts)
+        if self.best_score < self.best_score_ever:
+            self.best_score_ever = self.best_score
+            self.generations_without_improvement = 0
+        else:
+            self.generations_without_improvement += 1
+        if self.best_score == 0:
+            self.done = True
+            self.stop_reason = "target reached"
+        record = NaturalSelectionGeneration(
+           self.generation, offspring, scores, 
+           genomes_to_codes(self.parents[:1])[0], self.best_score, self.stop_reason, counts)
+        self.generation += 1
+        return record
+
+    def run(self, max_generations=None, max_seconds=None, plateau_generations=None):
+        '''Running generations until the target is reached or a limit is hit.
+
+        The reason the run stopped is kept in stop_reason, and on the last 
+        record: "target reached", "extinct" (no offsprings were born), 
+        "max generations", "time limit" or "plateau" (the best distance did 
+        not improve for plateau_generations generations).
+
+        Args:
+            max_generations: stop after this total amount of generations, 
+                None for no limit.
+            max_seconds: stop once the generations of this run took this 
+                long to compute, None for no limit. Time spent by the caller 
+                between generations, such as drawing frames, is not counted.
+            plateau_generations: stop once the best distance did not improve 
+                for this amount of generations, None for no limit.
+
+        Yields:
+            record: NaturalSelectionGeneration of every generation.
+        '''
+        if self.done:
+            return
+        self.stop_reason = None
+        if max_generations is not None and self.generation >= max_generations:
+            self.stop_reason = "max generations"
+        elapsed = 0.0
+        while self.stop_reason is None:
+            start = time.perf_counter()
+            record = self.step()
+            elapsed += time.perf_counter() - start
+            if not self.done:
+                if max_generations is not None and self.generation >= max_generations:
+                    self.stop_reason = "max generations"
+                elif plateau_generations and self.generations_without_improvement >= plateau_generations:
+                    self.stop_reason = "plateau"
+                elif max_seconds is not None and elapsed >= max_seconds:
+                    self.stop_reason = "time limit"
+                record.stop_reason = self.stop_reason
+            yield record
+
+
+class ClonalNaturalSelectionSim(NaturalSelectionSim):
+    '''Natural selection simulation storing the population as unique genotypes with counts.
+
+    Follows the same model as NaturalSelectionSim, but identical parents are 
+    kept once with the amount of copies. The offsprings of every genotype are 
+    drawn in bulk (a Poisson amount, of which a binomial amount goes through 
+    mutation), only the mutants are mutated one by one, and every unique 
+    genotype is scored once. Memory and time grow with the genetic diversity 
+    instead of the population size, so large populations with low mutation 
+    rates are cheap. The records hold the unique offsprings with their counts.
+
+    Takes the same arguments as NaturalSelectionSim. parents holds the unique 
+    parent genotypes, ordered from the closest, and parent_counts the amount 
+    of parents with every genotype.
+    '''
+
+    state_attributes = NaturalSelectionSim.state_attributes + ("parent_counts",)
+
+    def initial_parents(self):
+        '''Building the parents of the first generation, a single genotype.'''
+        self.parent_counts = np.array([self.number_of_parents], dtype=np.int64)
+        return genomes_from_codes([self.seed])
+
+    def breed(self):
+        '''Generating the offsprings of every parent genotype in bulk.
+
+        Returns:
+            offspring: genome matrix of the unique offsprings.
+            counts: amount of offsprings with every row of offspring.
+        '''
+        number_of_offsprings = self.rng.poisson(
+           self.average_number_of_offsprings * self.parent_counts)
+        number_of_mutants = self.rng.binomial(number_of_offsprings, self.mutation_rate_offspring)
+        mutants = mutate_genomes(
+           np.repeat(self.parents, number_of_mutants, axis=0), 
+           1.0, 
+           self.mutation_rate_digit, 
+           self.mutation_rate_digit_up, 
+           self.mutation_rate_digit_up_plus, 
+           self.mutation_rate_digit_down_minus, 
+           self.rng)
+        copies = number_of_offsprings - number_of_mutants
+        offspring = np.concatenate([self.parents, mutants])
+        counts = np.concatenate([copies, np.ones(len(mutants), dtype=np.int64)])
+        return unique_genomes(offspring[counts > 0], counts[counts > 0])
+
+    def select(self, offspring, scores, counts):
+        '''Selecting the next parents among the individuals, see select_parents.
+
+        Args:
+            offspring: unique genotypes returned by breed.
+            scores: distance of every genotype from the target.
+            counts: amount of offsprings with every genotype.
+
+        Returns:
+            best_score: distance of the best selected genotype.
+        '''
+        selected, self.parent_counts = self.select_parents(scores, counts)
+        self.parents = offspring[selected]
+        return int(scores[selected[0]])
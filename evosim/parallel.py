@@ -0,0 +1,412 @@
+'''Natural selection of a single large population on several cores.
+
+Every generation the parents are split into chunks, and worker processes
+compute the chunks in two passes over genome and distance buffers in shared
+memory:
+
+1. breed_chunk() generates and scores the offsprings of a chunk straight into
+   the offspring and score buffers, and returns how many of them are at every
+   distance from the target.
+2. Merging the counts of all chunks gives the distance of the last kept
+   offspring, how many offsprings of every chunk are kept at every distance,
+   and where they go in the parents buffer (selection_layout()). select_chunk()
+   then copies the kept offsprings of a chunk to the parents buffer, ordered
+   from the closest.
+
+The next parents are exactly the ones the selection over the whole population
+keeps: every offspring closer than the last distance, and a random draw among
+the offsprings at that distance. Only the chunk bounds, random generator
+states and counts per distance are sent between processes, never the genomes.
+The offsprings stay in the shared buffers, and the generation records hold
+the amount of offsprings at every distance instead (ParallelGeneration).
+
+Every chunk draws from its own random stream, so a run depends on the random
+seed and the amount of chunks, but not on the amount of workers.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import weakref
+
+import numpy as np
+
+from evosim.long_genome import LongGenomeGeneration
+from evosim.natural_selection import NaturalSelectionSim, calculate_score, generate_offspring
+from evosim.spawn import WorkerContext
+
+CHUNKS = 16
+GROWTH = 1.5
+
+# shared memory buffers attached by a worker process, by name
+_attached = {}
+
+
+def chunk_random_states(random_seed, chunks):
+    '''Independent random generator states of the chunks, derived from the seed of the run.
+
+    Args:
+        random_seed: seed of the run, None for a random run.
+        chunks: amount of chunks.
+
+    Returns:
+        states: list of the bit generator state of every chunk.
+    '''
+    if not isinstance(random_seed, np.random.SeedSequence):
+        random_seed = np.random.SeedSequence(random_seed)
+    return [np.random.PCG64(child).state for child in random_seed.spawn(chunks)]
+
+
+def chunk_generator(random_state):
+    '''Random Generator continuing from the bit generator state of a chunk.'''
+    rng = np.random.Generator(np.random.PCG64())
+    rng.bit_generator.state = random_state
+    return rng
+
+
+def breed_chunk(buffers, start, stop, offset, total, random_state, mutation_rates, target):
+    '''Generating and scoring the offsprings of a chunk of parents.
+
+    Args:
+        buffers: dict of the "parents", "offspring" and "scores" arrays.
+        start: first parent of the chunk.
+        stop: end of the parents of the chunk.
+        offset: row of the first offspring of the chunk in the offspring
+            and scores buffers.
+        total: amount of offsprings of the chunk, spread over its parents
+            at random.
+        random_state: bit generator state of the chunk.
+        mutation_rates: the five mutation rates of generate_offspring.
+        target: target 'DNA' code.
+
+    Returns:
+        histogram: amount of offsprings of the chunk at every distance.
+        random_state: bit generator state of the chunk after the pass.
+    '''
+    rng = chunk_generator(random_state)
+    parents = stop - start
+    # a Poisson total spread uniformly is a Poisson amount for every parent
+    counts = rng.multinomial(total, np.full(parents, 1 / parents)) if parents else np.zeros(0, int)
+    offspring = generate_offspring(buffers["parents"][start:stop], *mutation_rates, counts, rng)
+    scores = calculate_score(offspring, target)
+    buffers["offspring"][offset:offset + total] = offspring
+    buffers["scores"][offset:offset + total] = scores
+    return np.bincount(scores, minlength=9 * len(target) + 1), rng.bit_generator.state
+
+
+def selection_layout(histograms, number_of_parents, rng=None):
+    '''Merging the distances of the offsprings of all chunks into a selection.
+
+    Keeps the same offsprings as select_best over the whole population: all
+    offsprings closer than the threshold distance, and the remaining places
+    drawn at random among the offsprings at the threshold distance.
+
+    Args:
+        histograms: int array of shape (chunks, distances), the amount of
+            offsprings of every chunk at every distance.
+        number_of_parents: amount of parents to keep.
+        rng: numpy random Generator, a fresh unseeded one by default.
+
+    Returns:
+        kept: int array of shape (chunks, threshold + 1), the amount of kept
+            offsprings of every chunk at every distance up to the threshold.
+        starts: int array of the same shape, the first row of the parents
+            buffer of every chunk and distance. Parents are ordered by
+            distance, then by chunk.
+    '''
+    rng = np.random.default_rng(rng)
+    totals = histograms.sum(axis=0)
+    threshold = min(int(np.searchsorted(np.cumsum(totals), number_of_parents)), len(totals) - 1)
+    kept = histograms[:, :threshold + 1].copy()
+    remaining = number_of_parents - int(totals[:threshold].sum())
+    if remaining < totals[threshold]:
+        kept[:, threshold] = rng.multivariate_hypergeometric(histograms[:, threshold], remaining)
+    by_distance = kept.T.ravel()
+    starts = (np.cumsum(by_distance) - by_distance).reshape(threshold + 1, -1).T
+    return kept, starts
+
+
+def select_chunk(buffers, offset, end, kept, starts, random_state):
+    '''Copying the kept offsprings of a chunk to the parents buffer.
+
+    Args:
+        buffers: dict of the "parents", "offspring" and "scores" arrays.
+        offset: row of the first offspring of the chunk.
+        end: end of the offsprings of the chunk.
+        kept: amount of kept offsprings of the chunk at every distance up to
+            the threshold, see selection_layout().
+        starts: first row of the parents buffer of every distance.
+        random_state: bit generator state of the chunk.
+
+    Returns:
+        random_state: bit generator state of the chunk after the pass.
+    '''
+    rng = chunk_generator(random_state)
+    scores = buffers["scores"][offset:end]
+    threshold = len(kept) - 1
+    ties = np.flatnonzero(scores == threshold)
+    if kept[-1] < len(ties):
+        ties = np.sort(rng.choice(ties, kept[-1], replace=False))
+    rows = np.concatenate([np.flatnonzero(scores < threshold), ties])
+    distances = scores[rows]
+    if threshold <= np.iinfo(np.int16).max:
+        # numpy sorts 16 bit integers with a radix sort
+        distances = distances.astype(np.int16)
+    rows = rows[np.argsort(distances, kind="stable")]
+    # the rows of every distance are consecutive, and go to the start of their distance
+    destinations = np.repeat(starts - (np.cumsum(kept) - kept), kept) + np.arange(len(rows))
+    buffers["parents"][destinations] = buffers["offspring"][offset + rows]
+    return rng.bit_generator.state
+
+
+def _attach(name, shape, dtype):
+    if name not in _attached:
+        memory = shared_memory.SharedMemory(name=name)
+        _attached[name] = (memory, np.ndarray(shape, dtype, buffer=memory.buf))
+    return _attached[name][1]
+
+
+def _run_shared(function, specs, *arguments):
+    '''Worker task attaching the shared buffers, and running a pass on a chunk.'''
+    names = {name for name, _, _ in specs.values()}
+    for name in list(_attached):
+        # buffers replaced by larger ones are not used anymore
+        if name not in names:
+            memory, _ = _attached.pop(name)
+            memory.close()
+    buffers = {key: _attach(*spec) for key, spec in specs.items()}
+    return function(buffers, *arguments)
+
+
+def _release(memories):
+    for memory in memories.values():
+        memory.close()
+        memory.unlink()
+    memories.clear()
+
+
+class ParallelGeneration(LongGenomeGeneration):
+    '''Snapshot of a parallel natural selection generation, without the offspring genomes.
+
+    Args:
+        generation: generation number, starting from 0.
+        scores: every distance from the target with offsprings.
+        counts: amount of offsprings at every distance.
+        best_offspring: code of the offspring closest to the target, None
+            if there are no offsprings.
+        best_score: distance of the best offspring from the target, None
+            if there are no offsprings.
+        stop_reason: why the run stopped after this generation, None if it
+            continues.
+    '''
+
+    def summary(self):
+        '''Summary statistics of the generation.
+
+        Returns:
+            summary: same as for LongGenomeGeneration, with None unique
+                genotypes, the genomes stay on the workers.
+        '''
+        return dict(super().summary(), unique_genotypes=None)
+
+
+class ParallelNaturalSelectionSim(NaturalSelectionSim):
+    '''Natural selection simulation computing the generations of a single
+    population on several worker processes.
+
+    Follows the same model as NaturalSelectionSim, and is meant for
+    populations of hundreds of thousands of parents and more, where the
+    mutations and distances of a generation take much longer than sending
+    a chunk to a worker. The worker processes start with the first
+    generation, and are stopped at the end of a run or by close().
+
+    Only truncation selection runs on the workers, the other selection
+    strategies select among all offsprings in this process. The records are
+    ParallelGeneration, the offspring genomes stay in shared memory.
+
+    Takes the same arguments as NaturalSelectionSim, and:
+
+    Args:
+        chunks: amount of chunks the parents are split into every generation,
+            each with its own random stream.
+        workers: amount of worker processes, all cores by default, 1
+            computes the chunks in this process. Does not change the results.
+        timer: PhaseTimer measuring the "mutate" phase (generating and
+            scoring the offsprings of all chunks), the "score" phase and the
+            "select" phase, and counting "offsprings".
+    '''
+
+    state_attributes = NaturalSelectionSim.state_attributes + ("chunk_states",)
+
+    def __init__(self, seed, target, average_number_of_offsprings=1.2,
+                 number_of_parents=200, mutation_rate_offspring=0.05,
+                 mutation_rate_digit=0.1, mutation_rate_digit_up=0.5,
+                 mutation_rate_digit_up_plus=1.0, mutation_rate_digit_down_minus=1.0,
+                 random_seed=None, chunks=CHUNKS, workers=None, timer=None,
+                 selection="truncation", tournament_size=2, elite_fraction=0.1):
+        if chunks < 1:
+            raise ValueError("chunks must be positive")
+        self.chunks = chunks
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_states = chunk_random_states(random_seed, chunks)
+        self._buffers = {}
+        self._memories = {}
+        self._executor = None
+        self._parents = None
+        self._finalizer = weakref.finalize(self, _release, self._memories)
+        super().__init__(
+           seed, target, average_number_of_offsprings, number_of_parents,
+           mutation_rate_offspring, mutation_rate_digit, mutation_rate_digit_up,
+           mutation_rate_digit_up_plus, mutation_rate_digit_down_minus, random_seed, timer,
+           selection, tournament_size, elite_fraction)
+
+    @property
+    def parameters(self):
+        '''Parameters which fully determine the simulation, including the random seed.'''
+        return dict(super().parameters, chunks=self.chunks)
+
+    def buffer(self, key, rows, dtype, columns=None):
+        '''Buffer of at least rows rows, in shared memory with several workers.
+
+        Buffers grow geometrically and are reused by the next generations.
+
+        Args:
+            key: name of the buffer, such as "offspring".
+            rows: amount of rows needed.
+            dtype: numpy dtype of the buffer.
+            columns: amount of columns, None for a one dimensional buffer.
+
+        Returns:
+            buffer: numpy array of at least rows rows.
+        '''
+        current = self._buffers.get(key)
+        if current is not None and len(current) >= rows:
+            return current
+        capacity = max(rows, int(GROWTH * len(current)) if current is not None else 0, 1)
+        shape = (capacity,) if columns is None else (capacity, columns)
+        if self.workers == 1:
+            self._buffers[key] = np.empty(shape, dtype)
+            return self._buffers[key]
+        memory = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        if key in self._memories:
+            old = self._memories.pop(key)
+            old.close()
+            old.unlink()
+        self._memories[key] = memory
+        self._buffers[key] = np.ndarray(shape, dtype, buffer=memory.buf)
+        return self._buffers[key]
+
+    def run_chunks(self, function, tasks):
+        '''Running a pass on every chunk, on the worker processes with several workers.
+
+        Args:
+            function: breed_chunk or select_chunk.
+            tasks: tuple of the arguments of function after the buffers,
+                for every chunk.
+
+        Returns:
+            results: list of the results of function for every chunk.
+        '''
+        if self.workers == 1:
+            return [function(self._buffers, *task) for task in tasks]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, WorkerContext())
+        specs = {key: (self._memories[key].name, buffer.shape, buffer.dtype.str)
+                 for key, buffer in self._buffers.items()}
+        futures = [self._executor.submit(_run_shared, function, specs, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def breed(self):
+        '''Generating the mutated offsprings of the current parents, chunk by chunk.
+
+        Returns:
+            offspring: genome matrix of the offsprings, a view of the shared
+                buffer which the next generation overwrites.
+            counts: None, every row is a single offspring.
+        '''
+        number_of_parents = len(self.parents)
+        digits = len(self.seed)
+        parents = self.buffer("parents", self.number_of_parents, np.int8, digits)
+        if self.parents is not self._parents:
+            parents[:number_of_parents] = self.parents
+        bounds = np.linspace(0, number_of_parents, self.chunks + 1).astype(int)
+        totals = self.rng.poisson(self.average_number_of_offsprings * np.diff(bounds))
+        self._offsets = np.concatenate([[0], np.cumsum(totals)])
+        total = int(self._offsets[-1])
+        self.buffer("offspring", total, np.int8, digits)
+        self.buffer("scores", total, np.int64)
+
+        mutation_rates = (
+           self.mutation_rate_offspring,
+           self.mutation_rate_digit,
+           self.mutation_rate_digit_up,
+           self.mutation_rate_digit_up_plus,
+           self.mutation_rate_digit_down_minus)
+        results = self.run_chunks(breed_chunk, [
+           (int(bounds[chunk]), int(bounds[chunk + 1]), int(self._offsets[chunk]), int(totals[chunk]),
+            self.chunk_states[chunk], mutation_rates, self.target)
+           for chunk in range(self.chunks)])
+        self.chunk_states = [state for _, state in results]
+        self._histograms = np.array([histogram for histogram, _ in results])
+        return self._buffers["offspring"][:total], None
+
+    def score(self, offspring):
+        '''Distance of the offsprings from the target, a view of the buffer the chunks wrote.'''
+        return self._buffers["scores"][:len(offspring)]
+
+    def select(self, offspring, scores, counts):
+        '''Selecting the offsprings closest to the target as the next parents.
+
+        Args:
+            offspring: genome matrix returned by breed.
+            scores: distance of every row of offspring from the target.
+            counts: counts returned by breed.
+
+        Returns:
+            best_score: distance of the best selected offspring.
+        '''
+        if self.selection != "truncation":
+            return super().select(offspring, scores, counts)
+        kept, starts = selection_layout(self._histograms, self.number_of_parents, self.rng)
+        self.chunk_states = self.run_chunks(select_chunk, [
+           (int(self._offsets[chunk]), int(self._offsets[chunk + 1]), kept[chunk], starts[chunk],
+            self.chunk_states[chunk])
+           for chunk in range(self.chunks)])
+        self.parents = self._parents = self._buffers["parents"][:int(kept.sum())]
+        return int(np.flatnonzero(kept.sum(axis=0))[0])
+
+    def step(self):
+        '''Generating, scoring and selecting a single generation.
+
+        Returns:
+            record: ParallelGeneration of the generated offsprings.
+        '''
+        record = super().step()
+        # the record holds views of the shared buffers, only the distances are kept
+        histogram = self._histograms.sum(axis=0)
+        scores = np.flatnonzero(histogram)
+        return ParallelGeneration(
+           record.generation, scores, histogram[scores], record.best_offspring, record.best_score,
+           record.stop_reason)
+
+    def run(self, max_generations=None, max_seconds=None, plateau_generations=None):
+        '''Running generations like NaturalSelectionSim.run, stopping the
+        worker processes once the run ends.
+        '''
+        try:
+            yield from super().run(max_generations, max_seconds, plateau_generations)
+        finally:
+            self.close()
+
+    def close(self):
+        '''Stopping the worker processes and freeing the shared memory.
+
+        The next generation starts them again.
+        '''
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self._memories:
+            self.parents = np.array(self.parents, copy=True)
+            self._buffers.clear()
+            _release(self._memories)
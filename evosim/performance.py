@@ -0,0 +1,66 @@
+'''Sidebar "Performance" panel of the Streamlit pages.
+
+Not imported by ``evosim`` itself, as it needs Streamlit.
+'''
+
+import streamlit as st
+
+HELP_PERFORMANCE = "Shows the time spent in every phase of the simulation and of drawing \
+    the frames, per run and per generation, and the peak memory of the run. \
+    Tracing the memory slows the run down."
+HELP_PROFILE = "Captures a cProfile of the whole run, which slows it down further"
+
+
+def performance_options():
+    '''Sidebar options of the performance panel.
+
+    Returns:
+        show: whether to measure the run and show the panel.
+        profile: whether to capture a cProfile of the run.
+    '''
+    label_performance = "Performance panel"
+    show = st.sidebar.checkbox(label_performance, help=HELP_PERFORMANCE)
+    label_profile = "Profile the run (cProfile)"
+    profile = show and st.sidebar.checkbox(label_profile, help=HELP_PROFILE)
+    return show, profile
+
+
+def performance_panel(timer):
+    '''Showing what a PhaseTimer measured in the sidebar.
+
+    Args:
+        timer: PhaseTimer of the run, measured with timer.measure(memory=True).
+            The trajectory must not be replayed from the cache, so the
+            simulation phases are measured too.
+    '''
+    with st.sidebar.expander("Performance", expanded=True):
+        phases = timer.as_dict()
+        total = sum(phase["seconds"] for phase in phases.values())
+        st.dataframe([{
+            "phase": name,
+            "seconds": round(phase["seconds"], 4),
+            "calls": phase["calls"],
+            "ms per call": round(1000 * phase["seconds"] / phase["calls"], 3),
+            "share": "%.0f%%" % (100 * phase["seconds"] / total) if total else "",
+            "peak MB": round(phase.get("peak_bytes", 0) / 2**20, 2),
+        } for name, phase in phases.items()], hide_index=True)
+        if timer.run_peak_bytes is not None:
+            st.caption("Peak traced memory %.1f MB, %s memory blocks still held after the run"
+                %(timer.run_peak_bytes / 2**20, timer.allocated_blocks))
+        if timer.memory_overlapped:
+            st.caption("Other runs traced the memory at the same time, the peaks are approximate")
+
+        rows = timer.generation_rows()
+        columns = []
+        for row in rows:
+            columns += [column for column in row 
+                        if column.endswith("_seconds") and column not in columns]
+        if columns:
+            st.caption("Seconds per generation")
+            st.line_chart(rows, x="generation", y=columns)
+
+        st.download_button("Download JSON", timer.to_json(), "performance.json", "application/json")
+        st.download_button("Download CSV", timer.to_csv(), "performance.csv", "text/csv")
+        if timer.profile is not None:
+            st.download_button("Download profile", timer.profile, "profile.txt", "text/plain")
+            st.code(timer.profile, language=None)
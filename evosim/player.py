@@ -0,0 +1,256 @@
+'''Client-side vector player for the simulation frames.
+
+Instead of rasterizing a matplotlib figure for every generation, the player
+sends the browser a few numbers per generation (color indices of the
+offsprings, or the red and blue counts) and draws them on a canvas. The point
+layout is drawn once in the browser from a seeded random generator, so it is
+not sent at all.
+'''
+
+import base64
+import json
+
+import numpy as np
+
+from evosim.frames import MAX_POINTS, downsample, stratified_counts
+
+PLAYER_TEMPLATE = """
+<div style="font-family: sans-serif; font-size: 13px;">
+  <canvas id="frame" width="640" height="480"></canvas>
+  <div>
+    <button id="play">Pause</button>
+    <input id="position" type="range" min="0" value="0" style="width: 480px; vertical-align: middle;">
+  </div>
+</div>
+<script>
+const spec = __SPEC__;
+const canvas = document.getElementById("frame");
+const context = canvas.getContext("2d");
+const position = document.getElementById("position");
+const play = document.getElementById("play");
+position.max = spec.frames.length - 1;
+
+// mulberry32, a small seeded random generator for the fixed layout
+function random_generator(seed) {
+  return function() {
+    seed |= 0; seed = seed + 0x6D2B79F5 | 0;
+    let t = Math.imul(seed ^ seed >>> 15, 1 | seed);
+    t = t + Math.imul(t ^ t >>> 7, 61 | t) ^ t;
+    return ((t ^ t >>> 14) >>> 0) / 4294967296;
+  };
+}
+const random = random_generator(spec.layout_seed);
+const layout = new Float32Array(2 * spec.points);
+for (let i = 0; i < layout.length; i++) layout[i] = random();
+
+function decode(text) {
+  const raw = atob(text);
+  const values = new Uint8Array(raw.length);
+  for (let i = 0; i < raw.length; i++) values[i] = raw.charCodeAt(i);
+  return values;
+}
+const colors = spec.frames.map(frame => frame.colors === undefined ? null : decode(frame.colors));
+
+const plot = {left: 40, top: 50, width: spec.kind === "drift" ? 430 : 470, height: 400};
+function scatter(count, color_of) {
+  const size = spec.point_size;
+  for (let i = 0; i < count; i++) {
+    context.fillStyle = color_of(i);
+    context.fillRect(plot.left + layout[2 * i] * plot.width - size / 2,
+                     plot.top + layout[2 * i + 1] * plot.height - size / 2, size, size);
+  }
+}
+
+function draw_selection(index) {
+  const frame = spec.frames[index];
+  const values = colors[index];
+  scatter(values.length, i => spec.palette[values[i]]);
+  // color bar
+  const left = plot.left + plot.width + 30;
+  for (let i = 0; i < 256; i++) {
+    context.fillStyle = spec.palette[i];
+    context.fillRect(left, plot.top + plot.height * (1 - (i + 1) / 256), 16, plot.height / 256 + 1);
+  }
+  context.fillStyle = "black";
+  context.textAlign = "left";
+  context.fillText(spec.vmax, left + 20, plot.top + 10);
+  context.fillText(0, left + 20, plot.top + plot.height);
+  context.save();
+  context.translate(left + 50, plot.top + plot.height / 2);
+  context.rotate(-Math.PI / 2);
+  context.textAlign = "center";
+  context.fillText(spec.color_label, 0, 0);
+  context.restore();
+  return "Generation: " + frame.generation + ", Best offspring: " + frame.best_offspring +
+         ", Distance: " + frame.best_score;
+}
+
+function draw_drift(index) {
+  const frame = spec.frames[index];
+  scatter(frame.points, i => i < frame.red_points ? "red" : "blue");
+  // population bars
+  const left = plot.left + plot.width + 60;
+  const heights = [frame.red_offspring, frame.blue_offspring];
+  const bar_colors = ["#d62728", "#1f77b4"];
+  for (let i = 0; i < 2; i++) {
+    const height = plot.height * heights[i] / spec.bar_max;
+    context.fillStyle = bar_colors[i];
+    context.fillRect(left + 45 * i, plot.top + plot.height - height, 35, height);
+  }
+  context.strokeStyle = "black";
+  context.beginPath();
+  context.moveTo(left - 5, plot.top);
+  context.lineTo(left - 5, plot.top + plot.height);
+  context.lineTo(left + 90, plot.top + plot.height);
+  context.stroke();
+  context.fillStyle = "black";
+  context.textAlign = "center";
+  context.fillText("red", left + 17, plot.top + plot.height + 15);
+  context.fillText("blue", left + 62, plot.top + plot.height + 15);
+  context.save();
+  context.translate(left - 15, plot.top + plot.height / 2);
+  context.rotate(-Math.PI / 2);
+  context.fillText("Population distribution", 0, 0);
+  context.restore();
+  return "Generation: " + frame.generation;
+}
+
+function draw(index) {
+  context.clearRect(0, 0, canvas.width, canvas.height);
+  context.font = "11px sans-serif";
+  const title = spec.kind === "drift" ? draw_drift(index) : draw_selection(index);
+  context.fillStyle = "black";
+  context.textAlign = "center";
+  context.font = "14px sans-serif";
+  context.fillText(title, canvas.width / 2, 25);
+  position.value = index;
+}
+
+let current = 0;
+let timer = null;
+function stop() { clearInterval(timer); timer = null; play.textContent = "Play"; }
+function start() {
+  if (current >= spec.frames.length - 1) current = 0;
+  play.textContent = "Pause";
+  timer = setInterval(() => {
+    current += 1;
+    draw(current);
+    if (current >= spec.frames.length - 1) stop();
+  }, spec.interval);
+}
+play.onclick = () => timer === null ? start() : stop();
+position.oninput = () => { stop(); current = Number(position.value); draw(current); };
+draw(0);
+if (spec.frames.length > 1) start(); else stop();
+</script>
+"""
+
+
+def player_html(spec):
+    '''Embedding a player specification into the player HTML.
+
+    Args:
+        spec: JSON serializable dict of the layout and the frames.
+
+    Returns:
+        html: the player HTML, to show with st.components.v1.html.
+    '''
+    return PLAYER_TEMPLATE.replace("__SPEC__", json.dumps(spec, separators=(",", ":")))
+
+
+def palette(name="viridis"):
+    '''Hex colors of a matplotlib color map, 256 levels.'''
+    from matplotlib import colormaps
+
+    rgb = (colormaps[name](np.linspace(0, 1, 256))[:, :3] * 255).round().astype(int)
+    return ["#%02x%02x%02x" % tuple(color) for color in rgb]
+
+
+def natural_selection_player(records, initial_score, target, layout_seed, interval=100, 
+                             max_points=MAX_POINTS):
+    '''Building the vector player of a natural selection run.
+
+    Every frame holds the color index (distance from the target on a 0-255
+    scale) of every drawn offspring, and the title values. Larger populations
+    are drawn as a stratified sample of max_points offsprings.
+
+    Args:
+        records: iterable of NaturalSelectionGeneration, consumed fully.
+        initial_score: distance of the seed from the target, top of the color scale.
+        target: target 'DNA' code, shown on the color bar.
+        layout_seed: integer seed of the point layout.
+        interval: delay between frames in milliseconds.
+        max_points: maximal amount of points drawn in every frame.
+
+    Returns:
+        html: the player HTML.
+    '''
+    rng = np.random.default_rng(layout_seed)
+    vmax = max(initial_score, 1)
+    frames = []
+    points = 0
+    for record in records:
+        scores = downsample(record.scores, rng, record.counts, max_points)
+        levels = np.minimum(scores * 255 // vmax, 255).astype(np.uint8)
+        frames.append({
+            "generation": record.generation,
+            "best_offspring": record.best_offspring,
+            "best_score": record.best_score,
+            "colors": base64.b64encode(levels.tobytes()).decode("ascii"),
+        })
+        points = max(points, len(scores))
+    return player_html({
+        "kind": "selection",
+        "frames": frames,
+        "points": points,
+        "point_size": 5,
+        "layout_seed": int(layout_seed) % 2**32,
+        "palette": palette(),
+        "vmax": int(vmax),
+        "color_label": "Distance from %s" % target,
+        "interval": interval,
+    })
+
+
+def genetic_drift_player(records, red_parents, number_of_parents, number_of_offsprings,
+                         layout_seed, interval=100, max_points=MAX_POINTS):
+    '''Building the vector player of a genetic drift run.
+
+    Every frame holds the generation, the red and blue offspring counts and
+    the amount of drawn points and red points among them, at most max_points
+    in the proportion of red and blue offsprings.
+
+    Args:
+        records: iterable of GeneticDriftGeneration, consumed fully.
+        red_parents: initial amount of red parents.
+        number_of_parents: amount of parents in every generation.
+        number_of_offsprings: amount of offsprings per parent.
+        layout_seed: integer seed of the point layout.
+        interval: delay between frames in milliseconds.
+        max_points: maximal amount of points drawn in every frame.
+
+    Returns:
+        html: the player HTML.
+    '''
+    def frame(generation, red, blue):
+        red_points, blue_points = stratified_counts([red, blue], max_points)
+        return {
+            "generation": generation,
+            "red_offspring": int(red),
+            "blue_offspring": int(blue),
+            "points": int(red_points + blue_points),
+            "red_points": int(red_points),
+        }
+
+    frames = [frame(0, red_parents, number_of_parents - red_parents)]
+    for record in records:
+        frames.append(frame(record.generation, record.red_offspring, record.blue_offspring))
+    return player_html({
+        "kind": "drift",
+        "frames": frames,
+        "points": min(number_of_parents * number_of_offsprings, max_points),
+        "point_size": 4,
+        "layout_seed": int(layout_seed) % 2**32,
+        "bar_max": number_of_parents * number_of_offsprings,
+        "interval": interval,
+    })
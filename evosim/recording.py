@@ -0,0 +1,166 @@
+'''Recording simulation trajectories with bounded memory.
+
+Four levels are available:
+    summary: only the summary statistics of every generation (default).
+    recent: summaries plus the full records of the last generations.
+    full: summaries in memory, full records spilled to a file on disk.
+    columnar: summaries in memory, every generation exported to an Arrow or
+        Parquet file which can be replayed, see evosim.columnar.
+'''
+
+from collections import deque
+import os
+import pickle
+import tempfile
+import weakref
+
+RECORDING_LEVELS = ["summary", "recent", "full", "columnar"]
+HELP_RECORDING_LEVEL = "summary keeps only statistics per generation, recent also keeps \
+    the last generations in full, full writes every generation to a temporary file kept \
+    until the next run and columnar \
+    exports every generation to an Arrow file which can be replayed later"
+
+
+class Recorder:
+    '''Recording the summary statistics of every generation.
+
+    The summaries hold a few numbers per generation, independent of the
+    population size.
+    '''
+
+    level = "summary"
+
+    def __init__(self):
+        self.summaries = []
+
+    def add(self, record):
+        '''Recording a single generation.
+
+        Args:
+            record: generation record, see NaturalSelectionGeneration and
+                GeneticDriftGeneration.
+        '''
+        self.summaries.append(record.summary())
+
+    def record(self, records):
+        '''Recording generations while they are being consumed.
+
+        Args:
+            records: iterable of generation records.
+
+        Yields:
+            record: every generation record, unchanged.
+        '''
+        try:
+            for record in records:
+                self.add(record)
+                yield record
+        finally:
+            self.close()
+
+    def close(self):
+        '''Releasing any resources held by the recorder.'''
+
+
+class RecentRecorder(Recorder):
+    '''Recording summaries plus a ring buffer of the most recent full generations.
+
+    Args:
+        size: amount of full generations to keep.
+    '''
+
+    level = "recent"
+
+    def __init__(self, size=10):
+        super().__init__()
+        self.recent = deque(maxlen=size)
+
+    def add(self, record):
+        super().add(record)
+        self.recent.append(record)
+
+
+class DiskRecorder(Recorder):
+    '''Recording summaries in memory and every full generation to a file.
+
+    Records are pickled one after the other, read them back with read_records().
+
+    Args:
+        path: file to write, a new temporary file by default. The temporary
+            file is deleted once the recorder is garbage collected, so keep
+            the recorder as long as the file is needed.
+    '''
+
+    level = "full"
+
+    def __init__(self, path=None):
+        super().__init__()
+        temporary = path is None
+        if temporary:
+            handle, path = tempfile.mkstemp(prefix="evosim-", suffix=".pkl")
+            os.close(handle)
+        self.path = path
+        self._file = open(path, "wb")
+        if temporary:
+            weakref.finalize(self, _remove, self._file, path)
+
+    def add(self, record):
+        super().add(record)
+        pickle.dump(record, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def _remove(file, path):
+    file.close()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def make_recorder(level="summary", recent_generations=10, path=None, **export_options):
+    '''Creating a recorder for the requested recording level.
+
+    Args:
+        level: one of RECORDING_LEVELS.
+        recent_generations: amount of full generations kept by the "recent" level.
+        path: file written by the "full" and "columnar" levels, a temporary
+            file by default.
+        **export_options: genomes and metadata of the "columnar" level, see
+            evosim.columnar.ColumnarRecorder.
+
+    Returns:
+        recorder: Recorder instance.
+    '''
+    if level == "summary":
+        return Recorder()
+    if level == "recent":
+        return RecentRecorder(recent_generations)
+    if level == "full":
+        return DiskRecorder(path)
+    if level == "columnar":
+        # pyarrow is only imported once a run is exported, see evosim.exports
+        from evosim.columnar import ColumnarRecorder
+
+        return ColumnarRecorder(path, **export_options)
+    raise ValueError("unknown recording level %r, expected one of %s" % (level, RECORDING_LEVELS))
+
+
+def read_records(path):
+    '''Reading back the generations written by a DiskRecorder.
+
+    Args:
+        path: file written by DiskRecorder.
+
+    Yields:
+        record: every recorded generation, in order.
+    '''
+    with open(path, "rb") as records:
+        while True:
+            try:
+                yield pickle.load(records)
+            except EOFError:
+                return
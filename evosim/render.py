@@ -0,0 +1,242 @@
+'''Rendering simulation frames for the Streamlit pages.
+
+Not imported by ``evosim`` itself, so the simulation core does not pull in the
+plotting stack. The pages import it only where a figure is drawn, see evosim.app.
+'''
+
+from contextlib import nullcontext
+import re
+import time
+
+from matplotlib import rcParams
+from matplotlib.animation import FuncAnimation
+import matplotlib.pyplot as plt
+import numpy as np
+
+from evosim.frames import MAX_POINTS, allele_colors, downsample
+
+
+def natural_selection_figure(record, initial_score, target, layout_rng, max_points=MAX_POINTS):
+    '''Building the natural selection scatter plot, colored by distance from the target.
+
+    Larger populations are drawn as a stratified sample of max_points offsprings,
+    keeping the share of every distance.
+
+    Args:
+        record: NaturalSelectionGeneration of the first generation.
+        initial_score: distance of the seed from the target, top of the color scale.
+        target: target 'DNA' code.
+        layout_rng: numpy random Generator placing the offsprings.
+        max_points: maximal amount of points drawn in every frame.
+
+    Returns:
+        fig: matplotlib figure showing the first generation.
+        update: callback drawing a NaturalSelectionGeneration on fig.
+    '''
+    fig, ax = plt.subplots()
+    scores = downsample(record.scores, layout_rng, record.counts, max_points)
+    X = layout_rng.uniform(0,1,(len(scores)))
+    Y = layout_rng.uniform(0,1,(len(scores)))
+    scat = ax.scatter(X,Y, c=scores, vmax=initial_score, vmin=0)
+    cbar = fig.colorbar(scat, ax=ax)
+    cbar.set_label('Distance from %s' %target)
+    text_1 = 'Generation: %s, Best offspring: %s, Distance: %s \n' %(
+       record.generation, record.best_offspring, record.best_score)
+    ax.set_title(text_1, fontsize = 11)
+
+    def update(record):
+        '''Updates plots for every generation
+
+        Args:
+            record: NaturalSelectionGeneration computed by the simulation.
+
+        Returns:
+            scat: updated frame.
+        '''
+        scores = downsample(record.scores, layout_rng, record.counts, max_points)
+        X = layout_rng.uniform(0,1,(len(scores)))
+        Y = layout_rng.uniform(0,1,(len(scores)))
+        scat.set_offsets(np.c_[X, Y])
+        scat.set_array(scores)
+        text_1 = 'Generation: %s, Best offspring: %s, Distance: %s \n' %(
+           record.generation, record.best_offspring, record.best_score)
+        ax.set_title(text_1, fontsize = 11)
+        ax.axis('off')
+        return scat,
+
+    return fig, update
+
+
+def genetic_drift_figure(red_parents, number_of_parents, number_of_offsprings, layout_rng, 
+                         max_points=MAX_POINTS):
+    '''Building the genetic drift scatter plot and population bar chart.
+
+    The scatter shows the offsprings of every generation, as a stratified
+    sample of at most max_points items keeping the share of red and blue.
+
+    Args:
+        red_parents: initial amount of red parents.
+        number_of_parents: amount of parents in every generation.
+        number_of_offsprings: amount of offsprings per parent.
+        layout_rng: numpy random Generator placing the items.
+        max_points: maximal amount of points drawn in every frame.
+
+    Returns:
+        fig: matplotlib figure showing the initial parents.
+        update: callback drawing a GeneticDriftGeneration on fig.
+    '''
+    fig, (axl, axr) = plt.subplots(
+    ncols=2,
+    sharey=False,
+    gridspec_kw=dict(width_ratios=[5, 1], wspace=0.5),
+    )      
+    axl.yaxis.set_visible(False)
+    axl.xaxis.set_visible(False)
+    colors = allele_colors(red_parents, number_of_parents - red_parents, layout_rng, max_points)
+    X = layout_rng.uniform(0,1,(len(colors)))
+    Y = layout_rng.uniform(0,1,(len(colors)))
+    scat = axl.scatter(X,Y, c=colors)
+    axl.title.set_text('Generation: 0')
+    axl.axis('off')
+
+    pops = ['red', 'blue']
+    counts = [red_parents, number_of_parents - red_parents]
+    bar_labels = ['red', 'blue']
+    bar_colors = ['tab:red', 'tab:blue']
+
+    bar_pop = axr.bar(pops, counts, label=bar_labels, color=bar_colors)
+    axr.set_ylabel('Population distribution')
+    axr.set_ylim([0, number_of_parents*number_of_offsprings])
+    axr.spines[['right', 'top']].set_visible(False)
+
+    def update(record):
+        '''Updates plots for every generation
+
+        Args:
+            record: GeneticDriftGeneration computed by the simulation.
+
+        Returns:
+            scat: updated scatter plot.
+            bar_pop: updated bar plot.
+        '''
+        colors = allele_colors(record.red_offspring, record.blue_offspring, layout_rng, max_points)
+        X = layout_rng.uniform(0,1,(len(colors)))
+        Y = layout_rng.uniform(0,1,(len(colors)))
+        scat.set_offsets(np.c_[X, Y])
+        scat.set_facecolors(colors)
+        axl.title.set_text('Generation: %s' %record.generation)
+        axl.axis('off')
+
+        counts = [record.red_offspring, record.blue_offspring]
+        for i in range(len(bar_pop)):
+            bar_pop[i].set_height(counts[i])
+        return scat, bar_pop,
+
+    return fig, update
+
+
+def timed_update(update, timer):
+    '''Wrapping a frame callback, timing it as the "draw" phase of its generation.
+
+    Args:
+        update: callback drawing a generation record.
+        timer: PhaseTimer, None to return update as is.
+
+    Returns:
+        update: the timed callback.
+    '''
+    if timer is None:
+        return update
+
+    def timed(record):
+        timer.generation = record.generation
+        with timer.phase("draw"):
+            return update(record)
+
+    return timed
+
+
+def animation_html(fig, update, frames, interval=100, timer=None):
+    '''Pre-rendering all frames into an auto playing HTML animation player.
+
+    Args:
+        fig: matplotlib figure holding the first frame.
+        update: callback drawing a single frame on fig.
+        frames: iterable, or generator function, yielding the frames data.
+        interval: delay between frames in milliseconds.
+        timer: PhaseTimer measuring the "draw" phase of every frame and the
+            "encode" phase (rasterizing and encoding all frames), None to skip.
+
+    Returns:
+        html: the animation player HTML.
+    '''
+    rcParams['animation.embed_limit'] = 2**128
+    ani = FuncAnimation(fig, timed_update(update, timer),
+                frames=frames, save_count=None, interval=interval, repeat=False)
+    with timer.phase("encode", per_generation=False) if timer is not None else nullcontext():
+        animjs = ani.to_jshtml()
+    click_on_play = """document.querySelector('.anim-buttons button[title="Play"]').click();"""
+    pattern = re.compile(r"(setTimeout.*?;)(.*?})", re.MULTILINE | re.DOTALL)
+    return pattern.sub(rf"\1 \n {click_on_play} \2", animjs)
+
+
+FIGURES = {
+    "natural-selection": natural_selection_figure,
+    "genetic-drift": genetic_drift_figure,
+}
+
+
+def render_animation(figure, arguments, random_seed, frames, reporter=None):
+    '''Building a figure and pre-rendering its animation, as a job of the shared service.
+
+    Args:
+        figure: name of the figure in FIGURES.
+        arguments: positional arguments of the figure function, before layout_rng.
+        random_seed: seed of the point layout.
+        frames: list of generation records to draw.
+        reporter: Reporter receiving the generation of every drawn frame,
+            None to skip.
+
+    Returns:
+        html: the animation player HTML.
+    '''
+    fig, update = FIGURES[figure](*arguments, np.random.default_rng(random_seed))
+    if reporter is not None:
+        draw = update
+
+        def update(record):
+            reporter.put(record.generation)
+            return draw(record)
+
+    try:
+        return animation_html(fig, update, frames)
+    finally:
+        plt.close(fig)
+
+
+def stream_frames(fig, update, frames, placeholder, interval=100, timer=None):
+    '''Drawing every frame into a placeholder as soon as it is computed.
+
+    Only the current frame is kept, so memory does not grow with the amount
+    of generations and the first frame is shown before the simulation runs.
+
+    Args:
+        fig: matplotlib figure holding the first frame.
+        update: callback drawing a single frame on fig.
+        frames: iterable yielding the frames data, consumed lazily.
+        placeholder: Streamlit placeholder (st.empty()) to draw into.
+        interval: minimal delay between frames in milliseconds.
+        timer: PhaseTimer measuring the "draw" and "rasterize" phases of
+            every frame, None to skip.
+    '''
+    placeholder.pyplot(fig, clear_figure=False)
+    update = timed_update(update, timer)
+    for frame in frames:
+        start = time.perf_counter()
+        update(frame)
+        with timer.phase("rasterize") if timer is not None else nullcontext():
+            placeholder.pyplot(fig, clear_figure=False)
+        remaining = interval / 1000 - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
@@ -0,0 +1,657 @@
+'''Shared compute service of the Streamlit app.
+
+All sessions share one bounded process pool. Jobs wait in a queue until a
+worker is free, with admission control from cost estimates: every session
+may have a few jobs in flight, and the queue holds a bounded amount of
+estimated work. Identical jobs in flight are computed once, and a job is
+cancelled once no session waits for it anymore. Results (generation records,
+or progress ticks of a render) are sent back while the job runs, so pages can
+stream them and show progress.
+'''
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import os
+import threading
+import time
+import traceback
+
+from evosim.checkpoints import Checkpoints
+from evosim.genetic_drift import GeneticDriftEnsemble, GeneticDriftSim
+from evosim.instrumentation import PhaseTimer
+from evosim.islands import IslandNaturalSelectionSim
+from evosim.long_genome import LongGenomeSim
+from evosim.markov import EXACT_MAX_DIGITS, ExpectedNaturalSelection, expected_time_to_target
+from evosim.natural_selection import NaturalSelectionSim
+from evosim.spawn import WorkerContext
+
+MAX_SESSION_JOBS = 2
+MAX_QUEUED_SECONDS = 600.0
+FLUSH_SECONDS = 0.1
+
+# set in every worker process by _initialize_worker
+_channel = None
+_slots = None
+
+
+class ServiceBusy(RuntimeError):
+    '''A job was not admitted, the message tells the user why.'''
+
+
+class JobCancelled(Exception):
+    '''Raised inside a worker once nobody waits for its job anymore.'''
+
+
+def estimate_seconds(simulation, parameters, max_generations, memory=False):
+    '''Rough single core estimate of the time a simulation takes.
+
+    Measured on the default benchmark machine, see ``python -m evosim.benchmark``.
+
+    Args:
+        simulation: simulation class, such as GeneticDriftSim, or
+            ExpectedNaturalSelection.
+        parameters: keyword arguments of the simulation class.
+        max_generations: maximal amount of generations.
+        memory: whether the allocations are traced, see measured_simulate().
+
+    Returns:
+        seconds: estimated upper bound of the run time.
+    '''
+    if memory:
+        # tracemalloc about doubles the run time, and adds to every phase
+        return 2 * estimate_seconds(simulation, parameters, max_generations) + 1e-4 * max_generations
+    if issubclass(simulation, ExpectedNaturalSelection):
+        length = len(parameters["seed"])
+        if length <= EXACT_MAX_DIGITS:
+            return max_generations * (5e-5 + 4e-9 * length * 10 ** length)
+        return max_generations * 2e-3
+    if issubclass(simulation, GeneticDriftEnsemble):
+        # one vectorized draw over the replicates which are not fixed yet
+        return max_generations * (2e-4 + 6e-8 * parameters.get("replicates", 10000))
+    if issubclass(simulation, GeneticDriftSim):
+        # allele counts only, the population size does not matter
+        return 1e-5 * max_generations
+    offsprings = parameters.get("number_of_parents", 200) * parameters.get(
+       "average_number_of_offsprings", 1.2)
+    length = len(parameters["seed"])
+    if issubclass(simulation, LongGenomeSim):
+        mutated_loci = offsprings * parameters.get("mutation_rate_offspring", 0.05) * parameters.get(
+           "mutation_rate_digit", 0.1) * length
+        return max_generations * (1e-3 + 2e-7 * mutated_loci + 1e-9 * offsprings * length)
+    if issubclass(simulation, NaturalSelectionSim):
+        return max_generations * (1e-4 + 3e-8 * offsprings * length)
+    if issubclass(simulation, IslandNaturalSelectionSim):
+        # every island is a NaturalSelectionSim, the estimate assumes a single core
+        islands = parameters.get("islands", 4)
+        return max_generations * islands * (2e-4 + 3e-8 * offsprings * length)
+    raise ValueError("no cost model for %s" % simulation.__name__)
+
+
+def estimate_render_seconds(frames, points):
+    '''Rough estimate of the time to rasterize and encode an animation.
+
+    Args:
+        frames: amount of frames.
+        points: amount of points drawn in every frame.
+
+    Returns:
+        seconds: estimated run time.
+    '''
+    return frames * (0.08 + 2e-5 * points)
+
+
+class Reporter:
+    '''Sending the results of a job back from a worker, in batches.
+
+    Every flush also checks that the job was not cancelled.
+
+    Args:
+        job_id: id of the job.
+        slot: index of the worker slot the job runs on.
+    '''
+
+    def __init__(self, job_id, slot):
+        self.job_id = job_id
+        self.slot = slot
+        self.buffer = []
+        self.last_flush = None
+
+    def put(self, item):
+        '''Sending an item, such as a generation record.'''
+        self.buffer.append(item)
+        now = time.perf_counter()
+        # the first item is sent at once, so streaming pages start drawing
+        if self.last_flush is None or now - self.last_flush >= FLUSH_SECONDS:
+            self.flush()
+            self.last_flush = now
+
+    def flush(self):
+        '''Sending the buffered items.
+
+        Raises:
+            JobCancelled: nobody waits for the job anymore.
+        '''
+        if self.buffer:
+            _channel.put((self.job_id, "items", self.buffer))
+            self.buffer = []
+        if _slots[self.slot] != self.job_id:
+            raise JobCancelled()
+
+
+def _initialize_worker(channel, slots):
+    global _channel, _slots
+    _channel = channel
+    _slots = slots
+
+
+def _run_job(job_id, slot, function, arguments):
+    reporter = Reporter(job_id, slot)
+    try:
+        result = function(*arguments, reporter)
+        reporter.flush()
+        _channel.put((job_id, "done", result))
+    except JobCancelled:
+        _channel.put((job_id, "cancelled", None))
+    except Exception:
+        _channel.put((job_id, "error", traceback.format_exc()))
+
+
+def simulate(simulation, parameters, run_arguments, checkpoint_every, checkpoint, reporter, timer=None):
+    '''Job running a simulation, reporting every generation record.
+
+    Args:
+        simulation: simulation class.
+        parameters: keyword arguments of the simulation class.
+        run_arguments: positional arguments of the run method.
+        checkpoint_every: amount of generations between two checkpoints,
+            None to keep no checkpoints.
+        checkpoint: Checkpoint to continue from, None to start a new run.
+        reporter: Reporter of the job.
+        timer: PhaseTimer of the simulation.
+
+    Returns:
+        checkpoints: Checkpoints of the run, None without checkpoints.
+    '''
+    if checkpoint is None:
+        sim = simulation(timer=timer, **parameters)
+    else:
+        sim = checkpoint.restore(simulation, parameters, timer)
+    records = sim.run(*run_arguments)
+    checkpoints = None
+    if checkpoint_every is not None:
+        checkpoints = Checkpoints(checkpoint_every)
+        records = checkpoints.record(sim, records)
+    for record in records:
+        reporter.put(record)
+    return checkpoints
+
+
+def measured_simulate(simulation, parameters, run_arguments, checkpoint_every, checkpoint,
+                      memory, profile, reporter):
+    '''Job running a simulation as simulate(), measuring it in the worker.
+
+    Workers run a single job at a time, so the memory traced is the one of
+    the run.
+
+    Args:
+        Same as for simulate(), and
+        memory: whether to trace allocations, see PhaseTimer.measure().
+        profile: whether to capture a cProfile of the run.
+
+    Returns:
+        checkpoints: Checkpoints of the run, None without checkpoints.
+        timer: PhaseTimer of the run, add it to the one of the page with
+            PhaseTimer.merge().
+    '''
+    timer = PhaseTimer()
+    with timer.measure(memory=memory, profile=profile):
+        checkpoints = simulate(
+           simulation, parameters, run_arguments, checkpoint_every, checkpoint, reporter, timer)
+    return checkpoints, timer
+
+
+def expect(seed, target, max_generations, parameters, reporter):
+    '''Job computing the expected trajectory of an infinite population.
+
+    Args:
+        seed: 'DNA' code of the original parent.
+        target: 'DNA' code which best fits the environment.
+        max_generations: maximal amount of generations.
+        parameters: other keyword arguments of ExpectedNaturalSelection.
+        reporter: Reporter of the job.
+
+    Returns:
+        summaries: list of summary dicts, one per generation.
+        time_to_target: expected generations to reach the target, or None.
+    '''
+    records = list(ExpectedNaturalSelection(seed, target, **parameters).run(max_generations))
+    return [record.summary() for record in records], expected_time_to_target(records)
+
+
+def seek(simulation, parameters, checkpoint, generation, reporter):
+    '''Job computing a single generation from the checkpoint before it.
+
+    Args:
+        simulation: simulation class.
+        parameters: keyword arguments of the simulation class.
+        checkpoint: Checkpoint taken before the generation.
+        generation: number of the generation.
+        reporter: Reporter of the job.
+
+    Returns:
+        record: generation record, None if the run was done before it.
+    '''
+    return checkpoint.seek(simulation, parameters, generation)
+
+
+class Job:
+    '''A job of the service, as seen by the sessions waiting for it.
+
+    Items are kept until every session waiting for the job consumed them, so
+    a finished job does not hold its whole trajectory.
+
+    Args:
+        job_id: unique id of the job.
+        key: deduplication key, identical jobs have equal keys.
+        seconds: estimated run time.
+        function: module level function run by a worker, called with
+            arguments and a Reporter.
+        arguments: picklable positional arguments of function.
+    '''
+
+    def __init__(self, job_id, key, seconds, function, arguments):
+        self.job_id = job_id
+        self.key = key
+        self.seconds = seconds
+        self.function = function
+        self.arguments = arguments
+        self.sessions = set()
+        # items[0] is item number first, cursors hold the amount of items
+        # every waiting session consumed
+        self.items = []
+        self.first = 0
+        self.cursors = {}
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.slot = None
+        self.started = None
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        '''Whether the job is done, failed or was cancelled.'''
+        return self.state in ("done", "error", "cancelled")
+
+    @property
+    def received(self):
+        '''Amount of items the job reported so far.'''
+        return self.first + len(self.items)
+
+    def consume(self, session, index):
+        '''Recording that a session consumed the first index items.
+
+        Called with the changed condition held.
+        '''
+        if session in self.cursors:
+            self.cursors[session] = index
+        self.trim()
+
+    def trim(self):
+        '''Dropping the items every waiting session consumed.
+
+        Called with the changed condition held.
+        '''
+        consumed = min(self.cursors.values(), default=self.received)
+        if consumed > self.first:
+            del self.items[:consumed - self.first]
+            self.first = consumed
+
+
+class SimulationService:
+    '''Bounded process pool shared by all sessions, with a job queue.
+
+    Args:
+        max_workers: amount of worker processes, all cores by default.
+        max_session_jobs: maximal amount of jobs in flight of a session.
+        max_queued_seconds: maximal estimated time of all the queued jobs.
+    '''
+
+    def __init__(self, max_workers=None, max_session_jobs=MAX_SESSION_JOBS,
+                 max_queued_seconds=MAX_QUEUED_SECONDS):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_session_jobs = max_session_jobs
+        self.max_queued_seconds = max_queued_seconds
+        context = WorkerContext()
+        self._channel = context.Queue()
+        self._slots = context.Array("q", [-1] * self.max_workers, lock=False)
+        self._context = context
+        self._executor = self._new_executor()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._jobs = {}
+        self._in_flight = {}
+        self._queue = OrderedDict()
+        self._free_slots = list(range(self.max_workers))
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+           self.max_workers, self._context, _initialize_worker, (self._channel, self._slots))
+
+    def status(self):
+        '''Load of the service.
+
+        Returns:
+            status: dict of the amount of running and queued jobs and the
+                estimated seconds of the queued jobs.
+        '''
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "running": self.max_workers - len(self._free_slots),
+                "queued": len(self._queue),
+                "queued_seconds": sum(job.seconds for job in self._queue.values()),
+            }
+
+    def submit(self, session, key, seconds, function, arguments):
+        '''Admitting a job, or joining an identical one in flight.
+
+        A session only joins a job in flight while it still holds all its
+        items, otherwise the job is started again for that session.
+
+        Args:
+            session: id of the session waiting for the job.
+            key: deduplication key, hashable.
+            seconds: estimated run time, see estimate_seconds().
+            function: module level function run by a worker.
+            arguments: picklable positional arguments of function.
+
+        Returns:
+            job: the Job, release it with release() once done with it.
+
+        Raises:
+            ServiceBusy: the session has too many jobs in flight, or the queue
+                is full.
+        '''
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                with job.changed:
+                    joined = job.first == 0
+                    if joined:
+                        job.sessions.add(session)
+                        job.cursors.setdefault(session, 0)
+                if joined:
+                    return job
+            session_jobs = sum(session in job.sessions for job in self._jobs.values())
+            if session_jobs >= self.max_session_jobs:
+                raise ServiceBusy("This session already has %s simulations running, "
+                                  "please wait for them to finish." % session_jobs)
+            queued_seconds = sum(job.seconds for job in self._queue.values())
+            if self._queue and queued_seconds + seconds > self.max_queued_seconds:
+                raise ServiceBusy("The server is busy, %s simulations are waiting for a free worker. "
+                                  "Please try again in a minute." % len(self._queue))
+            job = Job(next(self._ids), key, seconds, function, arguments)
+            job.sessions.add(session)
+            job.cursors[session] = 0
+            self._jobs[job.job_id] = job
+            self._in_flight[key] = job
+            self._queue[job.job_id] = job
+            self._dispatch()
+        return job
+
+    def release(self, job, session):
+        '''Stopping to wait for a job, cancelling it if nobody else waits.
+
+        Args:
+            job: Job returned by submit().
+            session: id of the session.
+        '''
+        with self._lock:
+            job.sessions.discard(session)
+            with job.changed:
+                job.cursors.pop(session, None)
+                job.trim()
+            if job.sessions or job.finished:
+                return
+            if job.job_id in self._queue:
+                del self._queue[job.job_id]
+                self._finish(job, "cancelled")
+            elif job.slot is not None:
+                # the worker stops at its next flush
+                self._slots[job.slot] = -1
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+
+    def position(self, job):
+        '''Amount of queued jobs ahead of a job, None once it started.'''
+        with self._lock:
+            if job.job_id not in self._queue:
+                return None
+            return list(self._queue).index(job.job_id)
+
+    def stream(self, session, key, seconds, function, arguments, progress=None, done=None):
+        '''Running a job, yielding its items as soon as they arrive.
+
+        The job is only submitted once the first item is requested, and is
+        released when the generator is closed, such as when a Streamlit
+        rerun interrupts the page.
+
+        Args:
+            session: id of the session.
+            key: deduplication key, hashable.
+            seconds: estimated run time.
+            function: module level function run by a worker.
+            arguments: picklable positional arguments of function.
+            progress: callback called with the job about every FLUSH_SECONDS
+                while it runs, see progress_callback(), None to skip.
+            done: callback called with the return value of function once
+                all items were consumed, None to skip.
+
+        Yields:
+            item: every item reported by the job, in order.
+
+        Raises:
+            ServiceBusy: the job was not admitted.
+            RuntimeError: the job failed.
+        '''
+        job = self.submit(session, key, seconds, function, arguments)
+        try:
+            yield from self._wait(job, session, progress)
+            if done is not None:
+                done(job.result)
+        finally:
+            self.release(job, session)
+
+    def call(self, session, key, seconds, function, arguments, progress=None):
+        '''Running a job and waiting for its result.
+
+        Args:
+            Same as for stream().
+
+        Returns:
+            result: the return value of function.
+        '''
+        job = self.submit(session, key, seconds, function, arguments)
+        try:
+            return self.result(job, session, progress)
+        finally:
+            self.release(job, session)
+
+    def result(self, job, session, progress=None):
+        '''Waiting for a job returned by submit(), skipping its items.
+
+        Args:
+            job: Job returned by submit().
+            session: id of the session.
+            progress: same as for stream().
+
+        Returns:
+            result: the return value of the function of the job.
+
+        Raises:
+            RuntimeError: the job failed.
+        '''
+        for _ in self._wait(job, session, progress):
+            pass
+        return job.result
+
+    def _wait(self, job, session, progress):
+        with job.changed:
+            index = job.cursors.get(session, job.first)
+        while True:
+            with job.changed:
+                job.consume(session, index)
+                if index == job.received and not job.finished:
+                    job.changed.wait(FLUSH_SECONDS)
+                items = job.items[index - job.first:]
+                finished = job.finished
+            yield from items
+            index += len(items)
+            if finished and index == job.received:
+                break
+            if progress is not None:
+                progress(job)
+        if job.state == "error":
+            raise RuntimeError("The simulation failed:\n%s" % job.error)
+        if job.state == "cancelled":
+            raise RuntimeError("The simulation was cancelled.")
+
+    def _dispatch(self):
+        # called with the lock held
+        while self._queue and self._free_slots:
+            _, job = self._queue.popitem(last=False)
+            job.slot = self._free_slots.pop()
+            job.state = "running"
+            job.started = time.perf_counter()
+            self._slots[job.slot] = job.job_id
+            executor = self._executor
+            future = executor.submit(_run_job, job.job_id, job.slot, job.function, job.arguments)
+            future.add_done_callback(
+               lambda future, job=job, executor=executor: self._worker_done(job, executor, future))
+
+    def _worker_done(self, job, executor, future):
+        with self._lock:
+            error = None if future.cancelled() else future.exception()
+            if error is not None and not job.finished:
+                self._finish(job, "error", error=repr(error))
+            if isinstance(error, BrokenProcessPool) and executor is self._executor:
+                # a worker died, such as when running out of memory. Every job
+                # of the broken pool fails, only the first one replaces it
+                self._executor = self._new_executor()
+            self._slots[job.slot] = -1
+            self._free_slots.append(job.slot)
+            self._dispatch()
+
+    def _finish(self, job, state, result=None, error=None):
+        # called with the lock held
+        self._jobs.pop(job.job_id, None)
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+        with job.changed:
+            job.state = state
+            job.result = result
+            job.error = error
+            job.changed.notify_all()
+
+    def _collect(self):
+        while True:
+            try:
+                job_id, kind, payload = self._channel.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if kind == "items":
+                    with job.changed:
+                        job.items.extend(payload)
+                        job.trim()
+                        job.changed.notify_all()
+                elif kind == "done":
+                    self._finish(job, "done", result=payload)
+                else:
+                    self._finish(job, kind, error=payload)
+
+    def shutdown(self):
+        '''Stopping the workers, cancelling all the jobs.'''
+        with self._lock:
+            for job in list(self._queue.values()):
+                self._finish(job, "cancelled")
+            self._queue.clear()
+            for slot in range(self.max_workers):
+                self._slots[slot] = -1
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def progress_callback(service, placeholder, total, text):
+    '''Progress callback of stream() and call(), drawing a progress bar.
+
+    Args:
+        service: the SimulationService running the job.
+        placeholder: Streamlit placeholder (st.empty()) to draw into.
+        total: expected amount of items of the job.
+        text: progress text, formatted with the amount of items so far.
+
+    Returns:
+        progress: callback taking a Job.
+    '''
+    def progress(job):
+        position = service.position(job)
+        if position is not None:
+            placeholder.progress(0.0, text="Waiting for a free worker, %s jobs ahead" % position)
+        else:
+            placeholder.progress(min(job.received / total, 1.0), text=text % job.received)
+
+    return progress
+
+
+def measured_job(key, arguments, done, profile, timers):
+    '''Job of stream() measuring a simulate() job in the worker, see measured_simulate().
+
+    Args:
+        key: deduplication key of the simulate() job.
+        arguments: arguments of simulate().
+        done: done callback taking the checkpoints of the run, None to skip.
+        profile: whether to capture a cProfile of the run.
+        timers: list the PhaseTimer of the worker is appended to once the
+            run is done, merge it once the measure() block of the page ended.
+
+    Returns:
+        key: deduplication key, apart from the unmeasured job.
+        function: measured_simulate.
+        arguments: arguments of measured_simulate().
+        done: done callback taking the result of measured_simulate().
+    '''
+    def measured(result):
+        checkpoints, timer = result
+        timers.append(timer)
+        if done is not None:
+            done(checkpoints)
+
+    return ("measured", profile) + key, measured_simulate, arguments + (True, profile), measured
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def shared_service():
+    '''The service shared by all sessions of this server process.'''
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SimulationService()
+        return _service
+
+
+def current_session():
+    '''Id of the Streamlit session running the page script.'''
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    context = get_script_run_ctx()
+    return context.session_id if context is not None else "local"
@@ -0,0 +1,35 @@
+'''Spawning worker processes, also from the Streamlit pages.'''
+
+import multiprocessing
+import sys
+import threading
+import types
+
+# the main module is replaced for the whole process while a worker starts
+_main_lock = threading.Lock()
+
+
+class WorkerProcess(multiprocessing.context.SpawnProcess):
+    '''Spawned process which does not run the page script.
+
+    Streamlit runs every page as the __main__ module, which spawned processes
+    import again before unpickling their work, running the whole page. The
+    main module is hidden while the process starts, so it is skipped. The
+    sessions of the server start processes from their own threads, so only
+    one of them hides the main module at a time.
+    '''
+
+    def start(self):
+        with _main_lock:
+            main = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__")
+            try:
+                super().start()
+            finally:
+                sys.modules["__main__"] = main
+
+
+class WorkerContext(multiprocessing.context.SpawnContext):
+    '''Multiprocessing context starting WorkerProcess processes.'''
+
+    Process = WorkerProcess
@@ -0,0 +1,216 @@
+'''Parameter sweeps: many replicates of a grid of parameters on a process pool.
+
+Every replicate gets its own random stream, spawned from a single root seed,
+so a whole sweep is reproducible from that seed.
+'''
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from evosim.genetic_drift import GeneticDriftSim
+from evosim.natural_selection import ClonalNaturalSelectionSim, NaturalSelectionSim
+from evosim.service import ServiceBusy, estimate_seconds
+
+SIMULATIONS = {
+    "natural-selection": NaturalSelectionSim,
+    "natural-selection-clones": ClonalNaturalSelectionSim,
+    "genetic-drift": GeneticDriftSim,
+}
+
+
+def parameter_grid(grid, fixed=None):
+    '''Building all combinations of the swept parameters.
+
+    Args:
+        grid: dict of simulation parameter name to the list of values to sweep.
+        fixed: dict of parameters shared by all combinations.
+
+    Returns:
+        combinations: list of parameter dicts, one per combination.
+    '''
+    fixed = fixed or {}
+    names = list(grid)
+    return [dict(fixed, **dict(zip(names, values, strict=True)))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_replicates(simulation, parameters, replicates, max_generations, reporter=None):
+    '''Running several replicates of one parameter combination.
+
+    Args:
+        simulation: one of SIMULATIONS.
+        parameters: keyword arguments of the simulation class.
+        replicates: list of (replicate number, numpy SeedSequence) pairs.
+        max_generations: stop each replicate after this amount of generations.
+        reporter: Reporter of the job when run by the SimulationService,
+            which stops a cancelled job after its current replicate.
+
+    Returns:
+        rows: list of result dicts, one per replicate.
+    '''
+    rows = []
+    for replicate, seed_sequence in replicates:
+        sim = SIMULATIONS[simulation](random_seed=seed_sequence, **parameters)
+        for _ in sim.run(max_generations):
+            pass
+        row = dict(parameters, replicate=replicate, generations=sim.generation)
+        if simulation == "genetic-drift":
+            row["fixation"] = ("red" if sim.red_parents else "blue") if sim.done else None
+        else:
+            row["target_reached"] = sim.stop_reason == "target reached"
+            row["stop_reason"] = sim.stop_reason
+            row["best_score"] = sim.best_score
+        rows.append(row)
+        if reporter is not None:
+            reporter.flush()
+    return rows
+
+
+def sweep(simulation, combinations, replicates, max_generations, random_seed=None,
+          max_workers=None, chunksize=16, service=None, session=None):
+    '''Running every parameter combination many times across worker processes.
+
+    Results are yielded as soon as a chunk of replicates finishes, so the
+    order of the rows is not deterministic, their values are.
+
+    Args:
+        simulation: one of SIMULATIONS.
+        combinations: list of parameter dicts, see parameter_grid().
+        replicates: amount of replicates per combination.
+        max_generations: stop each replicate after this amount of generations.
+        random_seed: root seed of all replicates, None for a random sweep.
+        max_workers: amount of worker processes, 1 runs in this process.
+        chunksize: amount of replicates run by a worker per task.
+        service: SimulationService to run the tasks on as admitted jobs,
+            such as the one shared by the app, None for a new pool of
+            max_workers processes. See admitted().
+        session: id of the session running the sweep on the service.
+
+    Yields:
+        rows: list of result dicts of a finished chunk of replicates.
+
+    Raises:
+        ServiceBusy: a task was not admitted by the service.
+    '''
+    if simulation not in SIMULATIONS:
+        raise ValueError("unknown simulation %r, expected one of %s" % (simulation, list(SIMULATIONS)))
+    seed_sequences = iter(np.random.SeedSequence(random_seed).spawn(len(combinations) * replicates))
+    tasks = []
+    for parameters in combinations:
+        seeds = [(replicate, next(seed_sequences)) for replicate in range(replicates)]
+        for start in range(0, replicates, chunksize):
+            tasks.append((simulation, parameters, seeds[start:start + chunksize], max_generations))
+
+    if max_workers == 1:
+        for task in tasks:
+            yield run_replicates(*task)
+        return
+    if service is not None:
+        yield from admitted(service, session, tasks)
+        return
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = [executor.submit(run_replicates, *task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def admitted(service, session, tasks):
+    '''Running tasks as jobs of a SimulationService.
+
+    Every task goes through the admission control of the service with its
+    estimated cost, like the simulations of the other pages, and at most
+    max_session_jobs tasks of the sweep are in flight. So a sweep never takes
+    more than that share of the pool, and the jobs of other sessions are
+    queued between its tasks.
+
+    Args:
+        service: the SimulationService.
+        session: id of the session running the sweep.
+        tasks: list of run_replicates arguments.
+
+    Yields:
+        rows: list of result dicts of a finished task, in the order of the
+            tasks.
+
+    Raises:
+        ServiceBusy: a task was not admitted while no other task of the
+            sweep was in flight.
+    '''
+    jobs = deque()
+
+    def finish(job):
+        try:
+            return service.result(job, session)
+        finally:
+            service.release(job, session)
+
+    try:
+        for task in tasks:
+            simulation, parameters, seeds, max_generations = task
+            seconds = len(seeds) * estimate_seconds(SIMULATIONS[simulation], parameters, max_generations)
+            # the first seed sequence identifies the replicates of the task
+            key = ("sweep", simulation, tuple(sorted(parameters.items())), seeds[0][1].entropy,
+                   seeds[0][1].spawn_key, len(seeds), max_generations)
+            while True:
+                if len(jobs) < service.max_session_jobs:
+                    try:
+                        jobs.append(service.submit(session, key, seconds, run_replicates, task))
+                        break
+                    except ServiceBusy:
+                        if not jobs:
+                            raise
+                yield finish(jobs.popleft())
+        while jobs:
+            yield finish(jobs.popleft())
+    finally:
+        for job in jobs:
+            service.release(job, session)
+
+
+def summarize_sweep(results, simulation):
+    '''Aggregating replicate results per parameter combination.
+
+    Args:
+        results: pandas DataFrame of the rows yielded by sweep().
+        simulation: one of SIMULATIONS.
+
+    Returns:
+        summary: pandas DataFrame with a row per parameter combination.
+            Genetic drift reports the fixation probability of every allele and
+            the mean and median time to fixation, natural selection reports the
+            probability to reach the target and the mean and median generations
+            needed to reach it.
+    '''
+    import pandas as pd
+
+    outcome_columns = {"replicate", "generations", "fixation", "target_reached", "best_score",
+                       "stop_reason"}
+    keys = [column for column in results.columns if column not in outcome_columns]
+    groups = results.groupby(keys, dropna=False)
+    if simulation == "genetic-drift":
+        fixed = results[results["fixation"].notna()]
+        summary = pd.DataFrame({
+            "replicates": groups.size(),
+            "fixation_probability": groups["fixation"].apply(lambda fixation: fixation.notna().mean()),
+            "red_fixation_probability": groups["fixation"].apply(lambda fixation: (fixation == "red").mean()),
+            "mean_fixation_time": fixed.groupby(keys, dropna=False)["generations"].mean(),
+            "median_fixation_time": fixed.groupby(keys, dropna=False)["generations"].median(),
+        })
+    else:
+        reached = results[results["target_reached"]]
+        summary = pd.DataFrame({
+            "replicates": groups.size(),
+            "target_probability": groups["target_reached"].mean(),
+            "mean_time_to_target": reached.groupby(keys, dropna=False)["generations"].mean(),
+            "median_time_to_target": reached.groupby(keys, dropna=False)["generations"].median(),
+        })
+    return summary.reset_index()
@@ -15,32 +15,12 @@
 import streamlit as st
 from streamlit.logger import get_logger
 
-LOGGER = get_logger(__name__)
-
-add_footer="""
-<style>
-
-footer{
-    visibility:visible;
-}
-footer:after{
-    content: 'Efrat Herbst, Dr. Ofer Mokady and Prof. Zohar Yakhini';
-    display:block;
-    position:relative;
-    color:grey;
-    # padding:5px;
-    top:3px;
-}
+from evosim.app import page_setup
 
-</style>
-"""
+LOGGER = get_logger(__name__)
 
 def run():
-    st.set_page_config(
-        page_title="Evolution Simulator",
-        page_icon=':earth_americas:',
-    )
-    st.markdown(add_footer, unsafe_allow_html=True)
+    page_setup("Evolution Simulator")
 
     st.write("# Welcome to the Evolution Simulator!")
     st.sidebar.success("Select a simulation above.")
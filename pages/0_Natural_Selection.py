@@ -1,110 +1,163 @@
+from contextlib import closing
 from functools import partial
-from matplotlib import rcParams
-from matplotlib.animation import FuncAnimation
-import matplotlib.pyplot as plt
+import itertools
+import os
 import numpy as np
-import pandas as pd
-import random
-import re
 import streamlit as st
 
-add_footer="""
-<style>
+from evosim import (
+    MAX_RANDOM_SEED,
+    ClonalNaturalSelectionSim,
+    IslandNaturalSelectionSim,
+    PhaseTimer,
+    SELECTION_STRATEGIES,
+    TOPOLOGIES,
+    trajectory_key,
+)
+from evosim.app import (
+    HELP_RENDER_MODE,
+    RENDER_MODES,
+    checkpoint_cache,
+    continue_run,
+    draw_new_random_seed,
+    keep_checkpoints,
+    keep_recorder,
+    page_setup,
+    trajectory_cache,
+)
+from evosim.checkpoints import checkpoint_interval
+from evosim.exports import export_directory, exported_runs, new_export_path
+from evosim.frames import MAX_POINTS, decimate, frame_step, new_best
+from evosim.long_genome import LongGenomeSim, code_from_text, max_mutation_rate_digit, random_codes
+from evosim.markov import APPROXIMATE_MAX_DIGITS, EXACT_MAX_DIGITS, PREVIEW_MAX_GENERATIONS, ExpectedNaturalSelection
+from evosim.performance import performance_options, performance_panel
+from evosim.player import natural_selection_player
+from evosim.recording import HELP_RECORDING_LEVEL, RECORDING_LEVELS, make_recorder
+from evosim.service import (
+    ServiceBusy,
+    current_session,
+    estimate_render_seconds,
+    estimate_seconds,
+    expect,
+    measured_job,
+    progress_callback,
+    seek,
+    shared_service,
+    simulate,
+)
 
-footer{
-    visibility:visible;
-}
-footer:after{
-    content: 'Efrat Herbst, Dr. Ofer Mokady and Prof. Zohar Yakhini';
-    display:block;
-    position:relative;
-    color:grey;
-    # padding:5px;
-    top:3px;
+GENOME_SOURCES = ["Type digits", "Generate at random", "Read from files"]
+
+stop_messages = {
+    "target reached": "The target was reached after %s generations.",
+    "extinct": "The population went extinct after %s generations: no offsprings were born.",
+    "max generations": "Stopped after the maximum of %s generations.",
+    "plateau": "Stopped after %s generations: the best distance stopped improving.",
+    "time limit": "Stopped after %s generations: the time limit was reached.",
 }
 
-</style>
-"""
 
-def generate_offspring(seed, mutation_rate_offspring, 
-                       mutation_rate_digit, mutation_rate_digit_up, 
-                       mutation_rate_digit_up_plus, 
-                       mutation_rate_digit_down_minus, number_of_offsprings):
-    '''Generating offsprings per parent with random mutations.
+@st.cache_data(max_entries=100)
+def expected_trajectory(seed, target, max_generations, **parameters):
+    '''Expected trajectory of an infinite population, computed without sampling.
+
+    Codes of more than EXACT_MAX_DIGITS digits use the approximation of
+    independent digits, see ExpectedNaturalSelection. Computed by a worker
+    of the shared service, as a job of the session.
 
     Args:
-        seed: parent 'DNA' code.
-        mutation_rate_offspring: the chance for an offspring to go through mutation.
-        mutation_rate_digit: for an offspring who is going under mutation, 
-            this is the chance for every digit to go under mutation.
-        mutation_rate_digit_up: for a digit which is going under mutation,
-            this is the chance for it to go up over down.
-        mutation_rate_digit_up_plus: for a digit which is going under a mutation upward,
-            this is the chance to go up in +1 over +2 digits.
-        mutation_rate_digit_down_minus: for a digit which is going under a mutation downward,
-            this is the chance to go down in -1 over -2 digits. 
-        number_of_offsprings: amount of offsprings to generate for this parent.
+        seed: 'DNA' code of the original parent.
+        target: 'DNA' code which best fits the environment.
+        max_generations: maximal amount of generations.
+        parameters: other keyword arguments of ExpectedNaturalSelection.
 
     Returns:
-        offspring: the list of offsprings codes.
+        summaries: list of summary dicts, one per generation.
+        time_to_target: expected generations to reach the target, or None.
+
+    Raises:
+        ServiceBusy: the job was not admitted.
     '''
-    offspring = []
-    for _ in range(number_of_offsprings):
-        rand_offspring = random.random()
-        if rand_offspring < mutation_rate_offspring:
-            mutated = []
-            for digit in seed:
-                rand_digit = random.random()
-                if rand_digit < mutation_rate_digit:
-                    if digit == '9':
-                        new_digit = '8'
-                    elif digit == '0':
-                        new_digit = '1'
-                    else:
-                        rand_direction = random.random()
-                        new_digit = int(digit)
-                        if rand_direction < mutation_rate_digit_up:  
-                            if digit == '8':
-                              new_digit = new_digit + 1
-                            else:
-                              rand_jump = random.random()
-                              if rand_jump < mutation_rate_digit_up_plus: 
-                                new_digit = new_digit + 1
-                              else:
-                                new_digit = new_digit + 2
-                        else:
-                          if digit == '1':
-                            new_digit = new_digit - 1
-                          else:
-                            rand_jump = random.random()
-                            if rand_jump < mutation_rate_digit_down_minus: 
-                              new_digit = new_digit - 1
-                            else:
-                              new_digit = new_digit - 2
-                    mutated.append(str(new_digit))
-                else:
-                    mutated.append(digit)
-            offspring.append("".join(mutated))
-        else:
-           offspring.append(seed)
-    return offspring
+    return shared_service().call(
+       current_session(), 
+       ("expected", seed, target, max_generations) + tuple(sorted(parameters.items())), 
+       estimate_seconds(ExpectedNaturalSelection, dict(parameters, seed=seed), max_generations), 
+       expect, (seed, target, max_generations, parameters))
+
+
+@st.cache_data(max_entries=4)
+def generated_codes(length, random_seed):
+    '''Random seed and target codes, see random_codes.'''
+    return random_codes(length, random_seed)
 
-def calculate_score(offspring, target):
-    '''Computing the distance from each of the offsprings to the target seed.
+
+def island_selection(parameters, number_of_generations, plateau_generations, time_limit, 
+                     show_performance, profile_run):
+    '''Simulating natural selection on islands connected by migration
+
+    Shows the best distance of every island, drawn again while the 
+    generations are computed.
 
     Args:
-        offspring: list of offsprings.
-        target: target sequence.
+        parameters: keyword arguments of IslandNaturalSelectionSim.
+        number_of_generations: maximal amount of generations.
+        plateau_generations: stop once the best distance did not improve 
+            for this amount of generations, 0 never stops.
+        time_limit: stop once computing the generations took this many seconds.
+        show_performance: whether to measure the run and show the Performance panel.
+        profile_run: whether to profile the run.
 
     Returns:
-        scores: list of distances.
+        None
     '''
-    scores = []
-    for number in offspring:
-        score = sum(
-           abs(int(digit1) - int(digit2)) for digit1, digit2 in zip(str(number), target))
-        scores.append(score)
-    return scores
+    from evosim.charts import island_charts, stream_charts
+
+    timer = PhaseTimer()
+    service = shared_service()
+    status = st.empty()
+    sim = IslandNaturalSelectionSim(timer=timer, **parameters)
+    recorder = make_recorder("summary")
+    key = trajectory_key(sim, number_of_generations, plateau_generations, time_limit)
+    run_arguments = (number_of_generations, time_limit, plateau_generations)
+    # the islands live in their own worker processes, there are no checkpoints
+    job_key, function, done = key, simulate, None
+    arguments = (IslandNaturalSelectionSim, parameters, run_arguments, None, None)
+    worker_timers = []
+    if show_performance:
+        job_key, function, arguments, done = measured_job(key, arguments, done, profile_run, worker_timers)
+    run = service.stream(
+       current_session(), job_key, 
+       estimate_seconds(IslandNaturalSelectionSim, parameters, number_of_generations, memory=show_performance), 
+       function, arguments, 
+       progress_callback(service, status, number_of_generations, "Generation %s"), 
+       done)
+    trajectory = trajectory_cache().trajectory(key, run, replay=not show_performance)
+    try:
+        with closing(run), timer.measure(memory=show_performance, profile=profile_run):
+            stream_charts(
+               recorder.record(trajectory), recorder.summaries, 
+               partial(island_charts, islands=parameters["islands"], number_of_generations=number_of_generations), 
+               (st.empty(),), timer=timer)
+    except ServiceBusy as busy:
+        st.warning(str(busy))
+        st.stop()
+    status.empty()
+    if show_performance:
+        for worker_timer in worker_timers:
+            timer.merge(worker_timer)
+        performance_panel(timer)
+
+    last = recorder.summaries[-1]
+    message = stop_messages[last["stop_reason"]] %(last["generation"] + 1)
+    if last["stop_reason"] == "target reached":
+        st.success(message)
+    else:
+        st.info(message)
+    st.write("%s parents migrated between the islands." 
+       %sum(summary["migrants"] for summary in recorder.summaries))
+
+    with st.expander("Recorded data"):
+        st.line_chart(recorder.summaries, x="generation", y=["best_score", "mean_score"])
 
 
 def natural_selection() -> None:
@@ -117,29 +170,40 @@ def natural_selection() -> None:
         None
 
     '''
-    global generation,best_offsprings, carry_on
-    generation = 0
-    best_offsprings = []
-    carry_on = True
-
     #Page setup
-    help_number_of_digits="representing the length of DNA code"
-    number_of_digits = st.sidebar.slider(
-       "Number of digits", 1, 20, 6, 1, help=help_number_of_digits)
-    
-    placeholder_seed = '5'*number_of_digits
-    label_seed = "Enter the seed (%s-digit number): " %number_of_digits
-    help_seed = "Representing the DNA of the original parent"
-    seed = st.text_input(
-       label=label_seed, value=placeholder_seed, max_chars=number_of_digits, help=help_seed)
-    
-    placeholder_target = '9'*number_of_digits
-    label_target = "Enter the target (%s-digit number): " %number_of_digits
-    help_target = "Representing the 'DNA' code which best fits the current environment"
-    target = st.text_input(
-       label=label_target, value=placeholder_target, max_chars=number_of_digits, help=help_target)
+    label_genome = "Genome"
+    help_genome = "Type short seed and target codes, or use long codes generated at random \
+        or read from text files of digits"
+    genome = st.sidebar.radio(label_genome, GENOME_SOURCES, help=help_genome)
+
+    number_of_digits = None
+    if genome == "Type digits":
+        help_number_of_digits="representing the length of DNA code"
+        number_of_digits = st.sidebar.slider(
+           "Number of digits", 1, 20, 6, 1, help=help_number_of_digits)
+        
+        placeholder_seed = '5'*number_of_digits
+        label_seed = "Enter the seed (%s-digit number): " %number_of_digits
+        help_seed = "Representing the DNA of the original parent"
+        seed = st.text_input(
+           label=label_seed, value=placeholder_seed, max_chars=number_of_digits, help=help_seed)
+        
+        placeholder_target = '9'*number_of_digits
+        label_target = "Enter the target (%s-digit number): " %number_of_digits
+        help_target = "Representing the 'DNA' code which best fits the current environment"
+        target = st.text_input(
+           label=label_target, value=placeholder_target, max_chars=number_of_digits, help=help_target)
+    elif genome == "Generate at random":
+        label_genome_length = "Genome length"
+        help_genome_length = "Amount of digits of the random seed and target, drawn from the random seed"
+        genome_length = st.number_input(
+           label_genome_length, 21, 1000000, 10000, 1000, help=help_genome_length)
+    else:
+        help_files = "Text file of digits, white space is ignored"
+        seed_file = st.file_uploader("Seed file", type=["txt"], help=help_files)
+        target_file = st.file_uploader("Target file", type=["txt"], help=help_files)
     
-    st.button("Re-run")
+    st.button("Re-run", on_click=draw_new_random_seed)
 
     label_average_number_of_offsprings = "Number of offsprings on average"
     help_average_number_of_offsprings = "Offspring rate per parent is randomly drawn from a poisson \
@@ -150,7 +214,7 @@ def natural_selection() -> None:
     label_number_of_parents = "Number of parents"
     help_number_of_parents = "Amount of parents selected for every generation"
     number_of_parents = st.sidebar.slider(
-       label_number_of_parents, 0, 1000, 200, 10, help=help_number_of_parents)
+       label_number_of_parents, 0, 10000, 200, 10, help=help_number_of_parents)
     
     label_mutation_rate_offspring = "Chance for mutation in an offspring"
     help_mutation_rate_offspring = "Offspring chance to have any mutation"
@@ -180,126 +244,384 @@ def natural_selection() -> None:
     mutation_rate_digit_down_minus = st.sidebar.slider(
        label_mutation_rate_digit_down_minus, 0.0, 1.0, 1.0, 0.05, help=help_mutation_rate_digit_down_minus)
 
-    if len(seed) != number_of_digits or not seed.isdigit():
-        st.error("Invalid seed number. Please enter a %s-digit number." %number_of_digits)
-
-    if len(target) != number_of_digits or not target.isdigit():
-        st.error("Invalid target number. Please enter a %s-digit number." %number_of_digits)
+    label_selection = "Selection"
+    help_selection = "How the parents of the next generation are chosen among the offsprings: \
+        truncation keeps the closest ones, tournament keeps the closest of a few offsprings drawn \
+        at random for every parent, fitness proportional draws parents with a chance growing \
+        with their closeness, and elitism keeps a share of the closest ones and draws the others at random"
+    selection = st.sidebar.selectbox(label_selection, list(SELECTION_STRATEGIES), help=help_selection)
+
+    tournament_size, elite_fraction = 2, 0.1
+    if selection == "tournament":
+        label_tournament_size = "Tournament size"
+        help_tournament_size = "Amount of offsprings drawn for every tournament, the closest one \
+            becomes a parent. Larger tournaments select harder"
+        tournament_size = st.sidebar.slider(
+           label_tournament_size, 1, 10, 2, 1, help=help_tournament_size)
+    elif selection == "elitism":
+        label_elite_fraction = "Elite share"
+        help_elite_fraction = "Share of the parents kept as the closest offsprings, the other \
+            parents are drawn at random among the remaining offsprings"
+        elite_fraction = st.sidebar.slider(
+           label_elite_fraction, 0.0, 1.0, 0.1, 0.05, help=help_elite_fraction)
+
+    label_number_of_generations = "Maximum generations"
+    help_number_of_generations = "The simulation stops after this amount of generations \
+        if the target was not reached"
+    number_of_generations = st.sidebar.slider(
+       label_number_of_generations, 10, 5000, 1000, 10, help=help_number_of_generations)
+
+    label_plateau_generations = "Stop without improvement after (generations)"
+    help_plateau_generations = "The simulation stops if the best distance from the target \
+        did not improve for this amount of generations, 0 never stops"
+    plateau_generations = st.sidebar.slider(
+       label_plateau_generations, 0, 1000, 200, 10, help=help_plateau_generations)
+
+    label_time_limit = "Time limit (seconds)"
+    help_time_limit = "The simulation stops once computing the generations took this long"
+    time_limit = st.sidebar.slider(label_time_limit, 1, 300, 60, 1, help=help_time_limit)
+
+    islands = 1
+    if genome == "Type digits":
+        label_islands = "Islands"
+        help_islands = "Splits the population into islands of 'Number of parents' each, which evolve \
+            on their own and exchange their best parents every few generations"
+        islands = st.sidebar.slider(label_islands, 1, 16, 1, 1, help=help_islands)
+
+    render_mode, recording_level, export_genomes, replay_path = None, "summary", False, None
+    if islands > 1:
+        label_migration_interval = "Generations between migrations"
+        help_migration_interval = "The best parents of every island migrate to other islands \
+            every this amount of generations"
+        migration_interval = st.sidebar.slider(
+           label_migration_interval, 1, 100, 10, 1, help=help_migration_interval)
+
+        label_migrants = "Migrants per island"
+        help_migrants = "Amount of best parents of every island which migrate, they replace \
+            the worst parents of the island they arrive at"
+        migrants = st.sidebar.slider(label_migrants, 0, 50, 2, 1, help=help_migrants)
+
+        label_topology = "Migration"
+        help_topology = "Ring sends the migrants of every island to the next island, \
+            fully connected sends every migrant to any other island"
+        topology = st.sidebar.radio(label_topology, TOPOLOGIES, help=help_topology)
+    else:
+        label_render_mode = "Rendering"
+        render_mode = st.sidebar.radio(label_render_mode, RENDER_MODES, help=HELP_RENDER_MODE)
+
+        label_recording_level = "Recording"
+        recording_level = st.sidebar.selectbox(
+           label_recording_level, RECORDING_LEVELS, help=HELP_RECORDING_LEVEL)
+        if recording_level == "columnar" and genome == "Type digits":
+            label_export_genomes = "Export genomes"
+            help_export_genomes = "Also export the 'DNA' code of every offspring, which makes \
+                the file several times larger"
+            export_genomes = st.sidebar.checkbox(label_export_genomes, help=help_export_genomes)
+
+        label_replay = "Replay an exported run"
+        help_replay = "Shows a run exported with the columnar recording level instead of \
+            simulating a new one, the parameters above are then ignored"
+        replay_path = st.sidebar.selectbox(
+           label_replay, [None] + exported_runs("natural-selection", export_directory(current_session())), 
+           format_func=lambda path: "No" if path is None else os.path.basename(path), help=help_replay)
+    show_performance, profile_run = performance_options()
+
+    if "random_seed" not in st.session_state:
+        draw_new_random_seed()
+    label_random_seed = "Random seed"
+    help_random_seed = "Simulations with the same parameters and random seed are identical. \
+        Re-run draws a new random seed"
+    random_seed = st.sidebar.number_input(
+       label_random_seed, 0, MAX_RANDOM_SEED, key="random_seed", help=help_random_seed)
+
+    if replay_path is not None:
+        # pyarrow is only imported to replay an exported run
+        from evosim.columnar import read_metadata
+
+        metadata = read_metadata(replay_path)
+        st.caption("Replaying %s, exported with %s parents and %s offsprings on average." 
+           %(os.path.basename(replay_path), metadata["number_of_parents"], 
+             metadata["average_number_of_offsprings"]))
+    elif genome == "Type digits":
+        valid_input = True
+        if len(seed) != number_of_digits or not seed.isdigit():
+            st.error("Invalid seed number. Please enter a %s-digit number." %number_of_digits)
+            valid_input = False
+
+        if len(target) != number_of_digits or not target.isdigit():
+            st.error("Invalid target number. Please enter a %s-digit number." %number_of_digits)
+            valid_input = False
+
+        if not valid_input:
+            st.stop()
+    elif genome == "Generate at random":
+        seed, target = generated_codes(genome_length, random_seed)
+    else:
+        if seed_file is None or target_file is None:
+            st.info("Please upload a seed file and a target file.")
+            st.stop()
+        try:
+            seed = code_from_text(seed_file.getvalue())
+            target = code_from_text(target_file.getvalue())
+        except ValueError as error:
+            st.error("Invalid file: %s." %error)
+            st.stop()
+        if len(seed) != len(target):
+            st.error("The seed and target files must have the same amount of digits.")
+            st.stop()
+    if replay_path is None and genome != "Type digits":
+        # the mutated digits of a generation are drawn at once
+        max_rate = max_mutation_rate_digit(
+           average_number_of_offsprings * number_of_parents, mutation_rate_offspring, len(seed))
+        if mutation_rate_digit > max_rate:
+            st.error("Too many digits would mutate in every generation, please lower the chance for \
+                mutation in a digit to at most %.3f, or the amount of parents or offsprings." %max_rate)
+            st.stop()
+
+    if islands > 1:
+        parameters = dict(
+           seed=seed, 
+           target=target, 
+           average_number_of_offsprings=average_number_of_offsprings, 
+           number_of_parents=number_of_parents, 
+           mutation_rate_offspring=mutation_rate_offspring, 
+           mutation_rate_digit=mutation_rate_digit, 
+           mutation_rate_digit_up=mutation_rate_digit_up, 
+           mutation_rate_digit_up_plus=mutation_rate_digit_up_plus, 
+           mutation_rate_digit_down_minus=mutation_rate_digit_down_minus, 
+           selection=selection, 
+           tournament_size=tournament_size, 
+           elite_fraction=elite_fraction, 
+           islands=islands, 
+           migration_interval=migration_interval, 
+           migrants=migrants, 
+           topology=topology, 
+           random_seed=random_seed)
+        island_selection(
+           parameters, number_of_generations, plateau_generations, time_limit, show_performance, profile_run)
+        return
+
+    #Expected trajectory, of truncation selection
+    expected = None
+    exact_expectation = number_of_digits is not None and number_of_digits <= EXACT_MAX_DIGITS
+    if replay_path is None and selection == "truncation" and number_of_digits is not None and number_of_digits <= APPROXIMATE_MAX_DIGITS and number_of_parents > 0:
+        # a preview, bounded apart from the simulation
+        preview_generations = min(number_of_generations, PREVIEW_MAX_GENERATIONS)
+        try:
+            expected, time_to_target = expected_trajectory(
+               seed, 
+               target, 
+               preview_generations, 
+               average_number_of_offsprings=average_number_of_offsprings, 
+               number_of_parents=number_of_parents, 
+               mutation_rate_offspring=mutation_rate_offspring, 
+               mutation_rate_digit=mutation_rate_digit, 
+               mutation_rate_digit_up=mutation_rate_digit_up, 
+               mutation_rate_digit_up_plus=mutation_rate_digit_up_plus, 
+               mutation_rate_digit_down_minus=mutation_rate_digit_down_minus)
+        except ServiceBusy:
+            # the preview is skipped, the simulation may still be admitted
+            pass
+        else:
+            if time_to_target is None:
+                st.caption("An infinite population would not surely reach the target within %s generations." 
+                   %preview_generations)
+            elif exact_expectation:
+                st.caption("An infinite population would reach the target after about %.0f generations, \
+                    finite populations are slower." %time_to_target)
+            else:
+                # combines improvements of different offsprings, several times faster than the simulation
+                st.caption("Approximately, assuming independent digits, an infinite population would reach \
+                    the target after about %.0f generations. This approximation is strongly optimistic, \
+                    finite populations usually need several times more generations." %time_to_target)
 
     #First generation
-    all_offspring = []
-    initial_seed = seed
-    initial_score = sum(abs(int(digit1) - int(digit2)) for digit1, digit2 in zip(seed, target))
-    offspring = []
-    for i in range(number_of_parents):
-        number_of_offsprings = np.random.poisson(average_number_of_offsprings)
-        offspring.extend(
-           generate_offspring(
-              seed, 
-              mutation_rate_offspring, 
-              mutation_rate_digit, 
-              mutation_rate_digit_up, 
-              mutation_rate_digit_up_plus, 
-              mutation_rate_digit_down_minus, 
-              number_of_offsprings))
-    scores = calculate_score(offspring, target)
-    scores_sorted = scores.copy()
-    scores_sorted.sort(reverse=False)
-    min_scores = scores_sorted[:number_of_parents]
-    best_offsprings = []
-    for score in min_scores:
-        best_offsprings.append(offspring[scores.index(score)])
-    
+    timer = PhaseTimer()
+    service = shared_service()
+    session = current_session()
+    status = st.empty()
+    worker_timers = []
+    if replay_path is not None:
+        # the exported generations are memory mapped instead of cached
+        from evosim.columnar import read_trajectory
+
+        initial_score, target = metadata["initial_score"], metadata["target"]
+        number_of_generations, random_seed = metadata["max_generations"], metadata["random_seed"]
+        number_of_parents = metadata["number_of_parents"]
+        average_number_of_offsprings = metadata["average_number_of_offsprings"]
+        recorder = make_recorder("summary")
+        key = ("replay", replay_path, os.path.getmtime(replay_path))
+        run = read_trajectory(replay_path)
+        trajectory = run
+        generations = number_of_generations
+    else:
+        simulation = ClonalNaturalSelectionSim if genome == "Type digits" else LongGenomeSim
+        parameters = dict(
+           seed=seed, 
+           target=target, 
+           average_number_of_offsprings=average_number_of_offsprings, 
+           number_of_parents=number_of_parents, 
+           mutation_rate_offspring=mutation_rate_offspring, 
+           mutation_rate_digit=mutation_rate_digit, 
+           mutation_rate_digit_up=mutation_rate_digit_up, 
+           mutation_rate_digit_up_plus=mutation_rate_digit_up_plus, 
+           mutation_rate_digit_down_minus=mutation_rate_digit_down_minus, 
+           selection=selection, 
+           tournament_size=tournament_size, 
+           elite_fraction=elite_fraction, 
+           random_seed=random_seed)
+        sim = simulation(timer=timer, **parameters)
+        initial_score, target = sim.initial_score, sim.target
+        if recording_level == "columnar":
+            # long genomes are stored as arrays, they are left out of the metadata
+            metadata = {name: value for name, value in parameters.items() if not hasattr(value, "shape")}
+            metadata.update(
+               simulation="natural-selection", 
+               initial_score=initial_score, 
+               target=target, 
+               max_generations=number_of_generations)
+            recorder = make_recorder(
+               recording_level, path=new_export_path("natural-selection-", export_directory(session)), 
+               genomes=export_genomes, metadata=metadata)
+        else:
+            recorder = make_recorder(recording_level)
+        keep_recorder(recorder)
+        base_key = trajectory_key(sim, number_of_generations, plateau_generations, time_limit)
+        run_arguments = (number_of_generations, time_limit, plateau_generations)
+        # a continued run is keyed by the run it continues and its amount of generations
+        key = st.session_state.setdefault("continued", {}).get(base_key, base_key)
+        previous = checkpoint_cache().get(key[:-2]) if key != base_key else None
+        checkpoint = None
+        first_generation = 0
+        if previous is None:
+            key = base_key
+        else:
+            checkpoint = previous.latest
+            first_generation = checkpoint.generation + 1
+            run_arguments = (first_generation + key[-1], time_limit, None)
+            st.caption("Continued from generation %s, only the new generations are shown." 
+               %checkpoint.generation)
+        generations = run_arguments[0] - first_generation
+        every = checkpoint_interval(number_of_generations)
+        done = partial(keep_checkpoints, key, previous)
+        job_key, function = key, simulate
+        arguments = (simulation, parameters, run_arguments, every, checkpoint)
+        if show_performance:
+            # measured in the worker, its timer is merged with the one of the page
+            job_key, function, arguments, done = measured_job(key, arguments, done, profile_run, worker_timers)
+        run = service.stream(
+           session, job_key, 
+           estimate_seconds(simulation, parameters, generations, memory=show_performance), 
+           function, arguments, 
+           progress_callback(service, status, generations, "Generation %s"), 
+           done)
+        # without checkpoints the run is computed again, to seek and continue it
+        replay = not show_performance and key in checkpoint_cache()
+        trajectory = trajectory_cache().trajectory(key, run, replay=replay)
+    records = decimate(recorder.record(trajectory), frame_step(generations), new_best())
+
     #Visualization           
-    fig = plt.figure()
-    X = np.random.uniform(0,1,(len(offspring)))
-    Y = np.random.uniform(0,1,(len(offspring)))
-    scat = plt.scatter(X,Y, c=scores, vmax=initial_score, vmin=0)
-    cbar = plt.colorbar()
-    cbar.set_label('Distance from %s' %target)
-    text_1 = 'Generation: %s, Best offspring: %s, Distance: %s \n' %(
-       generation, best_offsprings[0], min_scores[0])
-    plt.title(text_1, fontsize = 11)
-    generation += 1
-    all_offspring.append(offspring)
-
-    def gen():
-        '''Generates frames as long as simulation has not ended.
-
-        Args:
-            None
-
-        Returns: 
-            None
-        '''
-        global carry_on
-        i = 0
-        while carry_on:
-            i += 1
-            yield i
-        
-    def update(frame_number):
-        '''Updates computations and plots for every generation
-
-        Args:
-            frame_number: frame number.
-
-        Returns:
-            scat: updated frame.
-        '''
-        global generation,best_offsprings, carry_on
-
-        offspring = []
-        for parent in best_offsprings:
-            number_of_offsprings = np.random.poisson(average_number_of_offsprings)
-            offspring.extend(
-               generate_offspring(
-                  parent, 
-                  mutation_rate_offspring, 
-                  mutation_rate_digit, 
-                  mutation_rate_digit_up, 
-                  mutation_rate_digit_up_plus, 
-                  mutation_rate_digit_down_minus, 
-                  number_of_offsprings))
-        scores = calculate_score(offspring, target)
-        scores_sorted = scores.copy()
-        scores_sorted.sort(reverse=False)
-        min_scores = scores_sorted[:number_of_parents]
-        best_offsprings = []
-        for score in min_scores:
-            best_offsprings.append(offspring[scores.index(score)])
-
-        # Visualization           
-        X = np.random.uniform(0,1,(len(offspring)))
-        Y = np.random.uniform(0,1,(len(offspring)))
-        scat.set_offsets(np.c_[X, Y])
-        scat.set_array(scores)
-        text_1 = 'Generation: %s, Best offspring: %s, Distance: %s \n' %(
-           generation, best_offsprings[0], min_scores[0])
-        plt.title(text_1, fontsize = 11)
-        plt.axis('off')
-        generation += 1
-        all_offspring.append(offspring)
-
-        if min_scores[0] == 0:
-            carry_on = False
-            print("\nTarget reached!")
-            
-        return scat,
-
-    rcParams['animation.embed_limit'] = 2**128
-    with st.spinner(text="Preparing simulation..."):
-        ani = FuncAnimation(fig, update, 
-                    frames=gen, save_count=None, interval=100, repeat=False) 
-        animjs = ani.to_jshtml()
-        click_on_play = """document.querySelector('.anim-buttons button[title="Play"]').click();"""
-        pattern = re.compile(r"(setTimeout.*?;)(.*?})", re.MULTILINE | re.DOTALL)
-        new_animjs = pattern.sub(rf"\1 \n {click_on_play} \2", animjs)
-
-    st.components.v1.html(new_animjs,height=600)
-
-st.set_page_config(page_title="Natural Selection", page_icon=':earth_americas:')
-st.markdown(add_footer, unsafe_allow_html=True)
+    try:
+        with closing(run), timer.measure(memory=show_performance, profile=profile_run):
+            record = next(records)
+            if render_mode == "Vector player":
+                with st.spinner(text="Preparing simulation..."), timer.phase("encode", per_generation=False):
+                    player = natural_selection_player(
+                       itertools.chain([record], records), initial_score, target, random_seed)
+                st.components.v1.html(player, height=540)
+            elif render_mode == "Animation player" and not show_performance:
+                from evosim.render import render_animation
+
+                frames = list(records)
+                points = min(MAX_POINTS, int(number_of_parents*average_number_of_offsprings))
+                with st.spinner(text="Preparing simulation..."):
+                    new_animjs = service.call(
+                       session, ("animation",) + key, 
+                       estimate_render_seconds(len(frames) + 1, points), 
+                       render_animation, 
+                       ("natural-selection", (record, initial_score, target), random_seed, frames), 
+                       progress_callback(
+                          service, status, len(frames), "Drawing frame %%s of %s" %len(frames)))
+                st.components.v1.html(new_animjs,height=600)
+            else:
+                import matplotlib.pyplot as plt
+                from evosim.render import animation_html, natural_selection_figure, stream_frames
+
+                fig, update = natural_selection_figure(
+                   record, initial_score, target, np.random.default_rng(random_seed))
+
+                if render_mode == "Streaming":
+                    stream_frames(fig, update, records, st.empty(), timer=timer)
+                else:
+                    with st.spinner(text="Preparing simulation..."):
+                        new_animjs = animation_html(fig, update, records, timer=timer)
+                    st.components.v1.html(new_animjs,height=600)
+                plt.close(fig)
+    except ServiceBusy as busy:
+        st.warning(str(busy))
+        st.stop()
+    status.empty()
+    if show_performance:
+        for worker_timer in worker_timers:
+            timer.merge(worker_timer)
+        performance_panel(timer)
+
+    last = recorder.summaries[-1]
+    message = stop_messages[last["stop_reason"]] %(last["generation"] + 1)
+    if last["stop_reason"] == "target reached":
+        st.success(message)
+    else:
+        st.info(message)
+
+    with st.expander("Recorded data"):
+        st.line_chart(recorder.summaries, x="generation", y=["best_score", "mean_score"])
+        if expected:
+            st.caption("Expected distances of an infinite population, and the chance that the \
+                target was reached by each generation%s" 
+                %("" if exact_expectation else " (approximate, assuming independent digits)"))
+            st.line_chart(expected, x="generation", y=["best_score", "mean_score"])
+            st.line_chart(expected, x="generation", y="target_probability")
+        if recorder.level == "full":
+            st.caption("All generations were written to %s" %recorder.path)
+        elif recorder.level == "columnar":
+            st.caption("All generations were exported to %s, replay them from the sidebar" %recorder.path)
+
+    checkpoints = checkpoint_cache().get(key) if replay_path is None else None
+    if checkpoints is not None:
+        with st.expander("Seek and continue"):
+            label_seek_generation = "Generation"
+            help_seek_generation = "Any generation of the run, computed from the nearest \
+                of the checkpoints kept every %s generations" %checkpoints.every
+            seek_generation = st.number_input(
+               label_seek_generation, 0, last["generation"], last["generation"], help=help_seek_generation)
+            if st.button("Show generation"):
+                try:
+                    with st.spinner(text="Computing generation %s..." %seek_generation):
+                        seek_record = service.call(
+                           session, ("seek", seek_generation) + key, 
+                           estimate_seconds(simulation, parameters, checkpoints.every), 
+                           seek, 
+                           (simulation, parameters, checkpoints.nearest(seek_generation), seek_generation))
+                except ServiceBusy as busy:
+                    st.warning(str(busy))
+                    st.stop()
+                import matplotlib.pyplot as plt
+                from evosim.render import natural_selection_figure
+
+                fig, _ = natural_selection_figure(
+                   seek_record, initial_score, target, np.random.default_rng(random_seed))
+                st.pyplot(fig)
+                plt.close(fig)
+
+            if last["stop_reason"] not in ("target reached", "extinct"):
+                label_more_generations = "More generations"
+                help_more_generations = "Continues the run from its last generation, \
+                    only the new generations are computed"
+                st.number_input(
+                   label_more_generations, 1, 5000, 100, 10, key="more_generations", help=help_more_generations)
+                st.button("Continue", on_click=continue_run, args=(base_key, key))
+
+page_setup("Natural Selection")
 st.markdown("# Natural Selection")
 st.sidebar.header("Parameters")
 st.sidebar.write("Change any of the following parameters to generate a new simulation")
@@ -1,46 +1,106 @@
+from contextlib import closing
 from functools import partial
-from matplotlib import rcParams
-from matplotlib.animation import FuncAnimation
-import matplotlib.pyplot as plt
+import os
 import numpy as np
-import pandas as pd
-import random
-import re
 import streamlit as st
 
-add_footer="""
-<style>
-
-footer{
-    visibility:visible;
-}
-footer:after{
-    content: 'Efrat Herbst, Dr. Ofer Mokady and Prof. Zohar Yakhini';
-    display:block;
-    position:relative;
-    color:grey;
-    # padding:5px;
-    top:3px;
-}
+from evosim import (
+    GeneticDriftEnsemble,
+    GeneticDriftSim,
+    MAX_RANDOM_SEED,
+    PhaseTimer,
+    trajectory_key,
+)
+from evosim.app import (
+    HELP_RENDER_MODE,
+    RENDER_MODES,
+    checkpoint_cache,
+    continue_run,
+    draw_new_random_seed,
+    keep_checkpoints,
+    keep_recorder,
+    page_setup,
+    trajectory_cache,
+)
+from evosim.checkpoints import checkpoint_interval
+from evosim.exports import export_directory, exported_runs, new_export_path
+from evosim.frames import MAX_POINTS, decimate, fixation, frame_step
+from evosim.performance import performance_options, performance_panel
+from evosim.player import genetic_drift_player
+from evosim.recording import HELP_RECORDING_LEVEL, RECORDING_LEVELS, make_recorder
+from evosim.service import (
+    ServiceBusy,
+    current_session,
+    estimate_render_seconds,
+    estimate_seconds,
+    measured_job,
+    progress_callback,
+    seek,
+    shared_service,
+    simulate,
+)
 
-</style>
-"""
 
+def genetic_drift_ensemble(parameters, number_of_generations, show_performance, profile_run):
+    '''Simulating many replicates of the genetic drift together
 
-def generate_offspring(seed, number_of_offsprings):
-    '''Generating offsprings per parent.
+    Shows the spread of the red frequency over the replicates and when they
+    were fixed, drawn again while the generations are computed.
 
     Args:
-        seed: parent 'DNA' code.
-        number_of_offsprings: amount of offsprings to generate for this parent.
+        parameters: keyword arguments of GeneticDriftEnsemble.
+        number_of_generations: maximal amount of generations.
+        show_performance: whether to measure the run and show the Performance panel.
+        profile_run: whether to profile the run.
 
     Returns:
-        offspring: the list of offsprings codes.
+        None
     '''
-    offspring = []
-    for _ in range(number_of_offsprings):
-        offspring.append(seed)
-    return offspring
+    from evosim.charts import genetic_drift_ensemble_charts, stream_charts
+
+    timer = PhaseTimer()
+    service = shared_service()
+    status = st.empty()
+    sim = GeneticDriftEnsemble(timer=timer, **parameters)
+    recorder = make_recorder("summary")
+    key = trajectory_key(sim, number_of_generations)
+    # ensembles keep no checkpoints, their snapshots grow with the replicates
+    job_key, function, done = key, simulate, None
+    arguments = (GeneticDriftEnsemble, parameters, (number_of_generations,), None, None)
+    worker_timers = []
+    if show_performance:
+        job_key, function, arguments, done = measured_job(key, arguments, done, profile_run, worker_timers)
+    run = service.stream(
+        current_session(), job_key, 
+        estimate_seconds(GeneticDriftEnsemble, parameters, number_of_generations, memory=show_performance), 
+        function, arguments, 
+        progress_callback(service, status, number_of_generations, "Generation %s"), 
+        done)
+    trajectory = trajectory_cache().trajectory(key, run, replay=not show_performance)
+    try:
+        with closing(run), timer.measure(memory=show_performance, profile=profile_run):
+            stream_charts(
+                recorder.record(trajectory), recorder.summaries, 
+                partial(genetic_drift_ensemble_charts, number_of_generations=number_of_generations), 
+                (st.empty(), st.empty()), timer=timer)
+    except ServiceBusy as busy:
+        st.warning(str(busy))
+        st.stop()
+    status.empty()
+
+    replicates = parameters["replicates"]
+    red_fixed = sum(summary["red_fixations"] for summary in recorder.summaries)
+    blue_fixed = sum(summary["blue_fixations"] for summary in recorder.summaries)
+    st.write("%s of %s replicates fixed on red and %s on blue, %s are still drifting after generation %s." 
+        %(red_fixed, replicates, blue_fixed, recorder.summaries[-1]["active"], recorder.summaries[-1]["generation"]))
+    if red_fixed + blue_fixed:
+        fixation_time = sum(summary["generation"] * (summary["red_fixations"] + summary["blue_fixations"]) 
+            for summary in recorder.summaries) / (red_fixed + blue_fixed)
+        st.write("The fixed replicates were fixed after %.1f generations on average." %fixation_time)
+    if show_performance:
+        for worker_timer in worker_timers:
+            timer.merge(worker_timer)
+        performance_panel(timer)
 
 
 def genetic_drift() -> None:
@@ -53,11 +113,6 @@ def genetic_drift() -> None:
         None
 
     '''
-    global generation, carry_on, rand_parents
-    generation = 0
-    carry_on = True
-    rand_parents = []
-
     #Page setup
     label_number_of_parents = "Amount of parents"
     help_number_of_parents = "Amount of parents selected randomly in every generation"
@@ -75,6 +130,37 @@ def genetic_drift() -> None:
     number_of_generations = st.sidebar.slider(
         label_number_of_generations, 10, 5000, 500, 10, help=help_number_of_generations)
 
+    label_replicates = "Replicates"
+    help_replicates = "Amount of independent populations simulated together. With more than one, \
+        the spread of the red frequency and the fixation times of all replicates are shown"
+    replicates = st.sidebar.select_slider(
+       label_replicates, [1, 10, 100, 1000, 10000, 100000], 1, help=help_replicates)
+
+    render_mode, recording_level, replay_path = None, "summary", None
+    if replicates == 1:
+        label_render_mode = "Rendering"
+        render_mode = st.sidebar.radio(label_render_mode, RENDER_MODES, help=HELP_RENDER_MODE)
+
+        label_recording_level = "Recording"
+        recording_level = st.sidebar.selectbox(
+           label_recording_level, RECORDING_LEVELS, help=HELP_RECORDING_LEVEL)
+
+        label_replay = "Replay an exported run"
+        help_replay = "Shows a run exported with the columnar recording level instead of \
+            simulating a new one, the parameters above are then ignored"
+        replay_path = st.sidebar.selectbox(
+           label_replay, [None] + exported_runs("genetic-drift", export_directory(current_session())), 
+           format_func=lambda path: "No" if path is None else os.path.basename(path), help=help_replay)
+    show_performance, profile_run = performance_options()
+
+    if "random_seed" not in st.session_state:
+        draw_new_random_seed()
+    label_random_seed = "Random seed"
+    help_random_seed = "Simulations with the same parameters and random seed are identical. \
+        Re-run draws a new random seed"
+    random_seed = st.sidebar.number_input(
+       label_random_seed, 0, MAX_RANDOM_SEED, key="random_seed", help=help_random_seed)
+
     placeholder_reds = int(number_of_parents/2)
     label_red_rate = "Enter the amount of red items out of %s initial parents: " %number_of_parents
     help_red_rate = "Defines the initial distribution of red and blue items"
@@ -84,121 +170,182 @@ def genetic_drift() -> None:
         max_value=number_of_parents, 
         value=placeholder_reds, 
         help=help_red_rate)
-    blue_rate = number_of_parents - red_rate
-    st.button("Re-run")
+    st.button("Re-run", on_click=draw_new_random_seed)
+
+    if replicates > 1:
+        parameters = dict(
+            number_of_parents=number_of_parents, 
+            number_of_offsprings=number_of_offsprings, 
+            red_parents=red_rate, 
+            replicates=replicates, 
+            random_seed=random_seed)
+        genetic_drift_ensemble(parameters, number_of_generations, show_performance, profile_run)
+        return
 
-    seed_red = 'r'
-    seed_blue = 'b'
-    
     #First generation
-    all_offspring = []
-    offspring = []
-    for i in range(red_rate):
-        rand_parents.append(seed_red)
-    for i in range(blue_rate):
-        rand_parents.append(seed_blue)
-    
+    timer = PhaseTimer()
+    service = shared_service()
+    session = current_session()
+    status = st.empty()
+    worker_timers = []
+    if replay_path is not None:
+        # the exported generations are memory mapped instead of cached, pyarrow
+        # is only imported to replay them
+        from evosim.columnar import read_metadata, read_trajectory
+
+        metadata = read_metadata(replay_path)
+        st.caption("Replaying %s." %os.path.basename(replay_path))
+        number_of_parents = metadata["number_of_parents"]
+        number_of_offsprings = metadata["number_of_offsprings"]
+        red_parents, random_seed = metadata["red_parents"], metadata["random_seed"]
+        number_of_generations = metadata["max_generations"]
+        recorder = make_recorder("summary")
+        key = ("replay", replay_path, os.path.getmtime(replay_path))
+        run = read_trajectory(replay_path)
+        trajectory = run
+        generations = number_of_generations
+    else:
+        parameters = dict(
+            number_of_parents=number_of_parents, 
+            number_of_offsprings=number_of_offsprings, 
+            red_parents=red_rate, 
+            random_seed=random_seed)
+        sim = GeneticDriftSim(timer=timer, **parameters)
+        red_parents = sim.red_parents
+        if recording_level == "columnar":
+            recorder = make_recorder(
+                recording_level, path=new_export_path("genetic-drift-", export_directory(session)), 
+                metadata=dict(parameters, simulation="genetic-drift", max_generations=number_of_generations))
+        else:
+            recorder = make_recorder(recording_level)
+        keep_recorder(recorder)
+        base_key = trajectory_key(sim, number_of_generations)
+        max_generations = number_of_generations
+        # a continued run is keyed by the run it continues and its amount of generations
+        key = st.session_state.setdefault("continued", {}).get(base_key, base_key)
+        previous = checkpoint_cache().get(key[:-2]) if key != base_key else None
+        checkpoint = None
+        if previous is None:
+            key = base_key
+        else:
+            checkpoint = previous.latest
+            red_parents = checkpoint.state["red_parents"]
+            max_generations = checkpoint.generation + key[-1]
+            st.caption("Continued from generation %s, only the new generations are shown." 
+                %checkpoint.generation)
+        generations = max_generations - (checkpoint.generation if checkpoint is not None else 0)
+        every = checkpoint_interval(number_of_generations)
+        done = partial(keep_checkpoints, key, previous)
+        job_key, function = key, simulate
+        arguments = (GeneticDriftSim, parameters, (max_generations,), every, checkpoint)
+        if show_performance:
+            # measured in the worker, its timer is merged with the one of the page
+            job_key, function, arguments, done = measured_job(key, arguments, done, profile_run, worker_timers)
+        run = service.stream(
+            session, job_key, 
+            estimate_seconds(GeneticDriftSim, parameters, generations, memory=show_performance), 
+            function, arguments, 
+            progress_callback(service, status, generations, "Generation %s"), 
+            done)
+        # without checkpoints the run is computed again, to seek and continue it
+        replay = not show_performance and key in checkpoint_cache()
+        trajectory = trajectory_cache().trajectory(key, run, replay=replay)
+    records = decimate(
+        recorder.record(trajectory),
+        frame_step(generations),
+        fixation(number_of_parents))
+
     # Visualization     
-    fig, (axl, axr) = plt.subplots(
-    ncols=2,
-    sharey=False,
-    gridspec_kw=dict(width_ratios=[5, 1], wspace=0.5),
-    )      
-    axl.yaxis.set_visible(False)
-    axl.xaxis.set_visible(False)
-    X = np.random.uniform(0,1,(number_of_parents))
-    Y = np.random.uniform(0,1,(number_of_parents))
-    scat = axl.scatter(X,Y, c=rand_parents)
-    text_1 = 'Generation: %s' %generation
-    axl.title.set_text(text_1)
-    axl.axis('off')
-
-    pops = ['red', 'blue']
-    counts = [red_rate, blue_rate]
-    bar_labels = ['red', 'blue']
-    bar_colors = ['tab:red', 'tab:blue']
-
-    bar_pop = axr.bar(pops, counts, label=bar_labels, color=bar_colors)
-    axr.set_ylabel('Population distribution')
-    axr.set_ylim([0, number_of_parents*number_of_offsprings])
-    axr.spines[['right', 'top']].set_visible(False)
-
-    generation += 1
-
-    def gen():
-        '''Generates frames as long as simulation has not ended.
-
-        Args:
-            None
-
-        Returns: 
-            None
-        '''
-        global carry_on
-        i = 0
-        while carry_on:
-            i += 1
-            yield i
-        
-    def update(frame_number):
-        '''Updates computations and plots for every generation
-
-        Args:
-            frame_number: frame number.
-
-        Returns:
-            scat: updated scatter plot.
-            bar_pop: updated bar plot.
-        '''
-        global generation, carry_on, rand_parents
-
-        offspring = []
-        for parent in rand_parents:
-            offspring.extend(generate_offspring(parent, number_of_offsprings))
-
-        red_rate = offspring.count(seed_red)
-        blue_rate = offspring.count(seed_blue)
-        rand_parents = random.sample(offspring, number_of_parents)
-
-        # Visualization           
-        X = np.random.uniform(0,1,(number_of_offsprings*number_of_parents))
-        Y = np.random.uniform(0,1,(number_of_offsprings*number_of_parents))
-        scat.set_offsets(np.c_[X, Y])
-        scat.set_facecolors(rand_parents)
-        text_1 = 'Generation: %s' %generation
-        axl.title.set_text(text_1)
-        axl.axis('off')
-
-        pops = ['red', 'blue']
-        counts = [red_rate, blue_rate]
-        bar_labels = ['red', 'blue']
-        bar_colors = ['tab:red', 'tab:blue']
-        for i in range(len(bar_pop)):
-            bar_pop[i].set_height(counts[i])
-
-        all_offspring.append(offspring)
-
-        if generation >= number_of_generations or len(set(offspring)) == 1:
-            carry_on = False
-            print("\nStopping at generation %s!" %generation)
-
-        generation += 1        
-
-        return scat, bar_pop,
-
-    rcParams['animation.embed_limit'] = 2**128
-    with st.spinner(text="Preparing simulation..."):
-        ani = FuncAnimation(fig, update, 
-                    frames=gen, save_count=None, interval=100, repeat=False) 
-        animjs = ani.to_jshtml()
-        click_on_play = """document.querySelector('.anim-buttons button[title="Play"]').click();"""
-        pattern = re.compile(r"(setTimeout.*?;)(.*?})", re.MULTILINE | re.DOTALL)
-        new_animjs = pattern.sub(rf"\1 \n {click_on_play} \2", animjs)
-
-    st.components.v1.html(new_animjs,height=600)
-
-st.set_page_config(page_title="Genetic Drift", page_icon=':earth_americas:')
-st.markdown(add_footer, unsafe_allow_html=True)
+    try:
+        with closing(run), timer.measure(memory=show_performance, profile=profile_run):
+            if render_mode == "Vector player":
+                with st.spinner(text="Preparing simulation..."), timer.phase("encode", per_generation=False):
+                    player = genetic_drift_player(
+                        records, red_parents, number_of_parents, number_of_offsprings, random_seed)
+                st.components.v1.html(player, height=540)
+            elif render_mode == "Animation player" and not show_performance:
+                from evosim.render import render_animation
+
+                frames = list(records)
+                points = min(MAX_POINTS, number_of_parents*number_of_offsprings)
+                with st.spinner(text="Preparing simulation..."):
+                    new_animjs = service.call(
+                        session, ("animation",) + key, 
+                        estimate_render_seconds(len(frames) + 1, points), 
+                        render_animation, 
+                        ("genetic-drift", (red_parents, number_of_parents, number_of_offsprings), 
+                         random_seed, frames), 
+                        progress_callback(
+                            service, status, len(frames), "Drawing frame %%s of %s" %len(frames)))
+                st.components.v1.html(new_animjs,height=600)
+            else:
+                import matplotlib.pyplot as plt
+                from evosim.render import animation_html, genetic_drift_figure, stream_frames
+
+                fig, update = genetic_drift_figure(
+                    red_parents, number_of_parents, number_of_offsprings, np.random.default_rng(random_seed))
+
+                if render_mode == "Streaming":
+                    stream_frames(fig, update, records, st.empty(), timer=timer)
+                else:
+                    with st.spinner(text="Preparing simulation..."):
+                        new_animjs = animation_html(fig, update, records, timer=timer)
+                    st.components.v1.html(new_animjs,height=600)
+                plt.close(fig)
+    except ServiceBusy as busy:
+        st.warning(str(busy))
+        st.stop()
+    status.empty()
+    if show_performance:
+        for worker_timer in worker_timers:
+            timer.merge(worker_timer)
+        performance_panel(timer)
+
+    with st.expander("Recorded data"):
+        st.line_chart(recorder.summaries, x="generation", y="red_frequency")
+        if recorder.level == "full":
+            st.caption("All generations were written to %s" %recorder.path)
+        elif recorder.level == "columnar":
+            st.caption("All generations were exported to %s, replay them from the sidebar" %recorder.path)
+
+    checkpoints = checkpoint_cache().get(key) if replay_path is None else None
+    if checkpoints is not None:
+        last = recorder.summaries[-1]
+        with st.expander("Seek and continue"):
+            label_seek_generation = "Generation"
+            help_seek_generation = "Any generation of the run, computed from the nearest \
+                of the checkpoints kept every %s generations" %checkpoints.every
+            seek_generation = st.number_input(
+                label_seek_generation, 1, last["generation"], last["generation"], help=help_seek_generation)
+            if st.button("Show generation"):
+                try:
+                    with st.spinner(text="Computing generation %s..." %seek_generation):
+                        seek_record = service.call(
+                            session, ("seek", seek_generation) + key, 
+                            estimate_seconds(GeneticDriftSim, parameters, checkpoints.every), 
+                            seek, 
+                            (GeneticDriftSim, parameters, checkpoints.nearest(seek_generation), seek_generation))
+                except ServiceBusy as busy:
+                    st.warning(str(busy))
+                    st.stop()
+                import matplotlib.pyplot as plt
+                from evosim.render import genetic_drift_figure
+
+                fig, update = genetic_drift_figure(
+                    red_parents, number_of_parents, number_of_offsprings, np.random.default_rng(random_seed))
+                update(seek_record)
+                st.pyplot(fig)
+                plt.close(fig)
+
+            if 0 < last["red_frequency"] < 1:
+                label_more_generations = "More generations"
+                help_more_generations = "Continues the run from its last generation, \
+                    only the new generations are computed"
+                st.number_input(
+                    label_more_generations, 1, 5000, 100, 10, key="more_generations", help=help_more_generations)
+                st.button("Continue", on_click=continue_run, args=(base_key, key))
+
+page_setup("Genetic Drift")
 st.markdown("# Genetic Drift")
 st.sidebar.header("Parameters")
 st.sidebar.write("Change any of the following parameters to generate a new simulation")
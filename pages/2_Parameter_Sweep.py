@@ -0,0 +1,148 @@
+import streamlit as st
+
+from evosim import MAX_RANDOM_SEED, new_random_seed
+from evosim.app import page_setup
+from evosim.service import ServiceBusy, current_session, shared_service
+from evosim.sweep import parameter_grid, summarize_sweep, sweep
+
+
+def parse_values(text, convert):
+    '''Parsing a comma separated list of values.
+
+    Args:
+        text: comma separated values entered by the user.
+        convert: type of the values, such as int or float.
+
+    Returns:
+        values: sorted list of unique values, None if the text is invalid.
+    '''
+    try:
+        values = sorted({convert(value) for value in text.split(",") if value.strip()})
+    except ValueError:
+        return None
+    return values or None
+
+
+def parameter_sweep() -> None:
+    '''Main function for Parameter Sweep page
+
+    Args:
+        None
+
+    Returns:
+        None
+
+    '''
+    #Page setup
+    simulation = st.radio("Simulation", ["genetic-drift", "natural-selection"], horizontal=True,
+        format_func=lambda name: name.replace("-", " ").capitalize())
+
+    if simulation == "genetic-drift":
+        label_parents = "Amounts of parents (comma separated)"
+        help_parents = "Population sizes to sweep"
+        parents = parse_values(st.text_input(label_parents, "10, 50, 100", help=help_parents), int)
+
+        label_reds = "Initial amounts of red parents (comma separated)"
+        help_reds = "Initial red counts to sweep, combinations with more red items than parents are skipped"
+        reds = parse_values(st.text_input(label_reds, "1, 5, 10", help=help_reds), int)
+
+        label_number_of_offsprings = "Offsprings per parent"
+        number_of_offsprings = st.sidebar.slider(label_number_of_offsprings, 1, 1000, 5, 1)
+
+        if parents is None or reds is None or min(parents) < 1 or min(reds) < 0:
+            st.error("Please enter comma separated positive integers.")
+            st.stop()
+        combinations = [combination for combination in parameter_grid(
+            {"number_of_parents": parents, "red_parents": reds},
+            {"number_of_offsprings": number_of_offsprings})
+            if combination["red_parents"] <= combination["number_of_parents"]]
+    else:
+        label_rates_offspring = "Chances for mutation in an offspring (comma separated)"
+        rates_offspring = parse_values(st.text_input(label_rates_offspring, "0.05, 0.1, 0.2"), float)
+
+        label_rates_digit = "Chances for mutation in a digit (comma separated)"
+        rates_digit = parse_values(st.text_input(label_rates_digit, "0.1, 0.3"), float)
+
+        label_seed = "Seed"
+        seed = st.sidebar.text_input(label_seed, "555555")
+        label_target = "Target"
+        target = st.sidebar.text_input(label_target, "999999")
+        label_number_of_parents = "Number of parents"
+        number_of_parents = st.sidebar.slider(label_number_of_parents, 10, 1000, 200, 10)
+
+        if rates_offspring is None or rates_digit is None or not (
+                0 <= min(rates_offspring + rates_digit) and max(rates_offspring + rates_digit) <= 1):
+            st.error("Please enter comma separated chances between 0 and 1.")
+            st.stop()
+        if len(seed) != len(target) or not seed.isdigit() or not target.isdigit():
+            st.error("Seed and target must be numbers with the same amount of digits.")
+            st.stop()
+        combinations = parameter_grid(
+            {"mutation_rate_offspring": rates_offspring, "mutation_rate_digit": rates_digit},
+            {"seed": seed, "target": target, "number_of_parents": number_of_parents})
+
+    label_replicates = "Replicates"
+    help_replicates = "Amount of simulations for every combination of parameters"
+    replicates = st.sidebar.slider(label_replicates, 10, 10000, 200, 10, help=help_replicates)
+
+    label_number_of_generations = "Maximum generations"
+    number_of_generations = st.sidebar.slider(label_number_of_generations, 10, 5000, 1000, 10)
+
+    label_random_seed = "Random seed"
+    if "sweep_random_seed" not in st.session_state:
+        st.session_state.sweep_random_seed = new_random_seed()
+    random_seed = st.sidebar.number_input(
+        label_random_seed, 0, MAX_RANDOM_SEED, key="sweep_random_seed")
+
+    st.write("%s combinations x %s replicates = %s simulations" %(
+        len(combinations), replicates, len(combinations)*replicates))
+    if not combinations or not st.button("Run sweep"):
+        st.stop()
+
+    #Sweep
+    import pandas as pd
+
+    progress = st.progress(0.0, text="Running simulations...")
+    table = st.empty()
+    rows = []
+    total = len(combinations)*replicates
+    # the chunks are admitted like the other simulations, a few at a time
+    try:
+        for chunk in sweep(simulation, combinations, replicates, number_of_generations,
+                           random_seed, service=shared_service(), session=current_session()):
+            rows.extend(chunk)
+            progress.progress(len(rows)/total, text="%s of %s simulations done" %(len(rows), total))
+            table.dataframe(summarize_sweep(pd.DataFrame(rows), simulation), hide_index=True)
+    except ServiceBusy as busy:
+        st.warning(str(busy))
+        st.stop()
+    progress.empty()
+
+    # Visualization
+    results = pd.DataFrame(rows)
+    summary = summarize_sweep(results, simulation)
+    if simulation == "genetic-drift":
+        summary["red_frequency"] = summary["red_parents"] / summary["number_of_parents"]
+        st.subheader("Fixation probability of red")
+        st.line_chart(summary, x="red_frequency", y="red_fixation_probability", color="number_of_parents")
+        st.subheader("Mean time to fixation")
+        st.line_chart(summary, x="red_frequency", y="mean_fixation_time", color="number_of_parents")
+    else:
+        st.subheader("Mean generations to reach the target")
+        st.line_chart(summary, x="mutation_rate_offspring", y="mean_time_to_target",
+                      color="mutation_rate_digit")
+    st.download_button("Download all runs (CSV)", results.to_csv(index=False),
+                       file_name="sweep.csv", mime="text/csv")
+
+page_setup("Parameter Sweep")
+st.markdown("# Parameter Sweep")
+st.sidebar.header("Parameters")
+st.write(
+    """Instead of a single animation, this page runs every combination of the
+    selected parameters many times and shows how the outcome is distributed:
+    the fixation probability and time to fixation of genetic drift, or the amount
+    of generations natural selection needs to reach the target."""
+)
+
+
+parameter_sweep()
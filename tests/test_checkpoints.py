@@ -0,0 +1,84 @@
+'''Seeking to a generation from a checkpoint computes the same generation as a fresh run.'''
+
+import numpy as np
+import pytest
+
+from evosim.checkpoints import Checkpoints, checkpoint_interval
+from evosim.genetic_drift import GeneticDriftEnsemble, GeneticDriftSim
+from evosim.long_genome import LongGenomeSim
+from evosim.natural_selection import ClonalNaturalSelectionSim, NaturalSelectionSim
+
+GENERATIONS = 60
+
+SIMULATIONS = [
+    (NaturalSelectionSim, dict(seed="0000000000", target="9999999999", number_of_parents=50,
+                               average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                               mutation_rate_digit=0.2, random_seed=1)),
+    (ClonalNaturalSelectionSim, dict(seed="0000000000", target="9999999999", number_of_parents=50,
+                                     average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                                     mutation_rate_digit=0.2, random_seed=2)),
+    (LongGenomeSim, dict(seed="0" * 300, target="9" * 300, number_of_parents=50,
+                         average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                         mutation_rate_digit=0.02, random_seed=3)),
+    (GeneticDriftSim, dict(number_of_parents=1000, number_of_offsprings=5, random_seed=4)),
+    (GeneticDriftEnsemble, dict(number_of_parents=100, number_of_offsprings=5, replicates=200,
+                                random_seed=5)),
+]
+IDS = [simulation.__name__ for simulation, _ in SIMULATIONS]
+
+
+def same_record(first, second):
+    # the stop reason is set by run() on its last record, not by step()
+    first_summary, second_summary = first.summary(), second.summary()
+    first_summary.pop("stop_reason", None)
+    second_summary.pop("stop_reason", None)
+    assert first_summary == second_summary
+    for name in ("offspring", "scores", "counts"):
+        a, b = getattr(first, name, None), getattr(second, name, None)
+        assert (a is None) == (b is None)
+        if a is not None:
+            assert np.array_equal(a, b)
+
+
+def checkpointed_run(simulation, parameters, every):
+    sim = simulation(**parameters)
+    checkpoints = Checkpoints(every)
+    records = list(checkpoints.record(sim, sim.run(GENERATIONS)))
+    return records, checkpoints
+
+
+@pytest.mark.parametrize(("simulation", "parameters"), SIMULATIONS, ids=IDS)
+def test_seek_equals_fresh_run(simulation, parameters):
+    records, checkpoints = checkpointed_run(simulation, parameters, 10)
+    assert len(checkpoints) >= 2
+    # natural selection numbers its generations from 0, genetic drift from 1
+    for record in (records[0], records[9], records[10], records[23], records[-1]):
+        checkpoint = checkpoints.nearest(record.generation)
+        same_record(checkpoint.seek(simulation, parameters, record.generation), record)
+
+
+@pytest.mark.parametrize(("simulation", "parameters"), SIMULATIONS, ids=IDS)
+def test_continuing_from_the_last_checkpoint_equals_a_longer_run(simulation, parameters):
+    sim = simulation(**parameters)
+    longer = list(sim.run(GENERATIONS * 2))
+    records, checkpoints = checkpointed_run(simulation, parameters, 10)
+    continued = checkpoints.latest.restore(simulation, parameters)
+    # max_generations counts the generations of the whole run
+    records += list(continued.run(GENERATIONS * 2))
+    assert len(records) == len(longer)
+    for record, expected in zip(records, longer, strict=True):
+        same_record(record, expected)
+    assert records[-1].summary() == longer[-1].summary()
+
+
+def test_seek_after_the_end_of_a_run_returns_none():
+    simulation, parameters = SIMULATIONS[0]
+    parameters = dict(parameters, seed="99", target="99")
+    records, checkpoints = checkpointed_run(simulation, parameters, 10)
+    assert len(records) == 1
+    assert checkpoints.nearest(5).seek(simulation, parameters, 5) is None
+
+
+def test_checkpoint_interval_bounds_the_checkpoints():
+    assert checkpoint_interval(5000) * 20 >= 5000
+    assert checkpoint_interval(50) == 10
@@ -0,0 +1,141 @@
+'''Exporting trajectories to Arrow and Parquet files and replaying them.'''
+
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from evosim.columnar import ColumnarRecorder, ExportedGeneration, read_metadata, read_trajectory
+from evosim.exports import MAX_EXPORT_SECONDS, export_directory, exported_runs, new_export_path, prune_exports
+from evosim.genetic_drift import GeneticDriftGeneration, GeneticDriftSim
+from evosim.long_genome import LongGenomeSim
+from evosim.natural_selection import ClonalNaturalSelectionSim, NaturalSelectionGeneration, NaturalSelectionSim
+
+GENERATIONS = 40
+
+SIMULATIONS = [
+    (NaturalSelectionSim, dict(seed="0000000000", target="9999999999", number_of_parents=50,
+                               average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                               mutation_rate_digit=0.2, random_seed=1)),
+    (ClonalNaturalSelectionSim, dict(seed="0000000000", target="9999999999", number_of_parents=50,
+                                     average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                                     mutation_rate_digit=0.2, random_seed=2)),
+    (LongGenomeSim, dict(seed="0" * 300, target="9" * 300, number_of_parents=50,
+                         average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                         mutation_rate_digit=0.02, random_seed=3)),
+    (GeneticDriftSim, dict(number_of_parents=1000, number_of_offsprings=5, random_seed=4)),
+]
+IDS = [simulation.__name__ for simulation, _ in SIMULATIONS]
+
+
+def export(simulation, parameters, path, genomes, batch_generations=7):
+    '''Exporting a run in small batches, returning its records.'''
+    recorder = ColumnarRecorder(str(path), genomes=genomes, batch_generations=batch_generations,
+                                metadata=dict(parameters, simulation=simulation.__name__))
+    return list(recorder.record(simulation(**parameters).run(GENERATIONS)))
+
+
+@pytest.mark.parametrize("suffix", [".arrow", ".parquet"])
+@pytest.mark.parametrize("genomes", [False, True])
+@pytest.mark.parametrize(("simulation", "parameters"), SIMULATIONS, ids=IDS)
+def test_replay_equals_the_exported_run(simulation, parameters, genomes, suffix, tmp_path):
+    path = tmp_path / ("run" + suffix)
+    records = export(simulation, parameters, path, genomes)
+    replayed = list(read_trajectory(str(path)))
+    assert len(replayed) == len(records)
+    for record, replay in zip(records, replayed, strict=True):
+        assert replay.summary() == record.summary()
+        if isinstance(record, GeneticDriftGeneration):
+            assert isinstance(replay, GeneticDriftGeneration)
+            continue
+        assert np.array_equal(replay.scores, record.scores)
+        if record.counts is None:
+            # one offspring per genotype, explicit once the genomes are dropped
+            assert replay.counts is None or np.all(replay.counts == 1)
+        else:
+            assert np.array_equal(replay.counts, record.counts)
+        if genomes and record.offspring is not None:
+            assert isinstance(replay, NaturalSelectionGeneration)
+            assert np.array_equal(replay.offspring, record.offspring)
+        else:
+            assert isinstance(replay, ExportedGeneration)
+
+
+@pytest.mark.parametrize("suffix", [".arrow", ".parquet"])
+def test_metadata_is_kept_with_the_file(suffix, tmp_path):
+    simulation, parameters = SIMULATIONS[0]
+    path = tmp_path / ("run" + suffix)
+    export(simulation, parameters, path, genomes=True)
+    metadata = read_metadata(str(path))
+    assert metadata["simulation"] == simulation.__name__
+    assert metadata["random_seed"] == parameters["random_seed"]
+    assert metadata["record"] == NaturalSelectionGeneration.__name__
+    assert metadata["genome_digits"] == len(parameters["seed"])
+
+
+def test_batches_split_by_size(tmp_path):
+    simulation, parameters = SIMULATIONS[0]
+    path = tmp_path / "run.arrow"
+    recorder = ColumnarRecorder(str(path), genomes=True, batch_bytes=1)
+    records = list(recorder.record(simulation(**parameters).run(GENERATIONS)))
+    # every generation is its own batch once the buffer is over batch_bytes
+    assert recorder.generations == len(records)
+    assert [replay.generation for replay in read_trajectory(str(path))] == \
+        [record.generation for record in records]
+
+
+def test_unknown_export_format_raises(tmp_path):
+    with pytest.raises(ValueError):
+        ColumnarRecorder(str(tmp_path / "run.csv"))
+
+
+def test_exported_runs_are_listed_newest_first(tmp_path):
+    simulation, parameters = SIMULATIONS[3]
+    paths = []
+    for _ in range(3):
+        path = new_export_path("drift-", str(tmp_path))
+        assert path not in exported_runs(directory=str(tmp_path))
+        export(simulation, parameters, path, genomes=False)
+        paths.append(path)
+        # the listing is cached, and invalidated once the export is complete
+        assert exported_runs(directory=str(tmp_path))[0] == path
+    assert sorted(exported_runs(simulation.__name__, str(tmp_path))) == sorted(paths)
+    assert exported_runs("natural-selection", str(tmp_path)) == []
+
+
+def test_prune_exports_keeps_the_newest_runs(tmp_path):
+    simulation, parameters = SIMULATIONS[3]
+    paths = []
+    for age in (5, 4, 3, 2, 1):
+        path = new_export_path("drift-", str(tmp_path))
+        export(simulation, parameters, path, genomes=False)
+        modified = time.time() - age * 3600
+        os.utime(path, (modified, modified))
+        paths.append(path)
+    prune_exports(str(tmp_path), keep=3, max_seconds=2.5 * 3600)
+    assert exported_runs(directory=str(tmp_path)) == paths[:2:-1]
+    prune_exports(str(tmp_path), keep=1)
+    assert exported_runs(directory=str(tmp_path)) == paths[-1:]
+
+
+def test_sessions_export_to_their_own_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("EVOSIM_EXPORT_DIR", str(tmp_path))
+    first, second = export_directory("first"), export_directory("second")
+    assert first != second and os.path.dirname(first) == str(tmp_path)
+    # the directories of sessions which ended are deleted after a while
+    modified = time.time() - 2 * MAX_EXPORT_SECONDS
+    os.utime(first, (modified, modified))
+    export_directory("third")
+    assert not os.path.exists(first) and os.path.exists(second)
+
+
+def test_listing_a_new_session_does_not_import_pyarrow(tmp_path):
+    script = ("import sys; from evosim.exports import export_directory, exported_runs; "
+              "assert exported_runs('natural-selection', export_directory('new')) == []; "
+              "assert 'pyarrow' not in sys.modules")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True,
+                   env=dict(os.environ, EVOSIM_EXPORT_DIR=str(tmp_path)))
@@ -0,0 +1,64 @@
+'''Measuring runs with a PhaseTimer.'''
+
+import threading
+import tracemalloc
+
+from evosim.instrumentation import PhaseTimer
+
+
+def test_overlapping_measurements_share_the_tracing():
+    first, second = PhaseTimer(), PhaseTimer()
+    started, second_started, first_done = threading.Event(), threading.Event(), threading.Event()
+    tracing = []
+
+    def measure_first():
+        with first.measure(memory=True):
+            started.set()
+            with first.phase("allocate"):
+                bytearray(2**20)
+            second_started.wait()
+        first_done.set()
+
+    def measure_second():
+        started.wait()
+        with second.measure(memory=True):
+            second_started.set()
+            first_done.wait()
+            # the first measurement ended, tracemalloc still traces for this one
+            tracing.append(tracemalloc.is_tracing())
+            with second.phase("allocate"):
+                bytearray(4 * 2**20)
+
+    threads = [threading.Thread(target=measure_first), threading.Thread(target=measure_second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tracing == [True]
+    assert not tracemalloc.is_tracing()
+    assert first.memory_overlapped and second.memory_overlapped
+    assert second.peak_bytes["allocate"] >= 4 * 2**20
+    assert second.run_peak_bytes >= 0
+
+
+def test_a_single_measurement_is_exact():
+    timer = PhaseTimer()
+    with timer.measure(memory=True):
+        with timer.phase("allocate"):
+            bytearray(2**20)
+    assert not timer.memory_overlapped
+    assert timer.peak_bytes["allocate"] >= 2**20
+    assert not tracemalloc.is_tracing()
+
+
+def test_merge_adds_the_timings_of_a_worker():
+    page, worker = PhaseTimer(), PhaseTimer()
+    for timer, name in ((page, "draw"), (worker, "mutate")):
+        timer.generation = 0
+        with timer.phase(name):
+            pass
+        timer.count("offsprings")
+    page.merge(worker)
+    assert set(page.seconds) == {"draw", "mutate"}
+    assert page.counters["offsprings"] == 2
+    assert set(page.generation_rows()[0]) == {"generation", "draw_seconds", "mutate_seconds", "offsprings"}
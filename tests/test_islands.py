@@ -0,0 +1,56 @@
+'''Natural selection on islands connected by migration.'''
+
+import numpy as np
+import pytest
+
+from evosim.islands import IslandNaturalSelectionSim, migrate, migration_routes
+
+GENERATIONS = 25
+PARAMETERS = dict(seed="0000000000", target="9999999999", number_of_parents=50,
+                  average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                  mutation_rate_digit=0.2, islands=4, migration_interval=5, migrants=3,
+                  random_seed=1)
+
+
+def summaries(workers, **parameters):
+    sim = IslandNaturalSelectionSim(workers=workers, **dict(PARAMETERS, **parameters))
+    return [record.summary() for record in sim.run(GENERATIONS)]
+
+
+@pytest.mark.parametrize("topology", ["ring", "fully connected"])
+def test_workers_do_not_change_the_run(topology):
+    single = summaries(1, topology=topology)
+    assert len(single) == GENERATIONS
+    assert single == summaries(2, topology=topology)
+    assert single == summaries(3, topology=topology)
+
+
+def test_seeds_change_the_run():
+    assert summaries(1, random_seed=1) != summaries(1, random_seed=2)
+
+
+def test_migrations_are_recorded_at_the_interval():
+    records = summaries(1)
+    migrated = [summary["generation"] for summary in records if summary["migrants"]]
+    assert migrated == [4, 9, 14, 19, 24]
+    assert all(summary["migrants"] == 4 * 3 for summary in records if summary["migrants"])
+
+
+def test_ring_sends_the_migrants_to_the_next_island():
+    routes = migration_routes("ring", 3, 2, np.random.default_rng(0))
+    assert routes.tolist() == [[1, 1], [2, 2], [0, 0]]
+    emigrants = [np.full((2, 4), island, dtype=np.int8) for island in range(3)]
+    immigrants = migrate(emigrants, routes)
+    assert [genomes[:, 0].tolist() for genomes in immigrants] == [[2, 2], [0, 0], [1, 1]]
+
+
+def test_fully_connected_never_sends_migrants_home():
+    routes = migration_routes("fully connected", 5, 100, np.random.default_rng(1))
+    assert np.all(routes != np.arange(5)[:, None])
+
+
+def test_a_finished_run_cannot_be_continued():
+    sim = IslandNaturalSelectionSim(workers=1, **PARAMETERS)
+    list(sim.run(5))
+    with pytest.raises(RuntimeError):
+        list(sim.run(10))
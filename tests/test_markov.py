@@ -0,0 +1,42 @@
+'''Expected trajectory of an infinite natural selection population.'''
+
+import time
+
+import pytest
+
+from evosim.markov import ExpectedNaturalSelection, expected_time_to_target
+
+PARAMETERS = dict(average_number_of_offsprings=1.2, number_of_parents=200,
+                  mutation_rate_offspring=0.05, mutation_rate_digit=0.1)
+
+
+@pytest.mark.parametrize("digits", [5, 20])
+@pytest.mark.parametrize("rates", [dict(mutation_rate_offspring=0), dict(mutation_rate_digit_up=0)])
+def test_unreachable_target_returns_quickly(digits, rates):
+    model = ExpectedNaturalSelection("0" * digits, "9" * digits, **dict(PARAMETERS, **rates))
+    start = time.perf_counter()
+    records = list(model.run(5000))
+    assert time.perf_counter() - start < 1
+    # stops once the distances are stationary, long before max_generations
+    assert model.stationary and len(records) < 100
+    assert expected_time_to_target(records) is None
+
+
+@pytest.mark.parametrize("digits", [5, 20])
+def test_reachable_target_is_reached(digits):
+    model = ExpectedNaturalSelection("0" * digits, "9" * digits, **PARAMETERS)
+    records = list(model.run(5000))
+    assert records[-1].target_probability > 1 - 1e-3
+    assert expected_time_to_target(records) is not None
+
+
+def test_alternating_distances_keep_reaching_the_target():
+    # every digit mutates by one, distances alternate between odd and even
+    model = ExpectedNaturalSelection("55555", "55555", average_number_of_offsprings=1.2,
+                                     number_of_parents=1, mutation_rate_offspring=1.0,
+                                     mutation_rate_digit=1.0)
+    start = time.perf_counter()
+    records = list(model.run(5000))
+    assert time.perf_counter() - start < 1
+    assert model.stationary and len(model.cycle) == 2
+    assert records[-1].target_probability > 1 - 1e-3
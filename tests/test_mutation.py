@@ -0,0 +1,135 @@
+'''Statistical equivalence of the vectorized mutation with the original loop.'''
+
+import random
+
+import numpy as np
+import pytest
+
+from evosim.natural_selection import genomes_from_codes, genomes_to_codes, mutate_digits, mutate_genomes
+
+RATES = dict(
+    mutation_rate_offspring=0.5,
+    mutation_rate_digit=0.3,
+    mutation_rate_digit_up=0.6,
+    mutation_rate_digit_up_plus=0.7,
+    mutation_rate_digit_down_minus=0.4,
+)
+DRAWS = 20000
+
+
+def reference_offspring(seed, mutation_rate_offspring,
+                        mutation_rate_digit, mutation_rate_digit_up,
+                        mutation_rate_digit_up_plus,
+                        mutation_rate_digit_down_minus, number_of_offsprings, rng):
+    '''The original digit by digit loop of the Natural Selection page, with a
+    seeded random.Random instead of the global random module.
+    '''
+    offspring = []
+    for _ in range(number_of_offsprings):
+        rand_offspring = rng.random()
+        if rand_offspring < mutation_rate_offspring:
+            mutated = []
+            for digit in seed:
+                rand_digit = rng.random()
+                if rand_digit < mutation_rate_digit:
+                    if digit == '9':
+                        new_digit = '8'
+                    elif digit == '0':
+                        new_digit = '1'
+                    else:
+                        rand_direction = rng.random()
+                        new_digit = int(digit)
+                        if rand_direction < mutation_rate_digit_up:
+                            if digit == '8':
+                                new_digit = new_digit + 1
+                            else:
+                                rand_jump = rng.random()
+                                if rand_jump < mutation_rate_digit_up_plus:
+                                    new_digit = new_digit + 1
+                                else:
+                                    new_digit = new_digit + 2
+                        else:
+                            if digit == '1':
+                                new_digit = new_digit - 1
+                            else:
+                                rand_jump = rng.random()
+                                if rand_jump < mutation_rate_digit_down_minus:
+                                    new_digit = new_digit - 1
+                                else:
+                                    new_digit = new_digit - 2
+                    mutated.append(str(new_digit))
+                else:
+                    mutated.append(digit)
+            offspring.append("".join(mutated))
+        else:
+            offspring.append(seed)
+    return offspring
+
+
+def transition_frequencies(parents, children):
+    '''Frequency of every (parent digit, child digit) pair, per parent digit.'''
+    counts = np.zeros((10, 10))
+    np.add.at(counts, (parents.ravel(), children.ravel()), 1)
+    return counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+
+
+def assert_close(observed, expected, draws):
+    # four standard deviations of a frequency estimated from draws samples
+    tolerance = 4 * np.sqrt(np.maximum(expected * (1 - expected), 1e-4) / draws)
+    assert np.all(np.abs(observed - expected) <= tolerance), (observed, expected)
+
+
+@pytest.mark.parametrize("seed", ["0123456789", "0099118899"])
+def test_mutate_genomes_matches_reference_loop(seed):
+    reference = genomes_from_codes(reference_offspring(seed, **RATES, number_of_offsprings=DRAWS,
+                                                       rng=random.Random(1)))
+    parents = np.repeat(genomes_from_codes([seed]), DRAWS, axis=0)
+    vectorized = mutate_genomes(parents, *RATES.values(), np.random.default_rng(1))
+
+    # share of offsprings and of digits which changed
+    for children in (reference, vectorized):
+        assert children.dtype == np.int8
+        assert children.min() >= 0 and children.max() <= 9
+    assert_close(np.mean((vectorized != parents).any(axis=1)),
+                 np.mean((reference != parents).any(axis=1)), DRAWS)
+    assert_close(np.mean(vectorized != parents, axis=0), np.mean(reference != parents, axis=0), DRAWS)
+
+    # every digit moves to the same digits with the same frequencies
+    digits = sorted(set(seed))
+    rows = [int(digit) for digit in digits]
+    assert_close(transition_frequencies(parents, vectorized)[rows],
+                 transition_frequencies(parents, reference)[rows], DRAWS)
+
+
+def test_mutate_digits_clamps_at_0_and_9():
+    rng = np.random.default_rng(2)
+    digits = np.repeat(np.arange(10, dtype=np.int8), DRAWS)
+    # always up by two, or always down by two, the edges must still stay in 0-9
+    up = mutate_digits(digits, 1.0, 0.0, 1.0, rng)
+    down = mutate_digits(digits, 0.0, 1.0, 0.0, rng)
+    for mutated in (up, down):
+        assert mutated[digits == 9].tolist() == [8] * DRAWS
+        assert mutated[digits == 0].tolist() == [1] * DRAWS
+        assert mutated.min() >= 0 and mutated.max() <= 9
+    assert np.all(up[digits == 8] == 9)
+    assert np.all(down[digits == 1] == 0)
+    assert np.all(up[(digits >= 1) & (digits <= 7)] == digits[(digits >= 1) & (digits <= 7)] + 2)
+    assert np.all(down[(digits >= 2) & (digits <= 8)] == digits[(digits >= 2) & (digits <= 8)] - 2)
+
+
+def test_mutate_digits_matches_reference_transitions():
+    rates = (RATES["mutation_rate_digit_up"], RATES["mutation_rate_digit_up_plus"],
+             RATES["mutation_rate_digit_down_minus"])
+    digits = np.repeat(np.arange(10, dtype=np.int8), DRAWS)
+    vectorized = mutate_digits(digits, *rates, np.random.default_rng(3))
+    # every digit of the reference mutates, with a single digit code
+    rng = random.Random(3)
+    reference = np.array([int(reference_offspring(str(digit), 1.0, 1.0, *rates, 1, rng)[0])
+                          for digit in digits], dtype=np.int8)
+    assert_close(transition_frequencies(digits, vectorized), transition_frequencies(digits, reference), DRAWS)
+
+
+def test_unmutated_offsprings_are_copies():
+    parents = genomes_from_codes(["5555555555"] * 100)
+    unchanged = mutate_genomes(parents, 0.0, 1.0, 0.5, 0.5, 0.5, np.random.default_rng(4))
+    assert genomes_to_codes(unchanged) == genomes_to_codes(parents)
@@ -0,0 +1,69 @@
+'''Natural selection of a single population on several worker processes.'''
+
+import numpy as np
+import pytest
+
+from evosim.parallel import ParallelNaturalSelectionSim, selection_layout
+
+GENERATIONS = 15
+PARAMETERS = dict(seed="0000000000", target="9999999999", number_of_parents=400,
+                  average_number_of_offsprings=1.5, mutation_rate_offspring=0.5,
+                  mutation_rate_digit=0.2, random_seed=1, chunks=4)
+
+
+def run(workers, **parameters):
+    sim = ParallelNaturalSelectionSim(workers=workers, **dict(PARAMETERS, **parameters))
+    records = list(sim.run(GENERATIONS))
+    return sim, records
+
+
+@pytest.mark.parametrize("selection", ["truncation", "tournament"])
+def test_workers_do_not_change_the_run(selection):
+    single, single_records = run(1, selection=selection)
+    several, several_records = run(2, selection=selection)
+    assert len(single_records) == len(several_records) == GENERATIONS
+    for first, second in zip(single_records, several_records, strict=True):
+        assert first.summary() == second.summary()
+        assert np.array_equal(first.scores, second.scores)
+    assert np.array_equal(single.parents, several.parents)
+
+
+def test_chunks_change_the_run():
+    _, four = run(1)
+    _, eight = run(1, chunks=8)
+    assert [record.summary() for record in four] != [record.summary() for record in eight]
+
+
+def test_seeded_runs_are_reproducible():
+    _, first = run(1, random_seed=5)
+    _, second = run(1, random_seed=5)
+    assert [record.summary() for record in first] == [record.summary() for record in second]
+
+
+def test_selection_layout_keeps_the_closest_offsprings():
+    rng = np.random.default_rng(2)
+    histograms = rng.integers(0, 20, (4, 30))
+    kept, starts = selection_layout(histograms, 150, rng)
+    assert kept.sum() == 150
+    threshold = kept.shape[1] - 1
+    # every offspring closer than the threshold is kept, ties are drawn
+    assert np.array_equal(kept[:, :threshold], histograms[:, :threshold])
+    assert np.all(kept[:, threshold] <= histograms[:, threshold])
+    # parents are ordered by distance, then by chunk
+    order = np.argsort(starts.T.ravel(), kind="stable")
+    assert np.array_equal(order, np.arange(starts.size))
+
+
+def test_workers_are_stopped_after_a_run():
+    sim, _ = run(2)
+    assert sim._executor is None
+    assert not sim._memories
+
+
+def test_records_keep_the_distances_without_the_genomes():
+    _, records = run(2)
+    for record in records:
+        assert record.offspring is None
+        assert np.all(np.diff(record.scores) > 0)
+        assert record.counts.sum() == record.summary()["offsprings"]
+        assert record.scores[0] == record.best_score
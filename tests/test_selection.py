@@ -0,0 +1,126 @@
+'''Selection strategies of natural selection.'''
+
+import numpy as np
+import pytest
+
+from evosim.natural_selection import (
+    SELECTION_STRATEGIES,
+    ClonalNaturalSelectionSim,
+    NaturalSelectionSim,
+    elitism_selection,
+    fitness_proportional_selection,
+    select_best,
+    select_parents,
+    tournament_selection,
+    truncation_selection,
+)
+
+
+def random_scores(genotypes, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 50, genotypes)
+    counts = rng.integers(1, 5, genotypes)
+    return scores, counts
+
+
+@pytest.mark.parametrize("selection", list(SELECTION_STRATEGIES))
+@pytest.mark.parametrize("with_counts", [False, True])
+def test_selection_keeps_number_of_parents_ordered_from_the_closest(selection, with_counts):
+    scores, counts = random_scores(1000)
+    counts = counts if with_counts else None
+    selected, kept = select_parents(selection, scores, counts, 300, np.random.default_rng(1))
+    assert kept.sum() == 300
+    assert np.all(kept > 0)
+    assert len(np.unique(selected)) == len(selected)
+    assert np.all(np.diff(scores[selected]) >= 0)
+
+
+@pytest.mark.parametrize("selection", list(SELECTION_STRATEGIES))
+def test_selection_is_reproducible(selection):
+    scores, counts = random_scores(500)
+    first = select_parents(selection, scores, counts, 100, np.random.default_rng(7))
+    second = select_parents(selection, scores, counts, 100, np.random.default_rng(7))
+    for a, b in zip(first, second, strict=True):
+        assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize("selection", list(SELECTION_STRATEGIES))
+def test_selection_keeps_everybody_when_there_are_few_offsprings(selection):
+    scores, counts = random_scores(10)
+    _, kept = select_parents(selection, scores, counts, 1000, np.random.default_rng(2))
+    assert kept.sum() == counts.sum()
+
+
+def test_truncation_keeps_the_closest():
+    scores, _ = random_scores(1000)
+    selected, kept = truncation_selection(scores, None, 100, np.random.default_rng(3))
+    assert np.all(kept == 1)
+    assert np.array_equal(np.sort(scores[selected]), np.sort(scores)[:100])
+    assert np.array_equal(selected, select_best(scores, 100, np.random.default_rng(3)))
+
+
+@pytest.mark.parametrize("selection", ["truncation", "elitism"])
+def test_selection_without_replacement_keeps_at_most_the_counts(selection):
+    scores, counts = random_scores(1000)
+    selected, kept = select_parents(selection, scores, counts, 1500, np.random.default_rng(4))
+    assert np.all(kept <= counts[selected])
+
+
+def test_tournament_prefers_closer_offsprings():
+    scores = np.arange(1000)
+    rng = np.random.default_rng(5)
+    # one contestant is a uniform draw, larger tournaments keep closer winners
+    means = []
+    for size in (1, 2, 8):
+        selected, kept = tournament_selection(scores, None, 5000, rng, size)
+        means.append(np.average(scores[selected], weights=kept))
+    assert abs(means[0] - 499.5) < 20
+    assert means[0] > means[1] > means[2]
+    # the winner of size k tournaments over a uniform score has mean n / (k + 1)
+    assert abs(means[2] - 1000 / 9) < 10
+
+
+def test_tournament_counts_every_individual_of_a_genotype():
+    # with tournaments of one, genotypes are drawn in proportion to their individuals
+    scores = np.array([0, 10])
+    counts = np.array([900, 100])
+    _, kept = tournament_selection(scores, counts, 1000, np.random.default_rng(6), 1)
+    assert kept.sum() == 1000
+    assert abs(kept[0] / 1000 - 0.9) < 0.04
+
+
+def test_fitness_proportional_follows_the_fitness():
+    # fitness is max - score + 1: 3, 2 and 1
+    scores = np.array([0, 1, 2])
+    counts = np.array([10000, 10000, 10000])
+    selected, kept = fitness_proportional_selection(scores, counts, 6000, np.random.default_rng(8))
+    shares = dict(zip(selected.tolist(), (kept / 6000).tolist(), strict=True))
+    # stochastic universal sampling is within one parent of the expectation
+    for genotype, share in ((0, 3 / 6), (1, 2 / 6), (2, 1 / 6)):
+        assert abs(shares[genotype] * 6000 - share * 6000) <= 1
+
+
+def test_elitism_keeps_the_elite():
+    scores = np.arange(1000)
+    rng = np.random.default_rng(9)
+    selected, kept = elitism_selection(scores, None, 100, rng, elite_fraction=0.2)
+    assert set(range(20)) <= set(selected.tolist())
+    assert np.all(kept == 1)
+    # the others are drawn at random among all the other offsprings
+    assert scores[selected].max() > 200
+
+
+def test_unknown_selection_raises():
+    with pytest.raises(ValueError):
+        select_parents("roulette", np.arange(3), None, 1)
+    with pytest.raises(ValueError):
+        NaturalSelectionSim("555", "999", selection="roulette")
+
+
+@pytest.mark.parametrize("simulation", [NaturalSelectionSim, ClonalNaturalSelectionSim])
+@pytest.mark.parametrize("selection", list(SELECTION_STRATEGIES))
+def test_simulations_run_with_every_selection(simulation, selection):
+    sim = simulation("000000", "999999", 2.0, 100, 0.5, 0.3, random_seed=1, selection=selection)
+    records = list(sim.run(max_generations=50))
+    assert records
+    assert sim.best_score_ever < sim.initial_score